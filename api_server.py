@@ -0,0 +1,533 @@
+"""
+HTTP API for submitting work to PromptFlow from other programs.
+
+    python api_server.py [--host 127.0.0.1] [--port 8470]
+
+Endpoints (JSON in and out; send "Authorization: Bearer <key>" when
+PROMPTFLOW_API_KEY is set):
+
+    GET  /v1/health
+    GET  /v1/projects/{project}/workflows
+    GET  /v1/projects/{project}/documents
+    POST /v1/projects/{project}/documents   {"filename", "content_base64", "name"?, "description"?}
+                                            or the raw file with ?filename=...&name=...
+    POST /v1/projects/{project}/runs        {"workflows"?, "document_ids"?, "incremental"?, "policy"?,
+                                             "concurrency"?, "deadline_seconds"?, "wait"?}
+    GET  /v1/projects/{project}/executions  ?workflow=...&document_id=...&limit=...
+    GET  /v1/jobs/{job}
+    GET  /v1/jobs/{job}/events              progress as JSON lines, streamed until the job ends (?after=N)
+    GET  /v1/executions/{execution}
+
+Runs of up to PROMPTFLOW_API_SYNC_PAIRS pairs answer with the finished job;
+larger ones (or "wait": false) answer 202 with a job to poll or stream.
+Jobs are kept in memory (the last PROMPTFLOW_API_JOB_HISTORY) and every
+finished job is added to the batch run history.
+
+The API works on the same storage files as the UI; the files it writes
+(documents, executions and batch runs) are locked across processes, so
+running it standalone next to the UI is safe. The LLM scheduler, hedger and
+endpoint pool are per process, though: a standalone server gets its own.
+To share them with the UI, start the server inside the Streamlit app by
+setting PROMPTFLOW_API_PORT (the supported deployment). When
+PROMPTFLOW_TASK_QUEUE is set, runs are queued for the worker pool instead
+(`python promptflow.py worker`), and deadlines are not available.
+"""
+import argparse
+import base64
+import binascii
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from batch_estimator import SCHEDULING_POLICIES, BATCH_CONCURRENCY
+from metrics import start_metrics_server
+from worker_pool import TaskQueue, submit_batch, TASK_QUEUE_PATH
+
+# Port the Streamlit app also serves the API on (0 leaves it to api_server.py)
+API_PORT = int(os.environ.get("PROMPTFLOW_API_PORT", "0"))
+API_HOST = os.environ.get("PROMPTFLOW_API_HOST", "127.0.0.1")
+# Bearer token required on every request except /v1/health, when set
+API_KEY = os.environ.get("PROMPTFLOW_API_KEY", "")
+# Jobs run at the same time; further jobs wait their turn
+API_JOB_WORKERS = int(os.environ.get("PROMPTFLOW_API_JOB_WORKERS", "2"))
+# Runs with at most this many pairs are answered synchronously
+API_SYNC_PAIRS = int(os.environ.get("PROMPTFLOW_API_SYNC_PAIRS", "1"))
+API_JOB_HISTORY = int(os.environ.get("PROMPTFLOW_API_JOB_HISTORY", "200"))
+MAX_UPLOAD_BYTES = int(os.environ.get("PROMPTFLOW_API_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+
+# Seconds an events stream waits for progress before sending a keep-alive line
+EVENTS_KEEPALIVE_SECONDS = 15.0
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class ApiError(Exception):
+    """Request error reported to the client with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Job:
+    """A batch submitted through the API, with its progress events"""
+
+    def __init__(self, job_id: str, project_id: str, settings: Dict):
+        self.id = job_id
+        self.project_id = project_id
+        self.settings = settings
+        self.status = "queued"
+        self.created_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.finished_at = None
+        self.events = []
+        self.summary = None
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_event(self, event: Dict):
+        with self._condition:
+            self.events.append({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **event})
+            if event["event"] == "planned":
+                self.status = "running"
+            self._condition.notify_all()
+
+    def finish(self, status: str, summary: Optional[Dict] = None):
+        with self._condition:
+            self.status = status
+            self.summary = summary
+            self.finished_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._condition.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished; False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.finished, timeout)
+
+    def events_after(self, index: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """Events from index on, waiting up to timeout for one to arrive; also whether the job has finished"""
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.events) > index or self.finished, timeout)
+            return self.events[index:], self.finished
+
+    def describe(self) -> Dict:
+        with self._condition:
+            events = list(self.events)
+            status = self.status
+        planned = next((e for e in events if e["event"] == "planned"), None)
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "status": status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "settings": self.settings,
+            "total": planned["total"] if planned else None,
+            "completed": sum(e["event"] in ("completed", "failed") for e in events),
+            "executions": [{"document": e["document"], "workflow": e["workflow"], "execution_id": e["execution_id"]}
+                           for e in events if e["event"] == "completed"],
+            "errors": [f"{e['workflow']} on {e['document']}: {e['error']}" for e in events if e["event"] == "failed"],
+            "skipped": [{k: e[k] for k in ("document", "workflow", "reason")}
+                        for e in events if e["event"] == "skipped"],
+            "summary": self.summary
+        }
+
+
+class PromptFlowAPI:
+    """
+    The operations behind the HTTP endpoints, on the same storage files as
+    the UI. Raises ApiError for anything the client should be told about.
+    """
+
+    def __init__(self, job_workers: int = API_JOB_WORKERS, sync_pairs: int = API_SYNC_PAIRS):
+        # Imported here so importing the module (e.g. from main.py) stays cheap
+        from batch_runs import BatchRunManager
+        from execution_manager import ExecutionManager
+        from project_manager import ProjectManager
+        from prompt_manager import PromptManager
+        from source_manager import SourceDocumentManager
+        from template_manager import TemplateManager
+        from workflow_manager import WorkflowManager
+
+        self.project_manager = ProjectManager()
+        self.source_manager = SourceDocumentManager()
+        self.workflow_manager = WorkflowManager()
+        self.template_manager = TemplateManager()
+        self.prompt_manager = PromptManager()
+        self.execution_manager = ExecutionManager()
+        self.batch_runs = BatchRunManager()
+        self.sync_pairs = sync_pairs
+        self._gpt_handler = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, job_workers), thread_name_prefix="api-job")
+
+    def _gpt(self):
+        """The OpenAI client, created on first use so the API starts without credentials"""
+        with self._lock:
+            if self._gpt_handler is None:
+                from gpt_handler import GPTHandler
+                try:
+                    self._gpt_handler = GPTHandler()
+                except Exception as e:
+                    raise ApiError(503, f"Could not set up the OpenAI client: {e}")
+            return self._gpt_handler
+
+    def _project(self, project: str) -> Dict:
+        """Find a project by ID or name, picking up projects created since startup"""
+        self.project_manager.projects = self.project_manager.load_projects()
+        found = self.project_manager.get_project(project) or next(
+            (p for p in self.project_manager.get_projects() if p['name'] == project), None)
+        if not found:
+            raise ApiError(404, f"Project not found: {project}")
+        return found
+
+    def health(self) -> Dict:
+        from llm_scheduler import llm_scheduler
+        with self._lock:
+            active = sum(not job.finished for job in self._jobs.values())
+        return {"status": "ok", "active_jobs": active, "llm": llm_scheduler.stats()}
+
+    def list_workflows(self, project: str) -> Dict:
+        project_id = self._project(project)['id']
+        return {"workflows": self.workflow_manager.get_workflows(project_id)}
+
+    def list_documents(self, project: str) -> Dict:
+        project_id = self._project(project)['id']
+        return {"documents": self.source_manager.get_documents(project_id)}
+
+    def upload_document(self, project: str, filename: str, content: bytes, name: Optional[str] = None,
+                        description: str = "") -> Dict:
+        """Store a document sent by the client and extract its text"""
+        from ingest_service import LocalUploadedFile
+
+        project_id = self._project(project)['id']
+        if not filename:
+            raise ApiError(400, "A filename is required")
+        if not content:
+            raise ApiError(400, "The document is empty")
+        if len(content) > MAX_UPLOAD_BYTES:
+            raise ApiError(413, f"Documents are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        upload = LocalUploadedFile(name=os.path.basename(filename), content=content)
+        try:
+            document = self.source_manager.upload_document(
+                upload, name or os.path.splitext(upload.name)[0], description, project_id)
+        except Exception as e:
+            raise ApiError(400, f"Could not process {upload.name}: {e}")
+        return {"document": document}
+
+    def list_executions(self, project: str, workflow_name: Optional[str] = None,
+                        document_id: Optional[str] = None, limit: int = 50) -> Dict:
+        project_id = self._project(project)['id']
+        executions = self.execution_manager.get_executions(project_id=project_id, workflow_name=workflow_name,
+                                                           document_id=document_id)
+        return {"executions": executions[:limit], "total": len(executions)}
+
+    def get_execution(self, execution_id: str) -> Dict:
+        execution = self.execution_manager.get_execution(execution_id)
+        if not execution:
+            raise ApiError(404, f"Execution not found: {execution_id}")
+        return {"execution": execution}
+
+    def get_job(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if not job:
+            raise ApiError(404, f"Job not found: {job_id}")
+        return job
+
+    def submit_run(self, project: str, request: Dict) -> Tuple[int, Dict]:
+        """
+        Start a batch of workflows on documents
+
+        Args:
+            project: Project ID or name
+            request: "workflows" and "document_ids" (default all), "incremental",
+                     "policy", "concurrency", "deadline_seconds" and "wait"
+
+        Returns:
+            (HTTP status, body): 200 with the finished job for small runs,
+            202 with the queued job otherwise
+        """
+        from batch_runs import BatchRunManager
+        from promptflow import up_to_date_pairs
+
+        project_id = self._project(project)['id']
+
+        workflows = self.workflow_manager.get_workflows(project_id)
+        if request.get("workflows"):
+            unknown = set(request["workflows"]) - {w['name'] for w in workflows}
+            if unknown:
+                raise ApiError(400, f"Workflows not in project: {', '.join(sorted(unknown))}")
+            workflows = [w for w in workflows if w['name'] in request["workflows"]]
+
+        documents = self.source_manager.get_documents(project_id)
+        if request.get("document_ids"):
+            unknown = set(request["document_ids"]) - {d['id'] for d in documents}
+            if unknown:
+                raise ApiError(400, f"Documents not in project: {', '.join(sorted(unknown))}")
+            documents = [d for d in documents if d['id'] in request["document_ids"]]
+
+        if not documents or not workflows:
+            raise ApiError(400, "No documents or workflows to process")
+
+        policy = request.get("policy", "fifo")
+        if policy not in SCHEDULING_POLICIES:
+            raise ApiError(400, f"Unknown scheduling policy: {policy}. Choose from: {', '.join(SCHEDULING_POLICIES)}")
+        try:
+            concurrency = int(request.get("concurrency") or BATCH_CONCURRENCY)
+            deadline = request.get("deadline_seconds")
+            deadline = float(deadline) if deadline is not None else None
+        except (TypeError, ValueError):
+            raise ApiError(400, "concurrency and deadline_seconds must be numbers")
+        if TASK_QUEUE_PATH:
+            if deadline is not None:
+                raise ApiError(400, "deadline_seconds is not supported when runs go to the worker pool")
+            if not any(w['alive'] for w in TaskQueue(TASK_QUEUE_PATH).workers()):
+                raise ApiError(503, "No worker is connected to the task queue")
+
+        exclude = up_to_date_pairs(self.execution_manager, project_id, documents, workflows) \
+            if request.get("incremental") else None
+        gpt_handler = self._gpt()
+
+        settings = {"policy": policy, "concurrency": concurrency, "deadline_seconds": deadline,
+                    "incremental": bool(request.get("incremental")), "queue": TASK_QUEUE_PATH or None,
+                    "source": "api"}
+        job = Job(BatchRunManager.new_run_id(), project_id, settings)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > API_JOB_HISTORY:
+                oldest = next(iter(self._jobs))
+                if not self._jobs[oldest].finished:
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run_job, job, documents, workflows, gpt_handler, exclude)
+
+        pairs = len(documents) * len(workflows) - len(exclude or ())
+        if request.get("wait", pairs <= self.sync_pairs):
+            job.wait()
+            return 200, {"job": job.describe()}
+        return 202, {"job": job.describe(), "status_url": f"/v1/jobs/{job.id}",
+                     "events_url": f"/v1/jobs/{job.id}/events"}
+
+    def _run_job(self, job: Job, documents: List[Dict], workflows: List[Dict], gpt_handler, exclude):
+        """Worker: run a job's batch (here or on the worker pool) and record it in the run history"""
+        from batch_scheduler import BatchScheduler
+
+        scheduler = BatchScheduler(self.workflow_manager, self.template_manager, self.source_manager,
+                                   gpt_handler, self.prompt_manager, self.execution_manager)
+        summary = None
+        try:
+            if job.settings["queue"]:
+                queue = TaskQueue(job.settings["queue"])
+                batch_id, skipped = submit_batch(queue, scheduler, job.project_id, documents, workflows,
+                                                 policy=job.settings["policy"], exclude=exclude)
+                events = queue.follow(batch_id, skipped)
+            else:
+                events = scheduler.run(job.project_id, documents, workflows, policy=job.settings["policy"],
+                                       concurrency=job.settings["concurrency"],
+                                       deadline_seconds=job.settings["deadline_seconds"], exclude=exclude)
+            for event in events:
+                if event["event"] == "done":
+                    summary = event
+                job.add_event(event)
+            self.batch_runs.record_run(job.id, job.project_id, summary, job.settings)
+            job.finish("completed", summary)
+        except Exception as e:
+            print(f"Error running API job {job.id}: {e}")
+            job.add_event({"event": "error", "error": str(e)})
+            job.finish("failed", summary)
+
+
+def make_handler(api: PromptFlowAPI):
+    routes = [
+        ("GET", re.compile(r"^/v1/health$"), "health"),
+        ("GET", re.compile(r"^/v1/projects/([^/]+)/workflows$"), "workflows"),
+        ("GET", re.compile(r"^/v1/projects/([^/]+)/documents$"), "documents"),
+        ("POST", re.compile(r"^/v1/projects/([^/]+)/documents$"), "upload"),
+        ("POST", re.compile(r"^/v1/projects/([^/]+)/runs$"), "run"),
+        ("GET", re.compile(r"^/v1/projects/([^/]+)/executions$"), "executions"),
+        ("GET", re.compile(r"^/v1/jobs/([^/]+)$"), "job"),
+        ("GET", re.compile(r"^/v1/jobs/([^/]+)/events$"), "events"),
+        ("GET", re.compile(r"^/v1/executions/([^/]+)$"), "execution"),
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict):
+            data = json.dumps(body, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_UPLOAD_BYTES * 2:
+                raise ApiError(413, "Request body too large")
+            return self.rfile.read(length) if length else b""
+
+        def _json_body(self) -> Dict:
+            body = self._body()
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise ApiError(400, "Request body must be JSON")
+            if not isinstance(data, dict):
+                raise ApiError(400, "Request body must be a JSON object")
+            return data
+
+        def _dispatch(self, method: str):
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                for route_method, pattern, name in routes:
+                    match = pattern.match(url.path)
+                    if match and route_method == method:
+                        break
+                else:
+                    raise ApiError(404, f"No such endpoint: {method} {url.path}")
+                if API_KEY and name != "health" and not hmac.compare_digest(
+                        self.headers.get("Authorization", "").encode('utf-8'), f"Bearer {API_KEY}".encode('utf-8')):
+                    raise ApiError(401, "Missing or wrong API key")
+                self._handle(name, match.groups(), query)
+            except ApiError as e:
+                self._send_json(e.status, {"error": e.message})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except Exception as e:
+                print(f"Error handling API request {method} {url.path}: {e}")
+                self._send_json(500, {"error": str(e)})
+
+        def _handle(self, name: str, args: Tuple, query: Dict):
+            if name == "health":
+                self._send_json(200, api.health())
+            elif name == "workflows":
+                self._send_json(200, api.list_workflows(args[0]))
+            elif name == "documents":
+                self._send_json(200, api.list_documents(args[0]))
+            elif name == "upload":
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    request = self._json_body()
+                    try:
+                        content = base64.b64decode(request.get("content_base64") or "", validate=True)
+                    except (binascii.Error, ValueError):
+                        raise ApiError(400, "content_base64 is not valid base64")
+                else:
+                    request = query
+                    content = self._body()
+                self._send_json(201, api.upload_document(args[0], request.get("filename", ""), content,
+                                                         request.get("name"), request.get("description", "")))
+            elif name == "run":
+                self._send_json(*api.submit_run(args[0], self._json_body()))
+            elif name == "executions":
+                try:
+                    limit = int(query.get("limit", 50))
+                except ValueError:
+                    raise ApiError(400, "limit must be a number")
+                self._send_json(200, api.list_executions(args[0], query.get("workflow"),
+                                                         query.get("document_id"), limit))
+            elif name == "job":
+                self._send_json(200, {"job": api.get_job(args[0]).describe()})
+            elif name == "events":
+                self._stream_events(api.get_job(args[0]), int(query.get("after", 0) or 0))
+            elif name == "execution":
+                self._send_json(200, api.get_execution(args[0]))
+
+        def _stream_events(self, job: Job, index: int):
+            """Write the job's events as JSON lines until it finishes (the connection is closed after)"""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            while True:
+                events, finished = job.events_after(index, EVENTS_KEEPALIVE_SECONDS)
+                for event in events:
+                    self.wfile.write((json.dumps({"index": index, **event}, default=str) + "\n").encode('utf-8'))
+                    index += 1
+                if finished:
+                    self.wfile.write((json.dumps({"event": "job", "job": job.describe()}, default=str)
+                                      + "\n").encode('utf-8'))
+                    self.wfile.flush()
+                    return
+                if not events:
+                    self.wfile.write(b"\n")
+                self.wfile.flush()
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+    return Handler
+
+
+def serve(api: PromptFlowAPI, host: str = API_HOST, port: int = 8470) -> ThreadingHTTPServer:
+    """Create the server (call serve_forever() on it, e.g. from a thread)"""
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    return server
+
+
+def start_api_server(port: int = API_PORT, host: str = API_HOST) -> Optional[str]:
+    """
+    Serve the API from a background thread of this process, once
+
+    Returns:
+        The API's base URL, or None if disabled (port 0) or the port is taken
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = serve(PromptFlowAPI(), host, port)
+            except OSError as e:
+                print(f"Error starting API server on {host}:{port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="api-server", daemon=True).start()
+        address, bound_port = _server.server_address[:2]
+        return f"http://{address}:{bound_port}/v1"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT or 8470)
+    parser.add_argument("--job-workers", type=int, default=API_JOB_WORKERS, help="Jobs run at the same time")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve /metrics on this port (default off)")
+    args = parser.parse_args(argv)
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    server = serve(PromptFlowAPI(job_workers=args.job_workers), args.host, args.port)
+    print(f"PromptFlow API on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
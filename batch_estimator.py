@@ -0,0 +1,181 @@
+import heapq
+import os
+from typing import List, Dict, Optional
+from token_counter import count_message_tokens, context_window, token_cost, DEFAULT_MODEL
+
+# Workflow/document pairs processed at the same time by a batch run
+BATCH_CONCURRENCY = int(os.environ.get("PROMPTFLOW_BATCH_CONCURRENCY", "1"))
+# Typical answer length; max_tokens is only an upper bound
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get("PROMPTFLOW_EXPECTED_OUTPUT_TOKENS", "400"))
+# Latency model for one completion call
+CALL_OVERHEAD_SECONDS = float(os.environ.get("PROMPTFLOW_CALL_OVERHEAD_SECONDS", "1.0"))
+INPUT_TOKENS_PER_SECOND = float(os.environ.get("PROMPTFLOW_INPUT_TOKENS_PER_SECOND", "20000"))
+OUTPUT_TOKENS_PER_SECOND = float(os.environ.get("PROMPTFLOW_OUTPUT_TOKENS_PER_SECOND", "60"))
+
+# Orders in which batch work can run
+SCHEDULING_POLICIES = {
+    "fifo": "Upload order",
+    "shortest_first": "Shortest first (more results sooner)",
+    "longest_first": "Longest first (shortest total time)"
+}
+
+
+def order_items(items: List[Dict], policy: str = "fifo") -> List[Dict]:
+    """
+    Order batch items (dicts with an "estimate" and optional "priority") for a
+    scheduling policy. Higher priorities always go first; within a priority,
+    shortest_first/longest_first order by estimated input tokens.
+    """
+    if policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"Unknown scheduling policy: {policy}. Choose from: {', '.join(SCHEDULING_POLICIES)}")
+
+    def key(item):
+        size = item["estimate"]["input_tokens"]
+        if policy == "shortest_first":
+            return -item.get("priority", 0), size
+        if policy == "longest_first":
+            return -item.get("priority", 0), -size
+        return -item.get("priority", 0), 0
+
+    # sorted() is stable, so equal keys keep upload order
+    return sorted(items, key=key)
+
+
+class BatchEstimator:
+    """
+    Pre-flight estimate of a batch run: completion calls, input and output
+    tokens, cost and wall time, computed from the token counts stored with
+    each document, before any call is made.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, max_output_tokens: int = 1000,
+                 expected_output_tokens: int = EXPECTED_OUTPUT_TOKENS, router=None):
+        """
+        Args:
+            model: Default model
+            max_output_tokens: Default max_tokens per call
+            expected_output_tokens: Typical answer length used for cost and time
+            router: Optional ModelRouter, so prompts are priced on the model they will use
+        """
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.expected_output_tokens = min(expected_output_tokens, max_output_tokens)
+        self.router = router
+
+    def _profile(self, prompt: Dict):
+        """(model, max_tokens) a prompt is expected to run with"""
+        if self.router:
+            choice = self.router.choose(prompt)
+            return choice["model"], choice["max_tokens"]
+        return prompt.get('model') or self.model, prompt.get('max_tokens') or self.max_output_tokens
+
+    @staticmethod
+    def document_tokens(document: Dict) -> int:
+        """Stored token count of a document, estimated from its length if missing"""
+        if document.get("token_count") is not None:
+            return document["token_count"]
+        return document.get("text_length", 0) // 4
+
+    def call_seconds(self, input_tokens: int, output_tokens: int) -> float:
+        return (CALL_OVERHEAD_SECONDS + input_tokens / INPUT_TOKENS_PER_SECOND
+                + output_tokens / OUTPUT_TOKENS_PER_SECOND)
+
+    def estimate_pair(self, document: Dict, workflow: Dict, system_prompt: str = "") -> Dict:
+        """
+        Estimate running one workflow on one document (its prompts run one after another)
+
+        Returns:
+            Dict with "calls", "input_tokens", "output_tokens", "cost", "max_cost",
+            "seconds" and "overflows" (prompts whose input would not fit the context window)
+        """
+        doc_tokens = self.document_tokens(document)
+        estimate = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0, "max_cost": 0.0,
+                    "max_output_tokens": 0, "seconds": 0.0, "overflows": []}
+
+        for prompt in workflow.get('prompts', []):
+            model, max_tokens = self._profile(prompt)
+            output_tokens = min(self.expected_output_tokens, max_tokens)
+            limit = context_window(model) - max_tokens
+            input_tokens = count_message_tokens(doc_tokens, prompt['prompt'], system_prompt, model)
+            estimate["calls"] += 1
+            estimate["input_tokens"] += input_tokens
+            estimate["output_tokens"] += output_tokens
+            estimate["max_output_tokens"] += max_tokens
+            estimate["cost"] += token_cost(model, input_tokens, output_tokens)
+            estimate["max_cost"] += token_cost(model, input_tokens, max_tokens)
+            estimate["seconds"] += self.call_seconds(input_tokens, output_tokens)
+            if input_tokens > limit:
+                estimate["overflows"].append({
+                    "document": document['name'],
+                    "workflow": workflow['name'],
+                    "prompt": prompt['name'],
+                    "input_tokens": input_tokens,
+                    "limit": limit
+                })
+        return estimate
+
+    @staticmethod
+    def makespan(durations: List[float], concurrency: int) -> float:
+        """Wall time of running durations in order on a fixed number of workers"""
+        workers = [0.0] * max(1, concurrency)
+        for duration in durations:
+            heapq.heappush(workers, heapq.heappop(workers) + duration)
+        return max(workers)
+
+    def estimate_items(self, documents: List[Dict], workflows: List[Dict], system_prompt: str = "",
+                       priorities: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Estimate every workflow x document pair
+
+        Returns:
+            List of {"document", "workflow", "priority", "estimate"} in upload order
+        """
+        priorities = priorities or {}
+        return [
+            {
+                "document": document,
+                "workflow": workflow,
+                "priority": priorities.get(document['id'], 0),
+                "estimate": self.estimate_pair(document, workflow, system_prompt)
+            }
+            for document in documents
+            for workflow in workflows
+        ]
+
+    def estimate(self, documents: List[Dict], workflows: List[Dict], system_prompt: str = "",
+                 concurrency: Optional[int] = None, policy: str = "fifo",
+                 priorities: Optional[Dict[str, int]] = None) -> Dict:
+        """
+        Estimate a batch of every workflow against every document
+
+        Args:
+            documents: Document metadata entries (with "token_count")
+            workflows: Workflows to run
+            system_prompt: System prompt sent with every call
+            concurrency: Pairs processed in parallel (defaults to PROMPTFLOW_BATCH_CONCURRENCY)
+            policy: Scheduling policy, which affects total wall time
+            priorities: Optional document ID -> priority (higher runs first)
+
+        Returns:
+            Dict with totals for calls, tokens, cost and wall time, plus any context overflows
+        """
+        concurrency = concurrency or BATCH_CONCURRENCY
+        items = order_items(self.estimate_items(documents, workflows, system_prompt, priorities), policy)
+        totals = {"pairs": len(items), "calls": 0, "input_tokens": 0, "output_tokens": 0,
+                  "max_output_tokens": 0, "cost": 0.0, "max_cost": 0.0, "overflows": []}
+
+        for item in items:
+            pair = item["estimate"]
+            for key in ("calls", "input_tokens", "output_tokens", "max_output_tokens", "cost", "max_cost"):
+                totals[key] += pair[key]
+            totals["overflows"].extend(pair["overflows"])
+
+        durations = [item["estimate"]["seconds"] for item in items]
+        totals.update({
+            "model": self.model,
+            "concurrency": concurrency,
+            "policy": policy,
+            "serial_seconds": sum(durations),
+            "wall_seconds": self.makespan(durations, concurrency)
+        })
+        return totals
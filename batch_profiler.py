@@ -0,0 +1,188 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Optional
+
+# Default of the "Profile this run" batch setting
+BATCH_PROFILING = os.environ.get("PROMPTFLOW_BATCH_PROFILE", "off").lower() in ("on", "true", "1")
+# Seconds between stack samples of the running threads
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROMPTFLOW_PROFILE_INTERVAL", "0.005"))
+HOT_FUNCTIONS = 25
+
+# Where the time of a batch goes: reading document text, ordering the work,
+# waiting on GPT, filling templates and writing executions
+PHASES = ("extract", "plan", "llm", "render", "persist")
+
+# Threads parked in these modules are idle (pool workers, event loops), not working
+IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "_base.py"),
+                os.path.join("concurrent", "futures", "thread.py"))
+
+
+def phase(timer: Optional["PhaseTimer"], name: str):
+    """timer.phase(name), or a no-op context when the run is not profiled"""
+    return timer.phase(name) if timer else nullcontext()
+
+
+class PhaseTimer:
+    """Seconds spent in each batch phase, summed over every worker thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {name: {"seconds": 0.0, "calls": 0} for name in PHASES}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            totals = self._totals.setdefault(name, {"seconds": 0.0, "calls": 0})
+            totals["seconds"] += seconds
+            totals["calls"] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def totals(self) -> Dict:
+        with self._lock:
+            return {name: dict(values) for name, values in self._totals.items()}
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval.
+
+    Unlike cProfile, which only sees the thread it was enabled in, this covers
+    the batch worker threads too, at a cost independent of how many function
+    calls they make. Samples of threads waiting in thread pools or event loops
+    are dropped so the profile shows where work actually happens (a worker
+    blocked on the GPT socket still counts, as network time).
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(code) -> tuple:
+        return code.co_filename, code.co_firstlineno, code.co_name
+
+    def _sample(self, own_id: int):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples += 1
+            self.self_counts[stack[-1]] += 1
+            for label in set(stack):
+                self.total_counts[label] += 1
+            self.stacks[";".join(f"{name} ({os.path.basename(file)}:{line})" for file, line, name in stack)] += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own_id)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="batch-profiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    @staticmethod
+    def _short_path(file: str) -> str:
+        """Repo files relative to the working directory, library files by package and module"""
+        if file.startswith("<"):
+            return file
+        relative = os.path.relpath(file)
+        if not relative.startswith(".."):
+            return relative
+        return os.path.join(*file.split(os.sep)[-2:])
+
+    def hot_functions(self, limit: int = HOT_FUNCTIONS) -> List[Dict]:
+        """Functions with the most samples, by time spent in the function itself"""
+        if not self.samples:
+            return []
+        return [{
+            "function": name,
+            "file": self._short_path(file),
+            "line": line,
+            "self_pct": round(100 * count / self.samples, 1),
+            "total_pct": round(100 * self.total_counts[(file, line, name)] / self.samples, 1)
+        } for (file, line, name), count in self.self_counts.most_common(limit)]
+
+    def write_folded(self, path: str):
+        """Write the stacks in the collapsed format flame graph tools read"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class BatchProfiler:
+    """
+    Opt-in profile of one batch run: phase timings, sampled hot functions
+    and peak memory (tracemalloc)
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.phases = PhaseTimer()
+        self.sampler = SamplingProfiler(interval)
+        self._started_tracing = False
+        self._start = None
+        self.summary = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self.sampler.start()
+
+    def stop(self) -> Dict:
+        """
+        Finish profiling
+
+        Returns:
+            Dict with "wall_seconds", "phases" (seconds and calls per phase),
+            "peak_memory_bytes", "samples" and "hot_functions"
+        """
+        self.sampler.stop()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+        self.summary = {
+            "wall_seconds": time.perf_counter() - self._start,
+            "phases": self.phases.totals(),
+            "peak_memory_bytes": peak,
+            "samples": self.sampler.samples,
+            "sample_interval": self.sampler.interval,
+            "hot_functions": self.sampler.hot_functions()
+        }
+        return self.summary
+
+    def save(self, directory: str, run_id: str) -> Dict:
+        """Write the sampled stacks next to the batch record; returns the summary with its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{run_id}.folded")
+        self.sampler.write_folded(path)
+        self.summary["stacks_path"] = path
+        return self.summary
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import List, Dict, Optional
+from file_lock import file_lock, write_json_atomic
+
+# Guards read-modify-write cycles on the batch runs file across threads; file_lock()
+# covers other processes (the UI, the API server and the command line record runs)
+_batch_runs_lock = threading.Lock()
+
+class BatchRunManager:
+    """Keeps a record of each batch run, with its profile when one was taken"""
+
+    def __init__(self, filename="batch_runs.json", profiles_dir="batch_profiles"):
+        self.filename = filename
+        self.profiles_dir = profiles_dir
+        self._ensure_runs_file()
+
+    def _ensure_runs_file(self):
+        """Create batch runs file if it doesn't exist"""
+        if not os.path.exists(self.filename):
+            with open(self.filename, 'w') as f:
+                json.dump({"runs": []}, f)
+
+    @staticmethod
+    def new_run_id() -> str:
+        return f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    def record_run(self, run_id: str, project_id: str, summary: Dict, settings: Optional[Dict] = None,
+                   profiler=None) -> Optional[str]:
+        """
+        Record a finished batch
+
+        Args:
+            run_id: ID from new_run_id()
+            summary: The "done" event of BatchScheduler.run
+            settings: Policy, concurrency and deadline the batch ran with
+            profiler: BatchProfiler of the run, if it was profiled; its stacks
+                      are saved under profiles_dir
+
+        Returns:
+            Run ID
+        """
+        try:
+            run = {
+                "id": run_id,
+                "project_id": project_id,
+                "finished_at": datetime.now().isoformat(),
+                "settings": settings or {},
+                "results": summary.get("results", 0),
+                "errors": len(summary.get("errors", [])),
+                "skipped": len(summary.get("skipped", [])),
+                "elapsed_seconds": summary.get("elapsed_seconds")
+            }
+            if profiler is not None and profiler.summary:
+                run["profile"] = profiler.save(self.profiles_dir, run_id)
+
+            with _batch_runs_lock, file_lock(self.filename):
+                with open(self.filename, 'r') as f:
+                    data = json.load(f)
+
+                data["runs"].append(run)
+
+                write_json_atomic(self.filename, data)
+
+            return run_id
+
+        except Exception as e:
+            print(f"Error recording batch run: {e}")
+            return None
+
+    def get_runs(self, project_id: Optional[str] = None, profiled_only: bool = False) -> List[Dict]:
+        """Get batch runs, newest first"""
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+
+            runs = data.get("runs", [])
+            if project_id:
+                runs = [r for r in runs if r.get("project_id") == project_id]
+            if profiled_only:
+                runs = [r for r in runs if r.get("profile")]
+
+            runs.sort(key=lambda r: r.get("finished_at", ""), reverse=True)
+            return runs
+
+        except Exception as e:
+            print(f"Error loading batch runs: {e}")
+            return []
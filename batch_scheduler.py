@@ -0,0 +1,242 @@
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Iterator, Set, Tuple
+from batch_estimator import BatchEstimator, order_items, SCHEDULING_POLICIES, BATCH_CONCURRENCY
+from batch_profiler import phase
+from llm_scheduler import BATCH
+from metrics import registry, BATCH_PAIRS, BATCH_QUEUE_DEPTH
+
+# Pair queues of the batches running in this process, read for the queue depth metric
+_pending_queues = weakref.WeakValueDictionary()
+
+
+def _collect_queue_depth():
+    BATCH_QUEUE_DEPTH.set(sum(len(queue) for queue in list(_pending_queues.values())))
+
+
+registry.add_collector(_collect_queue_depth)
+
+
+class BatchScheduler:
+    """
+    Runs every workflow of a project against every document, ordered by a
+    scheduling policy and optional per-document priorities, with an optional
+    deadline for the whole batch.
+
+    Pairs run concurrently in a thread pool (the work is waiting on GPT), but
+    executions are recorded by the caller's thread as results come back, so
+    progress can be reported from run()'s event stream.
+    """
+
+    def __init__(self, workflow_manager, template_manager, source_manager, gpt_handler,
+                 prompt_manager, execution_manager, estimator: Optional[BatchEstimator] = None):
+        self.workflow_manager = workflow_manager
+        self.template_manager = template_manager
+        self.source_manager = source_manager
+        self.gpt_handler = gpt_handler
+        self.prompt_manager = prompt_manager
+        self.execution_manager = execution_manager
+        self.estimator = estimator or BatchEstimator(
+            model=gpt_handler.model,
+            max_output_tokens=getattr(gpt_handler, 'max_tokens', 1000),
+            router=getattr(gpt_handler, 'router', None)
+        )
+
+    def _resolve_template(self, workflow: Dict, project_id: Optional[str]) -> Optional[str]:
+        """Find the template of a workflow, adopting one whose markers match its prompts"""
+        if workflow.get('template_id'):
+            return workflow['template_id']
+
+        workflow_markers = [f"{p['name'].upper().replace(' ', '_')}_OUTPUT"
+                            for p in workflow.get('prompts', [])]
+        for template in self.template_manager.get_templates():
+            markers = self.template_manager.get_template_markers(template['id'])
+            if any(marker in workflow_markers for marker in markers):
+                workflow['template_id'] = template['id']
+                self.workflow_manager.update_workflow_template_id(
+                    workflow['name'], template['id'], project_id
+                )
+                return template['id']
+        return None
+
+    def plan(self, project_id: Optional[str], documents: List[Dict], workflows: List[Dict],
+             policy: str = "fifo", priorities: Optional[Dict[str, int]] = None,
+             exclude: Optional[Set[Tuple[str, str]]] = None) -> Dict:
+        """
+        Order the batch without running it
+
+        Args:
+            exclude: (document ID, workflow name) pairs not to run, e.g. ones
+                     already processed
+
+        Returns:
+            Dict with "items" (ordered work with estimates) and "skipped"
+            (workflows and pairs that will not run, with a "reason")
+        """
+        runnable, skipped = [], []
+        for workflow in workflows:
+            if self._resolve_template(workflow, project_id):
+                runnable.append(workflow)
+            else:
+                skipped.append({"workflow": workflow['name'], "document": None,
+                                "reason": "No template assigned"})
+
+        items = self.estimator.estimate_items(
+            documents, runnable, self.prompt_manager.get_system_prompt(), priorities
+        )
+        if exclude:
+            for item in items:
+                if (item["document"]['id'], item["workflow"]['name']) in exclude:
+                    skipped.append({"workflow": item["workflow"]['name'], "document": item["document"]['name'],
+                                    "reason": "Already processed"})
+            items = [item for item in items if (item["document"]['id'], item["workflow"]['name']) not in exclude]
+        return {"items": order_items(items, policy), "skipped": skipped}
+
+    def _process(self, item: Dict, project_id: Optional[str], phases=None) -> Dict:
+        """Worker: run one workflow on one document"""
+        start = time.monotonic()
+        result = self.workflow_manager.process_workflow_with_template(
+            item["workflow"]['name'],
+            item["document"]['id'],
+            self.template_manager,
+            self.source_manager,
+            self.gpt_handler,
+            self.prompt_manager,
+            project_id=project_id,
+            priority=BATCH,
+            # Pairs already run side by side; keep each pair's prompts sequential
+            prompt_concurrency=1,
+            phases=phases
+        )
+        result["elapsed_seconds"] = time.monotonic() - start
+        return result
+
+    def run(self, project_id: Optional[str], documents: List[Dict], workflows: List[Dict],
+            policy: str = "fifo", concurrency: Optional[int] = None,
+            deadline_seconds: Optional[float] = None,
+            priorities: Optional[Dict[str, int]] = None, profiler=None,
+            exclude: Optional[Set[Tuple[str, str]]] = None) -> Iterator[Dict]:
+        """
+        Run a batch, streaming progress events
+
+        Args:
+            project_id: Project the documents and workflows belong to
+            documents: Documents to process
+            workflows: Workflows to run on each document
+            policy: One of SCHEDULING_POLICIES
+            concurrency: Pairs processed at the same time (defaults to PROMPTFLOW_BATCH_CONCURRENCY)
+            deadline_seconds: Do not start work that is not expected to finish within this time
+            priorities: Optional document ID -> priority (higher runs first)
+            profiler: Optional BatchProfiler; the run is profiled and its
+                      summary is added to the "done" event as "profile"
+            exclude: (document ID, workflow name) pairs to skip (see plan())
+
+        Yields dicts with an "event" key:
+            "planned"   - order decided ("total" pairs to attempt)
+            "started"   - pair dispatched ("document", "workflow")
+            "completed" - execution recorded ("document", "workflow", "execution_id", "completed", "total")
+            "failed"    - pair failed ("document", "workflow", "error", "completed", "total")
+            "skipped"   - pair not attempted ("document", "workflow", "reason")
+            "done"      - summary ("results", "errors", "skipped", "elapsed_seconds" and,
+                          when profiled, "profile")
+        """
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}. Choose from: {', '.join(SCHEDULING_POLICIES)}")
+        concurrency = max(1, concurrency or BATCH_CONCURRENCY)
+
+        if not profiler:
+            yield from self._run(project_id, documents, workflows, policy, concurrency,
+                                 deadline_seconds, priorities, exclude=exclude)
+            return
+
+        profiler.start()
+        try:
+            for event in self._run(project_id, documents, workflows, policy, concurrency,
+                                   deadline_seconds, priorities, profiler.phases, exclude):
+                if event["event"] == "done":
+                    event["profile"] = profiler.stop()
+                yield event
+        finally:
+            # Don't leave the sampler and tracemalloc running if the batch fails
+            if profiler.summary is None:
+                profiler.stop()
+
+    def _run(self, project_id: Optional[str], documents: List[Dict], workflows: List[Dict],
+             policy: str, concurrency: int, deadline_seconds: Optional[float],
+             priorities: Optional[Dict[str, int]], phases=None,
+             exclude: Optional[Set[Tuple[str, str]]] = None) -> Iterator[Dict]:
+        """Body of run(); phases is the PhaseTimer of a profiled run"""
+        with phase(phases, "plan"):
+            plan = self.plan(project_id, documents, workflows, policy, priorities, exclude)
+        skipped = list(plan["skipped"])
+        total = len(plan["items"])
+        yield {"event": "planned", "total": total}
+        BATCH_PAIRS.inc(len(skipped), outcome="skipped")
+        for entry in skipped:
+            yield {"event": "skipped", **entry}
+
+        start = time.monotonic()
+        queue = deque(plan["items"])
+        _pending_queues[id(queue)] = queue
+        running = {}
+        completed = 0
+        results = 0
+        errors = []
+        # Actual seconds per estimated second, learnt from finished pairs
+        observed, estimated = 0.0, 0.0
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+            while queue or running:
+                while queue and len(running) < concurrency:
+                    item = queue.popleft()
+                    if deadline_seconds is not None:
+                        scale = observed / estimated if estimated else 1.0
+                        expected_finish = time.monotonic() - start + item["estimate"]["seconds"] * scale
+                        if expected_finish > deadline_seconds:
+                            entry = {"document": item["document"]['name'], "workflow": item["workflow"]['name'],
+                                     "reason": "Would not finish before the deadline"}
+                            skipped.append(entry)
+                            BATCH_PAIRS.inc(outcome="skipped")
+                            yield {"event": "skipped", **entry}
+                            continue
+                    running[executor.submit(self._process, item, project_id, phases)] = item
+                    yield {"event": "started", "document": item["document"]['name'],
+                           "workflow": item["workflow"]['name']}
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = running.pop(future)
+                    completed += 1
+                    names = {"document": item["document"]['name'], "workflow": item["workflow"]['name']}
+                    try:
+                        result = future.result()
+                        observed += result["elapsed_seconds"]
+                        estimated += item["estimate"]["seconds"]
+                        if "error" in result:
+                            raise RuntimeError(result["error"])
+                        with phase(phases, "persist"):
+                            execution_id = self.execution_manager.record_execution(
+                                project_id=project_id,
+                                workflow_name=item["workflow"]['name'],
+                                document_id=item["document"]['id'],
+                                results=result['results'],
+                                template_content=result['content'],
+                                result_details=result.get('result_details'),
+                                timings=result.get('timings')
+                            )
+                        results += 1
+                        BATCH_PAIRS.inc(outcome="completed")
+                        yield {"event": "completed", **names, "execution_id": execution_id,
+                               "completed": completed, "total": total}
+                    except Exception as e:
+                        BATCH_PAIRS.inc(outcome="failed")
+                        errors.append(f"{names['workflow']} on {names['document']}: {str(e)}")
+                        yield {"event": "failed", **names, "error": str(e),
+                               "completed": completed, "total": total}
+
+        yield {"event": "done", "results": results, "errors": errors, "skipped": skipped,
+               "elapsed_seconds": time.monotonic() - start}
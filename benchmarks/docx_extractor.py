@@ -0,0 +1,91 @@
+"""
+Compare the python-docx and streaming DOCX extractors on a corpus.
+
+    python -m benchmarks.docx_extractor [paths or directories ...] [--repeat N]
+
+Every file is extracted with both extractors; the run fails (exit code 1) if
+any output differs, and reports per-extractor wall time and peak memory.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_processor import DocumentProcessor  # noqa: E402
+
+
+def collect_files(paths: List[str]) -> List[str]:
+    """Expand directories into the .docx files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "**", "*.docx"), recursive=True))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def measure(processor: DocumentProcessor, content: bytes, repeat: int):
+    """Return (text, best wall time in seconds, peak traced memory in bytes)"""
+    best = float("inf")
+    text = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = processor._extract_from_docx(content)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    processor._extract_from_docx(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return text, best, peak
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=["source_documents"])
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per file (best is reported)")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.paths)
+    if not files:
+        print("No .docx files found")
+        return 1
+
+    object_model = DocumentProcessor(docx_extractor="python-docx")
+    streaming = DocumentProcessor(docx_extractor="streaming")
+    totals = {"python-docx": [0.0, 0], "streaming": [0.0, 0]}
+    mismatches = 0
+
+    print(f"{'file':50} {'python-docx':>14} {'streaming':>14} {'speedup':>8} {'match':>6}")
+    for path in files:
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        expected, om_time, om_peak = measure(object_model, content, args.repeat)
+        actual, st_time, st_peak = measure(streaming, content, args.repeat)
+        match = expected == actual
+        mismatches += not match
+
+        totals["python-docx"][0] += om_time
+        totals["python-docx"][1] = max(totals["python-docx"][1], om_peak)
+        totals["streaming"][0] += st_time
+        totals["streaming"][1] = max(totals["streaming"][1], st_peak)
+
+        print(f"{os.path.basename(path)[:50]:50} {om_time * 1000:11.1f} ms {st_time * 1000:11.1f} ms "
+              f"{om_time / st_time:7.1f}x {'yes' if match else 'NO':>6}")
+
+    print()
+    for name, (elapsed, peak) in totals.items():
+        print(f"{name:12} total {elapsed * 1000:9.1f} ms   peak memory {peak / 1024:9.0f} KiB")
+    print(f"{len(files) - mismatches}/{len(files)} files match")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
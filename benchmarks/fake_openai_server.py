@@ -0,0 +1,306 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load and throughput tests.
+
+    python -m benchmarks.fake_openai_server [--port 8765] [--latency lognormal:0.8,0.4]
+        [--tokens-per-second 60] [--error-rate-429 0.02] [--error-rate-5xx 0.01]
+        [--rpm 500] [--tpm 200000] [--answers answers.json] [--seed 1]
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (any
+OPENAI_API_KEY will do), or give a PROMPTFLOW_LLM_ENDPOINTS entry its
+"base_url". Answers are deterministic: a prompt whose name (sent by
+GPTHandler in the X-PromptFlow-Prompt header) or text is a key of the answers
+file gets that answer, anything else gets filler text derived from the prompt.
+GET /stats reports what the server has handled.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpt_handler import PROMPT_NAME_HEADER  # noqa: E402
+from token_counter import count_tokens  # noqa: E402
+
+FILLER_WORDS = ("the lease term rent tenant landlord premises clause schedule party date amount "
+                "payable annual review break option repair insurance service charge").split()
+
+
+def parse_latency(spec: str):
+    """
+    Build a sampler of time-to-first-token seconds from a spec like
+    "fixed:0.5", "uniform:0.2,1.5", "normal:0.8,0.2" or "lognormal:-0.3,0.5"
+    (lognormal takes the mean and sigma of the underlying normal)
+    """
+    kind, _, values = spec.partition(":")
+    params = [float(v) for v in values.split(",") if v]
+    samplers = {
+        "fixed": lambda rng: params[0],
+        "uniform": lambda rng: rng.uniform(params[0], params[1]),
+        "normal": lambda rng: rng.gauss(params[0], params[1]),
+        "lognormal": lambda rng: rng.lognormvariate(params[0], params[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {kind}. Choose from: {', '.join(samplers)}")
+    sampler = samplers[kind]
+    return lambda rng: max(0.0, sampler(rng))
+
+
+class FakeOpenAI:
+    """Shared state of the server: settings, the rate-limit window and counters"""
+
+    def __init__(self, latency: str = "fixed:0.2", tokens_per_second: float = 80.0,
+                 error_rate_429: float = 0.0, error_rate_5xx: float = 0.0,
+                 rpm: int = 0, tpm: int = 0, answers: Optional[Dict[str, str]] = None,
+                 output_tokens: int = 150, seed: Optional[int] = None):
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.rpm = rpm
+        self.tpm = tpm
+        self.answers = answers or {}
+        self.output_tokens = output_tokens
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = deque()  # (timestamp, tokens) of requests in the last minute
+        self.stats = {"requests": 0, "completions": 0, "streams": 0, "throttled": 0,
+                      "injected_429": 0, "injected_5xx": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def admit(self, tokens: int) -> Dict:
+        """
+        Apply the per-minute limits to a request
+
+        Returns:
+            Dict with "allowed", "headers" (x-ratelimit-*) and "retry_after"
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+            used_requests = len(self._window)
+            used_tokens = sum(t for _, t in self._window)
+            allowed = not ((self.rpm and used_requests + 1 > self.rpm) or
+                           (self.tpm and used_tokens + tokens > self.tpm))
+            if allowed:
+                self._window.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            retry_after = 60 - (now - self._window[0][0]) if self._window and not allowed else 0
+
+        headers = {}
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - used_requests))
+        if self.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - used_tokens))
+        return {"allowed": allowed, "headers": headers, "retry_after": max(1, round(retry_after))}
+
+    def injected_error(self) -> Optional[int]:
+        """Status code of a randomly injected failure, if this request gets one"""
+        with self._lock:
+            roll = self.rng.random()
+        if roll < self.error_rate_429:
+            return 429
+        if roll < self.error_rate_429 + self.error_rate_5xx:
+            return 503
+        return None
+
+    def answer(self, prompt_name: Optional[str], prompt: str, max_tokens: Optional[int]) -> str:
+        """Canned answer for a prompt, or deterministic filler text"""
+        if prompt_name and prompt_name in self.answers:
+            return self.answers[prompt_name]
+        if prompt in self.answers:
+            return self.answers[prompt]
+        seed = int(hashlib.sha256((prompt_name or prompt).encode('utf-8')).hexdigest()[:12], 16)
+        rng = random.Random(seed)
+        length = min(self.output_tokens, max_tokens or self.output_tokens)
+        return " ".join(rng.choice(FILLER_WORDS) for _ in range(length))
+
+
+def make_handler(server_state: FakeOpenAI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_error(self, status: int, message: str, headers: Optional[Dict] = None):
+            error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+            self._send_json(status, {"error": {"message": message, "type": error_type, "code": error_type}},
+                            headers)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with server_state._lock:
+                    stats = dict(server_state.stats)
+                self._send_json(200, stats)
+            elif self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [
+                    {"id": "gpt-4o", "object": "model", "owned_by": "fake"},
+                    {"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]})
+            else:
+                self._send_error(404, f"Unknown path {self.path}")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_error(400, "Request body is not JSON")
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_error(404, f"Unknown path {self.path}")
+                return
+            server_state.count("requests")
+
+            messages = body.get("messages", [])
+            prompt_tokens = sum(count_tokens(m.get("content") or "") + 4 for m in messages)
+            max_tokens = body.get("max_tokens")
+            admission = server_state.admit(prompt_tokens + (max_tokens or server_state.output_tokens))
+            if not admission["allowed"]:
+                server_state.count("throttled")
+                self._send_error(429, "Rate limit reached",
+                                 {**admission["headers"], "retry-after": str(admission["retry_after"])})
+                return
+
+            injected = server_state.injected_error()
+            if injected == 429:
+                server_state.count("injected_429")
+                self._send_error(429, "Rate limit reached (injected)", {**admission["headers"], "retry-after": "1"})
+                return
+            if injected:
+                server_state.count("injected_5xx")
+                self._send_error(injected, "Service unavailable (injected)", admission["headers"])
+                return
+
+            user_text = messages[-1].get("content", "") if messages else ""
+            prompt = user_text.split("\n\nDocument:\n", 1)[0]
+            prompt_name = unquote(self.headers.get(PROMPT_NAME_HEADER) or "") or None
+            answer = server_state.answer(prompt_name, prompt, max_tokens)
+            words = answer.split(" ")
+            completion_tokens = count_tokens(answer)
+            finish_reason = "length" if max_tokens and completion_tokens >= max_tokens else "stop"
+            server_state.count("prompt_tokens", prompt_tokens)
+            server_state.count("completion_tokens", completion_tokens)
+
+            with server_state._lock:
+                first_token = server_state.latency(server_state.rng)
+            per_word = completion_tokens / len(words) / server_state.tokens_per_second \
+                if server_state.tokens_per_second else 0.0
+            created = int(time.time())
+            completion_id = f"chatcmpl-fake{server_state.stats['requests']}"
+            model = body.get("model", "gpt-4o")
+
+            time.sleep(first_token)
+            if body.get("stream"):
+                server_state.count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                for name, value in admission["headers"].items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                for index, word in enumerate(words):
+                    if index:
+                        time.sleep(per_word)
+                    delta = {"content": word if index == 0 else " " + word}
+                    self._write_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                                       "model": model, "choices": [{"index": 0, "delta": delta,
+                                                                    "finish_reason": None}]})
+                self._write_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                                   "model": model, "choices": [{"index": 0, "delta": {},
+                                                                "finish_reason": finish_reason}]})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            else:
+                server_state.count("completions")
+                time.sleep(per_word * max(0, len(words) - 1))
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                 "finish_reason": finish_reason}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}
+                }, admission["headers"])
+
+        def _write_event(self, chunk: Dict):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(state: FakeOpenAI, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Create the server (call serve_forever() on it, e.g. from a thread)"""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.2",
+                        help="Time to first token: fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MU,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Output speed (0 for instant)")
+    parser.add_argument("--output-tokens", type=int, default=150, help="Length of generated filler answers")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Fraction of requests throttled at random")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="Fraction of requests failed with 503")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 for unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute before 429s (0 for unlimited)")
+    parser.add_argument("--answers", help="JSON file of prompt name (or prompt text) -> answer")
+    parser.add_argument("--seed", type=int, help="Seed for latencies and injected errors")
+    args = parser.parse_args(argv)
+
+    answers = {}
+    if args.answers:
+        with open(args.answers, 'r') as f:
+            answers = json.load(f)
+
+    state = FakeOpenAI(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                       error_rate_429=args.error_rate_429, error_rate_5xx=args.error_rate_5xx,
+                       rpm=args.rpm, tpm=args.tpm, answers=answers, output_tokens=args.output_tokens,
+                       seed=args.seed)
+    server = serve(state, args.host, args.port)
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1 - set OPENAI_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
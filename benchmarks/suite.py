@@ -0,0 +1,226 @@
+"""
+Time the storage, extraction and batch hot paths on a synthetic data set.
+
+    python -m benchmarks.suite [--scale full|small] [--repeat N] [--output results.json]
+        [--baseline benchmarks/baseline.json] [--threshold 0.25] [--update-baseline]
+
+The full scale generates 10k documents, 1k workflows and 100k executions in a
+temporary folder (the repo's own data is never touched). Each benchmark's
+median time is compared with the baseline; the run fails (exit code 1) when
+any is more than --threshold slower. Batch runs use the local stand-in
+server in benchmarks.fake_openai_server instead of the OpenAI API.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import build_workspace  # noqa: E402
+from benchmarks.fake_openai_server import FakeOpenAI, serve  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, "benchmarks", "baseline.json")
+
+SCALES = {
+    "full": {"documents": 10000, "workflows": 1000, "executions": 100000,
+             "batch_documents": 20, "batch_workflows": 5},
+    "small": {"documents": 1000, "workflows": 100, "executions": 10000,
+              "batch_documents": 10, "batch_workflows": 3},
+}
+# Differences smaller than this are noise whatever the ratio
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def timed(function: Callable, repeat: int) -> Dict:
+    """Run function repeat times; return median and best wall time"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return {"median_seconds": statistics.median(samples), "best_seconds": min(samples), "repeat": repeat}
+
+
+def sample_files(extension: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(REPO_DIR, "source_documents", "**", f"*{extension}"), recursive=True))
+
+
+def run_suite(workspace: str, scale: Dict, repeat: int) -> Dict:
+    """Generate the data set in workspace and run every benchmark"""
+    # Imported here so the managers pick up the stand-in server settings
+    from source_manager import SourceDocumentManager
+    from execution_manager import ExecutionManager
+    from template_manager import TemplateManager
+    from workflow_manager import WorkflowManager
+    from prompt_manager import PromptManager
+    from document_processor import DocumentProcessor
+
+    results = {}
+
+    def record(name: str, function: Callable, times: int = repeat):
+        results[name] = timed(function, times)
+        print(f"{name:40} {results[name]['median_seconds'] * 1000:10.1f} ms")
+
+    start = time.perf_counter()
+    data = build_workspace(workspace, scale["documents"], scale["workflows"], scale["executions"])
+    print(f"Generated data set in {time.perf_counter() - start:.1f} s")
+    path = lambda name: os.path.join(workspace, name)  # noqa: E731
+    project_id = data["projects"][0]
+
+    # Storage: construction includes building the search indexes from scratch
+    managers = {}
+    record("source_manager.init_and_index", lambda: managers.update(sources=SourceDocumentManager(
+        path("source_documents"), path("source_documents.json"), path("search_index.db"))), times=1)
+    record("execution_manager.init_and_index", lambda: managers.update(executions=ExecutionManager(
+        path("executions.json"), path("search_index.db"), path("execution_rollups.json"))), times=1)
+    sources, executions = managers["sources"], managers["executions"]
+    templates = TemplateManager(path("template_documents"), path("templates.json"))
+    workflows = WorkflowManager(path("workflows.json"), path("project_workflows.json"))
+
+    record("source_manager.get_documents", lambda: sources.get_documents(project_id))
+    record("source_manager.search_documents", lambda: sources.search_documents("rent review", project_id))
+    record("source_manager.search_documents_all", lambda: sources.search_documents("forfeiture notice", "*"))
+    record("execution_manager.get_executions", lambda: executions.get_executions(project_id))
+    record("workflow_manager.get_workflows", lambda: workflows.get_workflows(project_id))
+    record("template_manager.get_template_markers",
+           lambda: [templates.get_template_markers(t["id"]) for t in data["templates"]])
+
+    # Extraction on the sample files shipped in source_documents
+    processor = DocumentProcessor()
+    for extension in (".docx", ".pdf"):
+        files = sample_files(extension)
+        if not files:
+            print(f"No sample {extension} files; skipping extraction benchmark")
+            continue
+        contents = []
+        for file_path in files:
+            with open(file_path, 'rb') as f:
+                contents.append((os.path.basename(file_path), f.read()))
+        record(f"document_processor.extract{extension.replace('.', '_')}",
+               lambda contents=contents: [processor.extract_text_from_bytes(n, c) for n, c in contents])
+
+    # Writes append to the executions journal, so they run after the reads
+    record("execution_manager.record_execution", lambda: executions.record_execution(
+        project_id, data["workflows"][0]["name"], data["documents"][0]["id"],
+        {"RENT_OUTPUT": "£10,000 per annum"}, "Rent: £10,000 per annum"))
+    # The rollup update that every record_execution also pays
+    execution = executions.get_executions(project_id)[-1]
+    record("execution_rollup.add", lambda: executions.rollup.add(execution))
+
+    record("batch.end_to_end", lambda: run_batch(sources, executions, templates, workflows,
+                                                 PromptManager(path("prompts.json")), data, scale), times=1)
+    return results
+
+
+def run_batch(sources, executions, templates, workflows, prompts, data: Dict, scale: Dict):
+    """Run a batch through BatchScheduler against the stand-in server"""
+    from batch_scheduler import BatchScheduler
+    from gpt_handler import GPTHandler
+
+    project_id = data["projects"][0]
+    documents = sources.get_documents(project_id)[:scale["batch_documents"]]
+    project_workflows = workflows.get_workflows(project_id)[:scale["batch_workflows"]]
+    scheduler = BatchScheduler(workflows, templates, sources, GPTHandler(), prompts, executions)
+    for event in scheduler.run(project_id, documents, project_workflows, concurrency=8):
+        if event["event"] == "failed":
+            raise RuntimeError(f"Batch pair failed: {event['error']}")
+
+
+def start_fake_server():
+    """Serve the stand-in API on a free port and point the OpenAI client at it"""
+    server = serve(FakeOpenAI(latency="fixed:0.02", tokens_per_second=0, output_tokens=40, seed=1), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    return server
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Names of benchmarks slower than the baseline by more than threshold"""
+    regressions = []
+    print(f"\n{'benchmark':40} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name, {}).get("median_seconds")
+        now = result["median_seconds"]
+        if before is None:
+            print(f"{name:40} {'-':>12} {now * 1000:9.1f} ms {'new':>8}")
+            continue
+        change = (now - before) / before if before else 0.0
+        regressed = change > threshold and now - before > MIN_REGRESSION_SECONDS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:40} {before * 1000:9.1f} ms {now * 1000:9.1f} ms {change:+7.0%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="full")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (median is compared)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, e.g. 0.25 for 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="Save these results as the baseline")
+    parser.add_argument("--keep-data", action="store_true", help="Leave the generated data set on disk")
+    args = parser.parse_args(argv)
+
+    workspace = tempfile.mkdtemp(prefix="promptflow-bench-")
+    server = start_fake_server()
+    try:
+        results = run_suite(workspace, SCALES[args.scale], args.repeat)
+    finally:
+        server.shutdown()
+        if args.keep_data:
+            print(f"Data set kept in {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "scale": args.scale,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+            f.write("\n")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare with; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get("scale") != args.scale:
+        print(f"\nBaseline is for the {baseline.get('scale')} scale; not comparing")
+        return 0
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Synthetic PromptFlow data for benchmarks: documents, templates, workflows and
+executions written straight into the JSON files and folders the managers use.
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from token_counter import count_tokens, tokenizer_name
+
+WORDS = ("lease landlord tenant premises rent review term break option repair insurance "
+         "service charge schedule clause covenant assignment underletting deposit guarantor "
+         "forfeiture quiet enjoyment alterations yield up dilapidations notice arbitration "
+         "interest vat utilities outgoings rates planning easements reservations").split()
+TOWNS = "Stroud Bristol Leeds York Bath Cardiff Exeter Norwich Derby Chester".split()
+PROMPT_NAMES = ["Landlord", "Tenant", "Rent", "Term", "Premises", "Break Option", "Rent Review", "Repairs"]
+
+
+def project_ids(count: int) -> List[str]:
+    return [f"proj_bench{i:03d}" for i in range(count)]
+
+
+def lease_text(rng: random.Random, paragraphs: int = 12) -> str:
+    """A lease-like document with numbered clauses"""
+    lines = [f"Lease relating to {rng.randint(1, 200)} High Street, {rng.choice(TOWNS)}"]
+    for number in range(1, paragraphs + 1):
+        lines.append(f"{number}. {rng.choice(WORDS).title()}")
+        for sub in range(1, rng.randint(2, 4)):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(25, 45)))
+            lines.append(f"{number}.{sub} The {sentence}.")
+    return "\n".join(lines)
+
+
+def write_documents(workspace: str, count: int, projects: List[str], seed: int = 1) -> List[Dict]:
+    """Extracted text files plus a source_documents.json describing them"""
+    rng = random.Random(seed)
+    tokenizer = tokenizer_name()
+    documents = []
+    start = datetime(2025, 1, 1)
+    for index in range(count):
+        project_id = projects[index % len(projects)]
+        folder = os.path.join(workspace, "source_documents", f"project_{project_id}")
+        os.makedirs(folder, exist_ok=True)
+        document_id = f"20250101_000000_{index:06d}_{rng.randint(1000, 9999)}"
+        text = lease_text(rng)
+        stored = f"{document_id}_Lease_{index}"
+        text_path = os.path.join(folder, stored + ".txt")
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        documents.append({
+            "id": document_id,
+            "name": f"Lease {index}",
+            "description": "",
+            "original_filename": f"Lease {index}.docx",
+            "stored_filename": stored + ".docx",
+            "file_path": os.path.join(folder, stored + ".docx"),
+            "text_path": text_path,
+            "uploaded_at": (start + timedelta(minutes=index)).isoformat(),
+            "file_size": len(text),
+            "file_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            "text_length": len(text),
+            "token_count": count_tokens(text),
+            "tokenizer": tokenizer,
+            "preview": text[:500] + "...",
+            "project_id": project_id
+        })
+    with open(os.path.join(workspace, "source_documents.json"), 'w') as f:
+        json.dump({"documents": documents}, f, indent=4)
+    return documents
+
+
+def marker(prompt_name: str) -> str:
+    return f"{prompt_name.upper().replace(' ', '_')}_OUTPUT"
+
+
+def write_templates(workspace: str, count: int, seed: int = 2) -> List[Dict]:
+    """Text templates each using a few of the standard prompt markers"""
+    rng = random.Random(seed)
+    folder = os.path.join(workspace, "template_documents")
+    os.makedirs(folder, exist_ok=True)
+    templates = []
+    for index in range(count):
+        names = rng.sample(PROMPT_NAMES, 4)
+        body = "\n\n".join(f"{name}: {{{marker(name)}}}\n" + " ".join(rng.choice(WORDS) for _ in range(60))
+                           for name in names)
+        template_id = f"20250101_000000_{index:06d}_tpl"
+        file_path = os.path.join(folder, f"{template_id}_Template_{index}.md")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        templates.append({
+            "id": template_id,
+            "name": f"Template {index}",
+            "description": "",
+            "original_filename": f"Template {index}.md",
+            "stored_filename": os.path.basename(file_path),
+            "file_path": file_path,
+            "uploaded_at": datetime(2025, 1, 1).isoformat(),
+            "file_size": len(body),
+            "file_type": "text/markdown",
+            "markers": names
+        })
+    with open(os.path.join(workspace, "templates.json"), 'w') as f:
+        json.dump({"templates": templates}, f, indent=4)
+    return templates
+
+
+def write_workflows(workspace: str, count: int, projects: List[str], templates: List[Dict],
+                    seed: int = 3) -> List[Dict]:
+    """Project workflows of four prompts, each tied to a template using their markers"""
+    rng = random.Random(seed)
+    workflows = []
+    for index in range(count):
+        template = templates[index % len(templates)]
+        workflows.append({
+            "name": f"Workflow {index}",
+            "description": "Synthetic benchmark workflow",
+            "created_at": datetime(2025, 1, 1).isoformat(),
+            "status": "active",
+            "prompts": [{"name": name, "prompt": f"What is the {name.lower()} under the lease?",
+                         "type": "custom"} for name in template["markers"]],
+            "output_format": "markdown",
+            "template_id": template["id"],
+            "is_global": False,
+            "project_id": projects[index % len(projects)]
+        })
+    rng.shuffle(workflows)
+    with open(os.path.join(workspace, "project_workflows.json"), 'w') as f:
+        json.dump({"workflows": workflows}, f, indent=4)
+    with open(os.path.join(workspace, "workflows.json"), 'w') as f:
+        json.dump({"workflows": []}, f, indent=4)
+    return workflows
+
+
+def write_executions(workspace: str, count: int, documents: List[Dict], workflows: List[Dict],
+                     seed: int = 4) -> None:
+    """Execution history spread over the generated documents and workflows"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    executions = []
+    for index in range(count):
+        workflow = rng.choice(workflows)
+        document = rng.choice(documents)
+        results = {marker(p["name"]): " ".join(rng.choice(WORDS) for _ in range(20))
+                   for p in workflow["prompts"]}
+        executions.append({
+            "id": f"exec_bench_{index:07d}",
+            "project_id": workflow["project_id"],
+            "workflow_name": workflow["name"],
+            "document_id": document["id"],
+            "executed_at": (start + timedelta(seconds=index * 30)).isoformat(),
+            "results": results,
+            "template_content": "\n".join(f"{k}: {v}" for k, v in results.items()),
+            "status": "completed"
+        })
+    with open(os.path.join(workspace, "executions.json"), 'w') as f:
+        json.dump({"executions": executions}, f, indent=4)
+
+
+def build_workspace(workspace: str, documents: int, workflows: int, executions: int,
+                    projects: int = 10, templates: int = 50) -> Dict:
+    """Generate a complete data set in workspace; returns what was generated"""
+    os.makedirs(workspace, exist_ok=True)
+    ids = project_ids(projects)
+    generated_documents = write_documents(workspace, documents, ids)
+    generated_templates = write_templates(workspace, templates)
+    generated_workflows = write_workflows(workspace, workflows, ids, generated_templates)
+    write_executions(workspace, executions, generated_documents, generated_workflows)
+    return {"projects": ids, "documents": generated_documents, "templates": generated_templates,
+            "workflows": generated_workflows}
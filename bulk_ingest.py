@@ -0,0 +1,235 @@
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Iterator, Tuple
+from document_processor import DocumentProcessor
+from metrics import EXTRACTION_SECONDS
+
+
+def _read_source(source: Dict) -> bytes:
+    """Read the raw bytes of an ingest source (a ZIP member or a file on disk)"""
+    if source.get("zip_path"):
+        with zipfile.ZipFile(source["zip_path"]) as zf:
+            return zf.read(source["member"])
+    with open(source["path"], 'rb') as f:
+        return f.read()
+
+
+def _extract_source(source: Dict) -> str:
+    """Process-pool worker: extract the text of one ingest source"""
+    # Already running in a worker process, so large PDFs are not fanned out again
+    processor = DocumentProcessor(pdf_workers=0)
+    if not source["filename"].lower().endswith(".pdf"):
+        return processor.extract_text_from_bytes(source["filename"], _read_source(source))
+    if not source.get("zip_path"):
+        return processor.extract_text_from_file(source["path"], source["filename"])
+
+    # PDFs are parsed from a file page by page, never loaded into memory whole
+    with zipfile.ZipFile(source["zip_path"]) as zf:
+        with zf.open(source["member"]) as src, tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            shutil.copyfileobj(src, tmp)
+    try:
+        return processor.extract_text_from_file(tmp.name, source["filename"])
+    finally:
+        os.remove(tmp.name)
+
+
+def _extract_source_timed(source: Dict) -> Tuple[str, float]:
+    """Process-pool worker: (text, seconds); the worker's own metrics never reach the parent"""
+    start = time.perf_counter()
+    text = _extract_source(source)
+    return text, time.perf_counter() - start
+
+
+class BulkIngestor:
+    """
+    Imports many documents at once from a ZIP archive or a server-side folder.
+    Text extraction runs in a process pool because python-docx and PyPDF2 are
+    CPU-bound; the extracted documents are then stored with a single metadata
+    write through SourceDocumentManager.add_documents.
+    """
+
+    def __init__(self, source_manager, max_workers: Optional[int] = None):
+        """
+        Args:
+            source_manager: SourceDocumentManager the documents are stored in
+            max_workers: Process pool size (None uses the CPU count, 0 extracts in-process)
+        """
+        self.source_manager = source_manager
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _is_candidate(filename: str) -> bool:
+        """Ignore folders, hidden files, Office lock files and macOS archive metadata"""
+        base = os.path.basename(filename)
+        return bool(base) and not base.startswith(('.', '~$')) and '__MACOSX' not in filename
+
+    @staticmethod
+    def _is_supported(filename: str) -> bool:
+        return filename.split('.')[-1].lower() in DocumentProcessor.SUPPORTED_FORMATS
+
+    def sources_from_zip(self, zip_path: str) -> Tuple[List[Dict], List[Dict]]:
+        """
+        List the documents inside a ZIP archive
+
+        Returns:
+            (sources, skipped) where skipped entries carry a "reason"
+        """
+        sources, skipped = [], []
+        with zipfile.ZipFile(zip_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not self._is_candidate(info.filename):
+                    continue
+                filename = os.path.basename(info.filename)
+                if not self._is_supported(filename):
+                    skipped.append({"filename": info.filename, "reason": "Unsupported file type"})
+                    continue
+                sources.append({
+                    "filename": filename,
+                    "display_path": info.filename,
+                    "zip_path": zip_path,
+                    "member": info.filename,
+                    "file_size": info.file_size
+                })
+        return sources, skipped
+
+    def sources_from_directory(self, directory: str, recursive: bool = True) -> Tuple[List[Dict], List[Dict]]:
+        """
+        List the documents inside a server-side directory
+
+        Returns:
+            (sources, skipped) where skipped entries carry a "reason"
+        """
+        if not os.path.isdir(directory):
+            raise ValueError(f"Directory not found: {directory}")
+
+        sources, skipped = [], []
+        for root, dirs, files in os.walk(directory):
+            if not recursive:
+                dirs.clear()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                relative_path = os.path.relpath(path, directory)
+                if not self._is_candidate(relative_path):
+                    continue
+                if not self._is_supported(filename):
+                    skipped.append({"filename": relative_path, "reason": "Unsupported file type"})
+                    continue
+                sources.append({
+                    "filename": filename,
+                    "display_path": relative_path,
+                    "path": path,
+                    "file_size": os.path.getsize(path)
+                })
+        return sources, skipped
+
+    def _write_original(self, source: Dict):
+        """Build a callable that streams the original file to its storage path"""
+        def write(target_path):
+            if source.get("zip_path"):
+                with zipfile.ZipFile(source["zip_path"]) as zf:
+                    with zf.open(source["member"]) as src, open(target_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+            else:
+                shutil.copyfile(source["path"], target_path)
+        return write
+
+    def _extract_all(self, sources: List[Dict]) -> Iterator[Tuple[Dict, Optional[str], Optional[str]]]:
+        """Yield (source, text, error) as each extraction finishes"""
+        if self.max_workers == 0:
+            for source in sources:
+                try:
+                    yield source, _extract_source(source), None
+                except Exception as e:
+                    yield source, None, str(e)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_extract_source_timed, source): source for source in sources}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    text, seconds = future.result()
+                    EXTRACTION_SECONDS.observe(seconds, format=source["filename"].split('.')[-1].lower())
+                    yield source, text, None
+                except Exception as e:
+                    yield source, None, str(e)
+
+    def ingest(self, sources: List[Dict], project_id: Optional[str] = None,
+               skipped: Optional[List[Dict]] = None) -> Iterator[Dict]:
+        """
+        Extract and store a list of sources, streaming progress events
+
+        Yields dicts with an "event" key:
+            "skipped"   - file was not attempted ("filename", "reason")
+            "extracted" - text extracted ("filename", "completed", "total")
+            "failed"    - extraction failed ("filename", "error", "completed", "total")
+            "done"      - batch stored ("documents", "failed", "skipped")
+        """
+        skipped = skipped or []
+        for entry in skipped:
+            yield {"event": "skipped", **entry}
+
+        total = len(sources)
+        completed = 0
+        entries = []
+        failed = []
+
+        for source, text, error in self._extract_all(sources):
+            completed += 1
+            if error:
+                failed.append({"filename": source["display_path"], "error": error})
+                yield {"event": "failed", "filename": source["display_path"], "error": error,
+                       "completed": completed, "total": total}
+                continue
+
+            entries.append({
+                "name": os.path.splitext(source["filename"])[0],
+                "extracted_text": text,
+                "original_filename": source["filename"],
+                "file_size": source["file_size"],
+                "file_type": mimetypes.guess_type(source["filename"])[0] or "application/octet-stream",
+                "write_original": self._write_original(source)
+            })
+            yield {"event": "extracted", "filename": source["display_path"],
+                   "completed": completed, "total": total}
+
+        documents = self.source_manager.add_documents(entries, project_id=project_id) if entries else []
+        yield {"event": "done", "documents": documents, "failed": failed, "skipped": skipped}
+
+    def ingest_directory(self, directory: str, project_id: Optional[str] = None,
+                         recursive: bool = True) -> Iterator[Dict]:
+        """Ingest every supported document in a server-side directory"""
+        sources, skipped = self.sources_from_directory(directory, recursive=recursive)
+        yield from self.ingest(sources, project_id=project_id, skipped=skipped)
+
+    def ingest_zip(self, zip_file, project_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Ingest every supported document in a ZIP archive
+
+        Args:
+            zip_file: Path to a ZIP file, or a file-like object such as a Streamlit UploadedFile
+        """
+        temp_path = None
+        try:
+            if isinstance(zip_file, str):
+                zip_path = zip_file
+            else:
+                # Spool uploads to disk so worker processes can open the archive themselves
+                zip_file.seek(0)
+                with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+                    shutil.copyfileobj(zip_file, tmp)
+                    temp_path = zip_path = tmp.name
+
+            if not zipfile.is_zipfile(zip_path):
+                raise ValueError("Uploaded file is not a valid ZIP archive")
+
+            sources, skipped = self.sources_from_zip(zip_path)
+            yield from self.ingest(sources, project_id=project_id, skipped=skipped)
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
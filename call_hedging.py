@@ -0,0 +1,150 @@
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, ContextManager, Dict, Optional
+from openai import APITimeoutError
+
+# Seconds before a completion call is abandoned, failovers and hedges included
+LLM_TIMEOUT_SECONDS = float(os.environ.get("PROMPTFLOW_LLM_TIMEOUT_SECONDS", "120"))
+# Send a duplicate request when a call is slower than the prompt's p95 latency
+HEDGING_ENABLED = os.environ.get("PROMPTFLOW_HEDGE", "off").lower() in ("on", "true", "1")
+# At most this fraction of calls may be duplicated
+HEDGE_MAX_RATE = float(os.environ.get("PROMPTFLOW_HEDGE_MAX_RATE", "0.05"))
+# Latency samples a prompt needs before its p95 is trusted
+HEDGE_MIN_SAMPLES = int(os.environ.get("PROMPTFLOW_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_SAMPLES = 200
+
+
+class LatencyTracker:
+    """Recent call latencies per key (e.g. per prompt), for percentile thresholds"""
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(percentile / 100 * len(samples)) - 1))
+        return samples[index]
+
+
+class CallHedger:
+    """
+    Cuts tail latency of completion calls with hedged requests.
+
+    A call that has not returned by the p95 latency seen for its key gets a
+    duplicate request, and whichever answers first is used (the other is left
+    to finish in the background and discarded). Duplicates are capped at
+    max_rate of all calls. Each call has one deadline that bounds both
+    requests. Issued and won hedges, errors and timeouts are counted in stats().
+    """
+
+    def __init__(self, enabled: bool = HEDGING_ENABLED, max_rate: float = HEDGE_MAX_RATE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, max_workers: int = 32):
+        self.enabled = enabled
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "timeouts": 0, "hedges_issued": 0, "hedges_won": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _allow_hedge(self) -> bool:
+        """Keep duplicates within max_rate of calls so far"""
+        with self._lock:
+            if self._stats["hedges_issued"] + 1 > self.max_rate * self._stats["calls"]:
+                return False
+            self._stats["hedges_issued"] += 1
+            return True
+
+    def _timed(self, key: str, call: Callable, deadline: float):
+        start = time.monotonic()
+        result = call(deadline)
+        self.latencies.record(key, time.monotonic() - start)
+        return result
+
+    def _hedge(self, key: str, call: Callable, deadline: float,
+               slot: Optional[Callable[[], ContextManager]], finished: threading.Event):
+        with slot() if slot else contextlib.nullcontext():
+            # Waiting for the slot may outlast the call itself
+            if finished.is_set():
+                return None
+            return self._timed(key, call, deadline)
+
+    def run(self, key: str, call: Callable, timeout: float = LLM_TIMEOUT_SECONDS,
+            hedge_slot: Optional[Callable[[], ContextManager]] = None):
+        """
+        Run call(deadline), hedging it if it is slow for its key
+
+        Args:
+            key: What latencies are compared by, usually the model and prompt
+            call: Function making the request by the given time.monotonic()
+                deadline; it must be safe to run twice
+            timeout: Seconds until the deadline, after which TimeoutError is raised
+            hedge_slot: Context manager factory the duplicate request runs
+                in, e.g. its own scheduler slot
+        """
+        self._count("calls")
+        deadline = time.monotonic() + timeout
+        threshold = self.latencies.percentile(key, 95, self.min_samples) if self.enabled else None
+        primary = self._executor.submit(self._timed, key, call, deadline)
+        pending = {primary}
+        # Set once run() returns, so a duplicate still waiting for its slot is never sent
+        finished = threading.Event()
+
+        try:
+            if threshold is not None:
+                done, _ = wait(pending, timeout=min(threshold, timeout))
+                if not done and time.monotonic() < deadline and self._allow_hedge():
+                    pending.add(self._executor.submit(self._hedge, key, call, deadline, hedge_slot, finished))
+
+            last_error = None
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Requests still running finish in the background and are discarded
+                    last_error = TimeoutError(f"No answer within {timeout:g} seconds")
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if future is not primary:
+                        self._count("hedges_won")
+                    return result
+        finally:
+            finished.set()
+
+        self._count("errors")
+        if isinstance(last_error, (APITimeoutError, TimeoutError)):
+            self._count("timeouts")
+        raise last_error
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedges_issued"] / stats["calls"] if stats["calls"] else 0.0
+        stats["enabled"] = self.enabled
+        return stats
+
+
+# Shared by every GPTHandler so latency history and the hedge budget are process-wide
+call_hedger = CallHedger()
@@ -1,8 +1,32 @@
+import contextlib
 import docx
 import io
 import logging
+import math
+import os
+import tempfile
+import time
 import PyPDF2
-from typing import Optional, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Optional, Dict, Any, Iterator, Tuple, List
+from docx_stream import extract_docx_text, docx_numbering
+from metrics import EXTRACTION_SECONDS
+
+# Pages read before a PdfReader drops the objects it has parsed, bounding memory on long PDFs
+PDF_PAGE_CHUNK = int(os.getenv('PDF_PAGE_CHUNK', '50'))
+# PDFs with at least this many pages are split across worker processes, one page range each
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '150'))
+# DOCX extractor for this deployment: "python-docx" (object model) or "streaming" (see docx_stream.py)
+DOCX_EXTRACTOR = os.getenv('DOCX_EXTRACTOR', 'python-docx')
+
+
+def _extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Process-pool worker: extract pages [start, end) of a PDF on disk with one reader"""
+    processor = DocumentProcessor(pdf_workers=0)
+    with processor._pdf_stream(pdf_path) as stream:
+        return list(processor._iter_pdf_range(stream, start, end))
+
 
 class DocumentProcessor:
     """
@@ -12,8 +36,22 @@ class DocumentProcessor:
 
     SUPPORTED_FORMATS = ['docx', 'pdf', 'txt']
 
-    def __init__(self):
+    DOCX_EXTRACTORS = ['python-docx', 'streaming']
+
+    def __init__(self, pdf_workers: Optional[int] = None, docx_extractor: Optional[str] = None):
+        """
+        Args:
+            pdf_workers: Processes used for large PDFs (None uses the CPU count, 0 disables)
+            docx_extractor: "python-docx" or "streaming"; defaults to the DOCX_EXTRACTOR setting
+        """
         self.logger = logging.getLogger(__name__)
+        self.pdf_workers = pdf_workers
+        self.docx_extractor = docx_extractor or DOCX_EXTRACTOR
+        if self.docx_extractor not in self.DOCX_EXTRACTORS:
+            raise ValueError(
+                f"Unknown DOCX extractor: {self.docx_extractor}. "
+                f"Choose from: {', '.join(self.DOCX_EXTRACTORS)}"
+            )
 
     def extract_text(self, uploaded_file) -> str:
         """
@@ -38,34 +76,7 @@ class DocumentProcessor:
 
             # Read the file content
             file_content = uploaded_file.read()
-            if not file_content:
-                raise ValueError("Uploaded file is empty")
-
-            # Determine file type based on extension
-            file_extension = uploaded_file.name.split('.')[-1].lower()
-
-            # Validate file type
-            if file_extension not in self.SUPPORTED_FORMATS:
-                raise ValueError(
-                    f"Unsupported file type: {file_extension}. "
-                    f"Supported formats: {', '.join(self.SUPPORTED_FORMATS)}"
-                )
-
-            # Process based on file type
-            extraction_methods = {
-                'docx': self._extract_from_docx,
-                'pdf': self._extract_from_pdf,
-                'txt': self._extract_from_txt
-            }
-
-            extracted_text = extraction_methods[file_extension](file_content)
-
-            # Validate extraction
-            if not extracted_text or not extracted_text.strip():
-                raise ValueError(f"No text could be extracted from the {file_extension} file")
-
-            self.logger.info(f"Successfully extracted {len(extracted_text)} characters")
-            return extracted_text
+            return self.extract_text_from_bytes(uploaded_file.name, file_content)
 
         except Exception as e:
             self.logger.error(f"Error processing document: {str(e)}")
@@ -75,8 +86,106 @@ class DocumentProcessor:
             if hasattr(uploaded_file, 'seek'):
                 uploaded_file.seek(0)
 
+    def extract_text_from_bytes(self, file_name: str, file_content: bytes) -> str:
+        """
+        Extract text from raw file content, choosing the extractor by extension.
+        Used directly by bulk ingest, where there is no UploadedFile object.
+
+        Raises:
+            ValueError: If file type is not supported or file is invalid
+        """
+        if not file_content:
+            raise ValueError("Uploaded file is empty")
+
+        file_extension = self._file_extension(file_name)
+
+        # Process based on file type
+        extraction_methods = {
+            'docx': self._extract_from_docx,
+            'pdf': self._extract_from_pdf,
+            'txt': self._extract_from_txt
+        }
+
+        start = time.perf_counter()
+        extracted_text = extraction_methods[file_extension](file_content)
+        EXTRACTION_SECONDS.observe(time.perf_counter() - start, format=file_extension)
+
+        # Validate extraction
+        if not extracted_text or not extracted_text.strip():
+            raise ValueError(f"No text could be extracted from the {file_extension} file")
+
+        self.logger.info(f"Successfully extracted {len(extracted_text)} characters")
+        return extracted_text
+
+    def extract_text_from_file(self, file_path: str, file_name: Optional[str] = None) -> str:
+        """
+        Extract text from a file on disk. PDFs are parsed from the file in page
+        chunks (across worker processes when large) instead of being loaded
+        into memory first; other formats are read whole.
+
+        Raises:
+            ValueError: If file type is not supported or file is invalid
+        """
+        file_name = file_name or os.path.basename(file_path)
+        if self._file_extension(file_name) != 'pdf':
+            with open(file_path, 'rb') as f:
+                return self.extract_text_from_bytes(file_name, f.read())
+        if os.path.getsize(file_path) == 0:
+            raise ValueError("Uploaded file is empty")
+
+        start = time.perf_counter()
+        try:
+            output = io.StringIO()
+            found = self._write_pdf_text(file_path, output)
+        except Exception as e:
+            self.logger.error(f"Error extracting from PDF: {str(e)}")
+            raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+        EXTRACTION_SECONDS.observe(time.perf_counter() - start, format="pdf")
+        if not found:
+            return "The PDF appears to contain no extractable text. It may be a scanned document or image-based PDF."
+        self.logger.info(f"Successfully extracted {output.tell()} characters")
+        return output.getvalue()
+
+    def _file_extension(self, file_name: str) -> str:
+        """Lower-case extension of a supported file name"""
+        file_extension = file_name.split('.')[-1].lower()
+        if file_extension not in self.SUPPORTED_FORMATS:
+            raise ValueError(
+                f"Unsupported file type: {file_extension}. "
+                f"Supported formats: {', '.join(self.SUPPORTED_FORMATS)}"
+            )
+        return file_extension
+
+    def extract_numbering(self, file_name: str, file_content: bytes) -> List[Dict]:
+        """
+        Resolve Word auto-numbering ("3.2", "(a)") for the paragraphs of a docx.
+        List numbers are not part of the extracted text, so the structure index
+        uses these to find clauses. Other formats, and unreadable files, give [].
+        """
+        if file_name.split('.')[-1].lower() != 'docx':
+            return []
+        try:
+            return docx_numbering(file_content)
+        except Exception as e:
+            self.logger.warning(f"Could not read docx numbering: {str(e)}")
+            return []
+
     def _extract_from_docx(self, file_content: bytes) -> str:
-        """Extract text from docx content"""
+        """Extract text from docx content with the configured extractor"""
+        if self.docx_extractor == 'streaming':
+            return self._extract_from_docx_streaming(file_content)
+        return self._extract_from_docx_object_model(file_content)
+
+    def _extract_from_docx_streaming(self, file_content: bytes) -> str:
+        """Extract text from docx content by streaming document.xml"""
+        try:
+            return extract_docx_text(file_content)
+        except Exception as e:
+            self.logger.error(f"Error extracting from DOCX: {str(e)}")
+            raise ValueError(f"Failed to extract text from Word document: {str(e)}")
+
+    def _extract_from_docx_object_model(self, file_content: bytes) -> str:
+        """Extract text from docx content using python-docx"""
         try:
             # Create a BytesIO object
             doc_bytes = io.BytesIO(file_content)
@@ -116,89 +225,171 @@ class DocumentProcessor:
             raise ValueError(f"Failed to extract text from Word document: {str(e)}")
 
     def _extract_from_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF content using PyPDF2 with fallback options"""
+        """Extract text from PDF content page by page, with per-page fallbacks"""
+        temp_path = None
         try:
-            # Create a BytesIO object from file content
-            pdf_bytes = io.BytesIO(file_content)
+            source = file_content
+            outline = self._pdf_outline(source)
 
-            # Try PyPDF2 first
-            try:
-                return self._extract_with_pypdf2(pdf_bytes)
-            except Exception as e:
-                self.logger.warning(f"PyPDF2 extraction failed: {str(e)}")
+            # Large PDFs are spooled to disk so worker processes can open them by page range
+            if self.pdf_workers != 0 and outline[1] >= PDF_PARALLEL_MIN_PAGES:
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                    tmp.write(file_content)
+                    temp_path = source = tmp.name
 
-                # Reset stream position
-                pdf_bytes.seek(0)
-
-                # Try alternative method if available
-                try:
-                    import pdfplumber
-                    return self._extract_with_pdfplumber(pdf_bytes)
-                except ImportError:
-                    self.logger.info("pdfplumber not available, using PyPDF2 result")
-                except Exception as e:
-                    self.logger.warning(f"pdfplumber extraction also failed: {str(e)}")
-
-                # Return whatever we got from PyPDF2
-                pdf_bytes.seek(0)
-                return self._extract_with_pypdf2(pdf_bytes, strict=False)
+            output = io.StringIO()
+            if not self._write_pdf_text(source, output, outline):
+                return "The PDF appears to contain no extractable text. It may be a scanned document or image-based PDF."
+            return output.getvalue()
 
         except Exception as e:
             self.logger.error(f"Error extracting from PDF: {str(e)}")
             raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
 
-    def _extract_with_pypdf2(self, pdf_bytes: io.BytesIO, strict: bool = True) -> str:
-        """Extract text using PyPDF2"""
-        pdf_reader = PyPDF2.PdfReader(pdf_bytes, strict=strict)
-
-        # Get document info
-        full_text = []
-        if pdf_reader.metadata:
-            if pdf_reader.metadata.title:
-                full_text.append(f"Title: {pdf_reader.metadata.title}\n")
-
-        # Extract text from all pages
-        total_pages = len(pdf_reader.pages)
-        for page_num in range(total_pages):
-            try:
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-
-                if page_text and page_text.strip():
-                    # Add page marker for multi-page documents
-                    if total_pages > 1:
-                        full_text.append(f"\n--- Page {page_num + 1} ---\n")
-                    full_text.append(page_text)
-            except Exception as e:
-                self.logger.warning(f"Error extracting page {page_num + 1}: {str(e)}")
-                if strict:
-                    raise
-
-        # Check if we got any text
-        if not full_text or (len(full_text) == 1 and full_text[0].startswith("Title:")):
-            return "The PDF appears to contain no extractable text. It may be a scanned document or image-based PDF."
+    @contextlib.contextmanager
+    def _pdf_stream(self, source) -> Iterator[io.IOBase]:
+        """
+        Seekable stream over a PDF given as a file path or bytes
+
+        A path is opened as a file rather than handed to PyPDF2, which would
+        read the whole file into memory; readers on the open file only read
+        the cross-reference table and the objects they are asked for.
+        """
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                yield f
+        else:
+            yield io.BytesIO(source)
+
+    def _open_pdf(self, stream, strict: bool = True) -> PyPDF2.PdfReader:
+        """Reader on a stream from _pdf_stream; strict parsing first, then lenient"""
+        if not strict:
+            return PyPDF2.PdfReader(stream, strict=False)
+        try:
+            return PyPDF2.PdfReader(stream)
+        except Exception as e:
+            self.logger.warning(f"Strict PDF parse failed, retrying leniently: {str(e)}")
+            return PyPDF2.PdfReader(stream, strict=False)
+
+    def _pdf_outline(self, source) -> Tuple[Optional[str], int]:
+        """(title, page count) of a PDF, from a reader that is discarded straight away"""
+        with self._pdf_stream(source) as stream:
+            reader = self._open_pdf(stream)
+            return (reader.metadata.title if reader.metadata else None), len(reader.pages)
 
-        return "\n".join(full_text)
+    def _write_pdf_text(self, source, output, outline: Optional[Tuple[Optional[str], int]] = None) -> bool:
+        """
+        Write the title and page text of a PDF to a text sink, page by page
 
-    def _extract_with_pdfplumber(self, pdf_bytes: io.BytesIO) -> str:
-        """Extract text using pdfplumber (better for complex PDFs)"""
-        import pdfplumber
+        Args:
+            outline: (title, page count) if the caller already has it (see _pdf_outline)
+        """
+        # Pages are read by iter_pdf_pages, so only the outline is read here
+        title, total_pages = outline or self._pdf_outline(source)
 
-        full_text = []
-        with pdfplumber.open(pdf_bytes) as pdf:
-            # Add metadata if available
-            if pdf.metadata.get('Title'):
-                full_text.append(f"Title: {pdf.metadata['Title']}\n")
+        parts_written = 0
+        has_page_text = False
 
-            # Extract from each page
-            for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    if len(pdf.pages) > 1:
-                        full_text.append(f"\n--- Page {i + 1} ---\n")
-                    full_text.append(page_text)
+        def write(part):
+            nonlocal parts_written
+            if parts_written:
+                output.write("\n")
+            output.write(part)
+            parts_written += 1
 
-        return "\n".join(full_text) if full_text else "No text could be extracted from PDF"
+        if title:
+            write(f"Title: {title}\n")
+
+        for page_index, page_text in self.iter_pdf_pages(source, total_pages):
+            if page_text and page_text.strip():
+                # Add page marker for multi-page documents
+                if total_pages > 1:
+                    write(f"\n--- Page {page_index + 1} ---\n")
+                write(page_text)
+                has_page_text = True
+
+        return has_page_text
+
+    def iter_pdf_pages(self, source, total_pages: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page_index, text) for every page of a PDF, in order
+
+        A path is read through one open file, so only the parts of the PDF a
+        page needs are read from disk. The pages are read by a single reader,
+        or for large PDFs on disk by one reader per worker process over its
+        own page range (see _iter_pdf_range).
+        """
+        with self._pdf_stream(source) as stream:
+            if total_pages is None:
+                total_pages = len(self._open_pdf(stream, strict=False).pages)
+
+            workers = self.pdf_workers or os.cpu_count() or 1
+            parallel = (
+                isinstance(source, str)
+                and self.pdf_workers != 0
+                and total_pages >= PDF_PARALLEL_MIN_PAGES
+                and workers > 1
+            )
+            if parallel:
+                size = max(PDF_PAGE_CHUNK, math.ceil(total_pages / workers))
+                starts = list(range(0, total_pages, size))
+                ends = [min(start + size, total_pages) for start in starts]
+                with ProcessPoolExecutor(max_workers=len(starts)) as executor:
+                    # map() yields the ranges in page order as they complete
+                    for pages in executor.map(_extract_pdf_page_range, repeat(source), starts, ends):
+                        yield from pages
+            else:
+                yield from self._iter_pdf_range(stream, 0, total_pages)
+
+    def _iter_pdf_range(self, stream, start: int, end: int) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page_index, text) for pages [start, end) of a _pdf_stream, retrying only failing pages
+
+        One reader serves the whole range; every PDF_PAGE_CHUNK pages it drops
+        the objects it has parsed (content streams, fonts), which it re-reads
+        from the stream if a later page needs them.
+        """
+        reader = self._open_pdf(stream)
+
+        fallbacks = {}
+        try:
+            for page_index in range(start, end):
+                if page_index > start and (page_index - start) % PDF_PAGE_CHUNK == 0:
+                    reader.resolved_objects.clear()
+                try:
+                    page_text = reader.pages[page_index].extract_text()
+                except Exception as e:
+                    self.logger.warning(f"Error extracting page {page_index + 1}: {str(e)}")
+                    page_text = self._extract_page_with_fallbacks(stream, page_index, fallbacks)
+                yield page_index, page_text or ""
+        finally:
+            if "pdfplumber" in fallbacks:
+                fallbacks["pdfplumber"].close()
+
+    def _extract_page_with_fallbacks(self, stream, page_index: int, fallbacks: Dict) -> str:
+        """Retry a single page with pdfplumber if available, then lenient PyPDF2"""
+        try:
+            import pdfplumber
+            if "pdfplumber" not in fallbacks:
+                # Its own handle on the file (or copy of the bytes), so the readers don't share a position
+                fallbacks["pdfplumber"] = pdfplumber.open(
+                    stream.name if isinstance(getattr(stream, 'name', None), str) else io.BytesIO(stream.getvalue()))
+            return fallbacks["pdfplumber"].pages[page_index].extract_text() or ""
+        except ImportError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"pdfplumber also failed on page {page_index + 1}: {str(e)}")
+
+        try:
+            if "lenient" not in fallbacks:
+                fallbacks["lenient"] = self._open_pdf(stream, strict=False)
+            return fallbacks["lenient"].pages[page_index].extract_text() or ""
+        except Exception as e:
+            self.logger.warning(f"Skipping unreadable page {page_index + 1}: {str(e)}")
+            return ""
 
     def _extract_from_txt(self, file_content: bytes) -> str:
         """Extract text from plain text file"""
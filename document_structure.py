@@ -0,0 +1,198 @@
+import json
+import re
+from typing import List, Dict, Optional
+
+STRUCTURE_VERSION = 1
+
+PAGE_MARKER = re.compile(r"^--- Page (\d+) ---$")
+TABLE_MARKER = re.compile(r"^\[Table (\d+)\]$")
+# "3", "3.2", "3.2.1" at the start of a line, optionally followed by "." or ")"
+CLAUSE_NUMBER = re.compile(r"^\s*((?:\d{1,3})(?:\.\d{1,3})*)[.)]?\s+(\S.*)$")
+DOTTED_LABEL = re.compile(r"^\d{1,3}(?:\.\d{1,3})*\.?$")
+# How far ahead to look for the next numbered paragraph when lines do not line up
+NUMBERING_LOOKAHEAD = 3
+
+
+def _is_heading(line: str) -> bool:
+    """Heuristic: short line without closing punctuation that is capitalised like a heading"""
+    stripped = line.strip()
+    if not 3 <= len(stripped) <= 80 or stripped[-1] in ".,;:":
+        return False
+    letters = [c for c in stripped if c.isalpha()]
+    if not letters:
+        return False
+    if stripped.isupper():
+        return True
+    words = [w for w in re.findall(r"[A-Za-z][A-Za-z'’-]*", stripped)]
+    if not words or len(words) > 8:
+        return False
+    small = {"and", "or", "of", "the", "to", "in", "on", "for", "a", "an", "by", "with"}
+    capitalised = sum(1 for w in words if w[0].isupper() or w.lower() in small)
+    return capitalised == len(words) and words[0][0].isupper()
+
+
+def _line_key(line: str) -> str:
+    """Compare lines ignoring spacing and punctuation, which text normalisation may change"""
+    return re.sub(r"[\W_]+", "", line).lower()
+
+
+def _clause_numbers(numbering: List[Dict]) -> List[Dict]:
+    """
+    Turn list labels into clause numbers, qualifying lettered sub-items with
+    their parent so "(a)" under clause 3.8.1 becomes "3.8.1(a)"
+    """
+    path = {}
+    clauses = []
+    for item in numbering:
+        label, level = item["label"], item.get("level", 0)
+        if DOTTED_LABEL.match(label):
+            number = label.rstrip(".")
+        else:
+            parents = [path[l] for l in sorted(path) if l < level]
+            number = (parents[-1] if parents else "") + label
+        path = {l: n for l, n in path.items() if l < level}
+        path[level] = number
+        clauses.append({
+            "line": _line_key(item["text"].strip().split("\n")[0]),
+            "number": number,
+            "level": level
+        })
+    return clauses
+
+
+def build_structure(text: str, numbering: Optional[List[Dict]] = None) -> Dict:
+    """
+    Build a compact structural index of extracted text
+
+    All offsets are UTF-8 byte offsets into the stored .txt file, as
+    [start, end) pairs, so readers can seek straight to a range.
+
+    Args:
+        text: Extracted document text
+        numbering: Optional auto-numbered paragraphs in document order, as
+            returned by docx_stream.docx_numbering; Word list numbers are not
+            part of the text, so without them clauses come from the text alone
+
+    Returns:
+        Dict with "pages", "paragraphs", "tables", "headings" and "clauses"
+    """
+    pages = []
+    paragraphs = []
+    tables = []
+    headings = []
+    clauses = []
+
+    numbered = _clause_numbers(numbering or [])
+    next_numbered = 0
+
+    open_page = None
+    open_table = None
+    offset = 0
+    total = len(text.encode("utf-8"))
+
+    for line in text.split("\n"):
+        start = offset
+        end = start + len(line.encode("utf-8"))
+        offset = end + 1  # The newline separator
+        stripped = line.strip()
+
+        page_match = PAGE_MARKER.match(stripped)
+        if page_match:
+            if open_page:
+                open_page[2] = start
+            open_page = [int(page_match.group(1)), offset, total]
+            pages.append(open_page)
+            continue
+
+        table_match = TABLE_MARKER.match(stripped)
+        if table_match:
+            open_table = [int(table_match.group(1)), start, end]
+            tables.append(open_table)
+            continue
+
+        if not stripped:
+            open_table = None
+            continue
+
+        if open_table:
+            # Table rows are the lines following the [Table N] marker
+            open_table[2] = end
+            continue
+
+        paragraphs.append([start, end])
+
+        hint = None
+        key = _line_key(stripped) if numbered else None
+        for candidate in range(next_numbered, min(next_numbered + NUMBERING_LOOKAHEAD, len(numbered))):
+            if numbered[candidate]["line"] == key:
+                hint = numbered[candidate]
+                next_numbered = candidate + 1
+                break
+
+        clause_match = None if hint else CLAUSE_NUMBER.match(line)
+        if hint:
+            clauses.append({
+                "number": hint["number"],
+                "level": hint["level"],
+                "title": stripped[:80],
+                "start": start,
+                "end": total
+            })
+        elif clause_match:
+            clauses.append({
+                "number": clause_match.group(1),
+                "level": clause_match.group(1).count("."),
+                "title": clause_match.group(2).strip()[:80],
+                "start": start,
+                "end": total
+            })
+        elif stripped.startswith("Title: ") or _is_heading(line):
+            headings.append([stripped[:80], start, end])
+
+    # A clause runs until the next clause at the same or a shallower level
+    open_clauses = []
+    for clause in clauses:
+        while open_clauses and open_clauses[-1]["level"] >= clause["level"]:
+            open_clauses.pop()["end"] = clause["start"]
+        open_clauses.append(clause)
+
+    return {
+        "version": STRUCTURE_VERSION,
+        "text_bytes": total,
+        "pages": [{"number": n, "start": s, "end": e} for n, s, e in pages],
+        "paragraphs": paragraphs,
+        "tables": [{"number": n, "start": s, "end": e} for n, s, e in tables],
+        "headings": [{"text": t, "start": s, "end": e} for t, s, e in headings],
+        "clauses": clauses
+    }
+
+
+def save_structure(structure: Dict, path: str):
+    """Write a structure index to disk without indentation to keep it compact"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(structure, f, separators=(",", ":"))
+
+
+def load_structure(path: str) -> Optional[Dict]:
+    """Read a structure index, returning None if it is missing or outdated"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            structure = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return structure if structure.get("version") == STRUCTURE_VERSION else None
+
+
+def find_range(structure: Dict, clause: Optional[str] = None, page: Optional[int] = None,
+               table: Optional[int] = None) -> Optional[List[int]]:
+    """Look up the [start, end) byte range of a clause number, page or table"""
+    if clause is not None:
+        entries, key, value = structure.get("clauses", []), "number", clause
+    elif page is not None:
+        entries, key, value = structure.get("pages", []), "number", page
+    elif table is not None:
+        entries, key, value = structure.get("tables", []), "number", table
+    else:
+        return None
+    entry = next((e for e in entries if e[key] == value), None)
+    return [entry["start"], entry["end"]] if entry else None
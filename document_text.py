@@ -0,0 +1,164 @@
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Callable
+
+# Total size of decoded document text kept in memory across all sessions
+TEXT_CACHE_BYTES = int(os.environ.get("DOCUMENT_TEXT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+def read_text_range(path: str, offset: int = 0, length: Optional[int] = None) -> str:
+    """
+    Read part of a UTF-8 text file through a memory map
+
+    Offsets and lengths are in bytes. A character cut in half at either end of
+    the range is dropped rather than decoded as garbage.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or offset >= size:
+            return ""
+        end = size if length is None else min(size, offset + length)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = mapped[max(0, offset):end]
+
+    return data.decode('utf-8', errors='ignore' if (offset > 0 or end < size) else 'strict')
+
+
+class DocumentTextCache:
+    """
+    Process-wide LRU cache of decoded document text, bounded by total bytes
+    rather than entry count so a few very large leases cannot exhaust memory.
+    Entries are sized by the decoded str in memory (up to 4 bytes a character),
+    not by the file. They are keyed by path and invalidated when the file's
+    size or modification time changes.
+    """
+
+    def __init__(self, max_bytes: int = TEXT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> ((size, mtime), text, bytes in memory)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, float]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    def get(self, path: str) -> str:
+        """Return the full text of a file, reading it on a miss"""
+        return self.lookup(path)[0]
+
+    def lookup(self, path: str) -> Tuple[str, bool]:
+        """(full text of a file, whether it came from the cache)"""
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        size = sys.getsizeof(text)
+        with self._lock:
+            self._discard(path)
+            if size <= self.max_bytes:
+                self._entries[path] = (signature, text, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._discard(oldest)
+        return text, False
+
+    def peek(self, path: str) -> Optional[str]:
+        """Return cached text without reading the file or changing LRU order"""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        try:
+            return entry[1] if entry[0] == self._signature(path) else None
+        except OSError:
+            return None
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._discard(path)
+
+    def _discard(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Shared by every SourceDocumentManager, i.e. by every Streamlit session
+text_cache = DocumentTextCache()
+
+
+class DocumentTextHandle:
+    """
+    Lightweight reference to a document's extracted text. Session state keeps
+    these instead of full text copies; the text itself lives in the shared
+    cache or is read in ranges straight from disk.
+    """
+
+    def __init__(self, document_id: str, name: str, text_path: str, cache: DocumentTextCache = text_cache,
+                 resolve: Optional[Callable[[str], Optional[str]]] = None):
+        """
+        Args:
+            resolve: Looks up the document's current text path by ID, for when
+                     the file has moved (e.g. to another project) since
+        """
+        self.document_id = document_id
+        self.name = name
+        self.text_path = text_path
+        self.cache = cache
+        self.resolve = resolve
+
+    def _on_current_path(self, read: Callable[[str], object]):
+        """Call read(text_path), following the document once if its file has moved"""
+        try:
+            return read(self.text_path)
+        except FileNotFoundError:
+            current = self.resolve(self.document_id) if self.resolve else None
+            if not current or current == self.text_path:
+                raise
+            self.text_path = current
+            return read(current)
+
+    @property
+    def size(self) -> int:
+        """Size of the text in bytes"""
+        return self._on_current_path(os.path.getsize)
+
+    def text(self) -> str:
+        """Full document text (served from the shared cache)"""
+        return self._on_current_path(self.cache.get)
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> str:
+        """Read a byte range of the text without loading the whole document"""
+        cached = self.cache.peek(self.text_path)
+        if cached is not None and offset == 0 and length is None:
+            return cached
+        return self._on_current_path(lambda path: read_text_range(path, offset, length))
+
+    def __repr__(self):
+        return f"DocumentTextHandle({self.document_id!r}, {self.name!r})"
@@ -0,0 +1,329 @@
+"""
+Streaming DOCX text extraction that reads word/document.xml straight from the
+zip with an incremental parser, following python-docx's text rules.
+"""
+import io
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+W_BODY, W_P, W_TBL, W_TR, W_TC = _w("body"), _w("p"), _w("tbl"), _w("tr"), _w("tc")
+W_R, W_HYPERLINK, W_T = _w("r"), _w("hyperlink"), _w("t")
+W_TAB, W_PTAB, W_BR, W_CR, W_NO_BREAK_HYPHEN = _w("tab"), _w("ptab"), _w("br"), _w("cr"), _w("noBreakHyphen")
+W_TCPR, W_TRPR, W_GRID_SPAN, W_GRID_BEFORE, W_VMERGE = (
+    _w("tcPr"), _w("trPr"), _w("gridSpan"), _w("gridBefore"), _w("vMerge")
+)
+W_VAL, W_TYPE = _w("val"), _w("type")
+
+
+def _run_text(run: ET.Element) -> str:
+    """Text equivalent of a w:r element"""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag in (W_TAB, W_PTAB):
+            parts.append("\t")
+        elif tag == W_BR:
+            # Only text-wrapping breaks produce a newline; page and column breaks are dropped
+            parts.append("\n" if child.get(W_TYPE, "textWrapping") == "textWrapping" else "")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def paragraph_text(paragraph: ET.Element) -> str:
+    """Text of a w:p element from its direct runs and hyperlinks"""
+    parts = []
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return "".join(parts)
+
+
+def _int_val(parent: Optional[ET.Element], tag: str, default: int) -> int:
+    element = parent.find(tag) if parent is not None else None
+    if element is None:
+        return default
+    try:
+        return int(element.get(W_VAL, default))
+    except ValueError:
+        return default
+
+
+def table_rows(table: ET.Element) -> Iterator[List[str]]:
+    """Yield the cell texts of each row of a w:tbl, one entry per layout-grid column"""
+    above: Dict[int, str] = {}  # grid offset -> text of the cell occupying it in the row above
+    for row in table.findall(W_TR):
+        offset = _int_val(row.find(W_TRPR), W_GRID_BEFORE, 0)
+        current: Dict[int, str] = {}
+        cells = []
+        for cell in row.findall(W_TC):
+            tc_pr = cell.find(W_TCPR)
+            span = _int_val(tc_pr, W_GRID_SPAN, 1)
+            v_merge = tc_pr.find(W_VMERGE) if tc_pr is not None else None
+
+            if v_merge is not None and v_merge.get(W_VAL, "continue") == "continue":
+                text = above.get(offset, "")
+            else:
+                text = "\n".join(paragraph_text(p) for p in cell.findall(W_P))
+
+            current[offset] = text
+            cells.extend([text] * span)
+            offset += span
+        above = current
+        yield cells
+
+
+def _main_document_part(archive: zipfile.ZipFile) -> str:
+    """Locate the main document part through the package relationships"""
+    try:
+        rels = ET.fromstring(archive.read("_rels/.rels"))
+        for rel in rels.iter(f"{{{REL_NS}}}Relationship"):
+            if rel.get("Type") == OFFICE_DOCUMENT_REL:
+                return posixpath.normpath(rel.get("Target", "").lstrip("/"))
+    except KeyError:
+        pass
+    return "word/document.xml"
+
+
+def _core_title(archive: zipfile.ZipFile) -> str:
+    """Document title from docProps/core.xml, or an empty string"""
+    try:
+        core = ET.fromstring(archive.read("docProps/core.xml"))
+    except (KeyError, ET.ParseError):
+        return ""
+    title = core.find(f"{{{DC_NS}}}title")
+    return (title.text or "") if title is not None else ""
+
+
+def _iter_body_elements(archive: zipfile.ZipFile) -> Iterator[ET.Element]:
+    """Yield each completed body-level element, discarding it once the caller moves on"""
+    with archive.open(_main_document_part(archive)) as stream:
+        depth_stack = []
+        body = None
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                depth_stack.append(element)
+                if element.tag == W_BODY:
+                    body = element
+                continue
+
+            depth_stack.pop()
+            parent = depth_stack[-1] if depth_stack else None
+            if parent is None or parent is not body:
+                continue
+
+            yield element
+            # Drop the finished block so the parsed tree never grows past one block
+            body.remove(element)
+
+
+def iter_docx_blocks(archive: zipfile.ZipFile) -> Iterator[Tuple[str, object]]:
+    """
+    Yield body-level blocks in document order:
+    ("paragraph", text) or ("table", [row cell lists])
+    """
+    for element in _iter_body_elements(archive):
+        if element.tag == W_P:
+            yield "paragraph", paragraph_text(element)
+        elif element.tag == W_TBL:
+            yield "table", list(table_rows(element))
+
+
+def _to_roman(number: int) -> str:
+    numerals = [(1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+                (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i")]
+    result = []
+    for value, numeral in numerals:
+        while number >= value:
+            result.append(numeral)
+            number -= value
+    return "".join(result)
+
+
+def _format_number(number: int, num_fmt: str) -> Optional[str]:
+    """Render a list counter in a Word numFmt; None for bullets and unsupported formats"""
+    if num_fmt in ("decimal", "decimalZero"):
+        return str(number) if num_fmt == "decimal" else f"{number:02d}"
+    if num_fmt in ("lowerLetter", "upperLetter"):
+        letter = chr(ord("a") + (number - 1) % 26) * ((number - 1) // 26 + 1)
+        return letter if num_fmt == "lowerLetter" else letter.upper()
+    if num_fmt in ("lowerRoman", "upperRoman"):
+        roman = _to_roman(number)
+        return roman if num_fmt == "lowerRoman" else roman.upper()
+    return None
+
+
+class _ListNumbering:
+    """Resolves w:numPr references to rendered list labels such as "3.2" or "(a)"
+    """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.levels = {}           # abstractNumId -> {ilvl: (start, numFmt, lvlText)}
+        self.nums = {}             # numId -> (abstractNumId, {ilvl: startOverride})
+        self.style_numbering = {}  # styleId -> (numId, ilvl)
+        self.counters = {}         # abstractNumId -> {ilvl: current value}
+        self._load_numbering(archive)
+        self._load_styles(archive)
+
+    def _load_numbering(self, archive: zipfile.ZipFile):
+        try:
+            root = ET.fromstring(archive.read("word/numbering.xml"))
+        except (KeyError, ET.ParseError):
+            return
+        for abstract in root.findall(_w("abstractNum")):
+            levels = {}
+            for lvl in abstract.findall(_w("lvl")):
+                start = lvl.find(_w("start"))
+                num_fmt = lvl.find(_w("numFmt"))
+                lvl_text = lvl.find(_w("lvlText"))
+                levels[int(lvl.get(_w("ilvl"), 0))] = (
+                    int(start.get(W_VAL, 1)) if start is not None else 1,
+                    num_fmt.get(W_VAL, "decimal") if num_fmt is not None else "decimal",
+                    lvl_text.get(W_VAL, "") if lvl_text is not None else ""
+                )
+            self.levels[abstract.get(_w("abstractNumId"))] = levels
+        for num in root.findall(_w("num")):
+            abstract_id = num.find(_w("abstractNumId"))
+            overrides = {}
+            for override in num.findall(_w("lvlOverride")):
+                start_override = override.find(_w("startOverride"))
+                if start_override is not None:
+                    overrides[int(override.get(_w("ilvl"), 0))] = int(start_override.get(W_VAL, 1))
+            if abstract_id is not None:
+                self.nums[num.get(_w("numId"))] = (abstract_id.get(W_VAL), overrides)
+
+    def _load_styles(self, archive: zipfile.ZipFile):
+        try:
+            root = ET.fromstring(archive.read("word/styles.xml"))
+        except (KeyError, ET.ParseError):
+            return
+        for style in root.findall(_w("style")):
+            num_pr = style.find(f"{_w('pPr')}/{_w('numPr')}")
+            if num_pr is not None:
+                num_id = num_pr.find(_w("numId"))
+                ilvl = num_pr.find(_w("ilvl"))
+                self.style_numbering[style.get(_w("styleId"))] = (
+                    num_id.get(W_VAL) if num_id is not None else None,
+                    int(ilvl.get(W_VAL, 0)) if ilvl is not None else 0
+                )
+
+    def label_for(self, paragraph: ET.Element) -> Optional[Tuple[str, int]]:
+        """Advance the list counters for a paragraph and return (label, level), if numbered"""
+        p_pr = paragraph.find(_w("pPr"))
+        if p_pr is None:
+            return None
+        num_id, ilvl = None, 0
+        style = p_pr.find(_w("pStyle"))
+        if style is not None and style.get(W_VAL) in self.style_numbering:
+            num_id, ilvl = self.style_numbering[style.get(W_VAL)]
+        num_pr = p_pr.find(_w("numPr"))
+        if num_pr is not None:
+            num_id_el, ilvl_el = num_pr.find(_w("numId")), num_pr.find(_w("ilvl"))
+            if num_id_el is not None:
+                num_id = num_id_el.get(W_VAL)
+            if ilvl_el is not None:
+                ilvl = int(ilvl_el.get(W_VAL, 0))
+
+        if not num_id or num_id == "0" or num_id not in self.nums:
+            return None
+        abstract_id, overrides = self.nums[num_id]
+        levels = self.levels.get(abstract_id, {})
+        if ilvl not in levels:
+            return None
+
+        counters = self.counters.setdefault(abstract_id, {})
+        start = overrides.get(ilvl, levels[ilvl][0])
+        counters[ilvl] = counters[ilvl] + 1 if ilvl in counters else start
+        for deeper in [level for level in counters if level > ilvl]:
+            del counters[deeper]
+
+        label = levels[ilvl][2]
+        for level in range(ilvl + 1):
+            placeholder = f"%{level + 1}"
+            if placeholder not in label:
+                continue
+            level_start, level_fmt, _ = levels.get(level, (1, "decimal", ""))
+            rendered = _format_number(counters.get(level, level_start), level_fmt)
+            if rendered is None:
+                return None
+            label = label.replace(placeholder, rendered)
+        label = label.strip()
+        return (label, ilvl) if label else None
+
+
+def docx_numbering(file_content: bytes) -> List[Dict]:
+    """
+    List the auto-numbered body paragraphs of a docx in document order
+
+    Word list numbers such as "3.2" are not part of the paragraph text, so this
+    resolves them from numbering.xml and styles.xml.
+
+    Returns:
+        [{"text": paragraph text, "label": "3.2", "level": 1}, ...]
+    """
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        numbering = _ListNumbering(archive)
+        if not numbering.nums:
+            return []
+        numbered = []
+        for element in _iter_body_elements(archive):
+            if element.tag != W_P:
+                continue
+            resolved = numbering.label_for(element)
+            text = paragraph_text(element)
+            if resolved and text.strip():
+                numbered.append({"text": text, "label": resolved[0], "level": resolved[1]})
+        return numbered
+
+
+def extract_docx_text(file_content: bytes) -> str:
+    """
+    Extract text from docx content in the same layout as the python-docx extractor:
+    optional title line, non-empty paragraphs, then each table as "[Table N]"
+    followed by its non-empty cells joined with " | ".
+    """
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        full_text = []
+
+        title = _core_title(archive)
+        if title:
+            full_text.append(f"Title: {title}\n")
+
+        table_text = []
+        table_count = 0
+        for kind, block in iter_docx_blocks(archive):
+            if kind == "paragraph":
+                if block.strip():
+                    full_text.append(block)
+                continue
+
+            table_count += 1
+            lines = [f"\n[Table {table_count}]"]
+            for cells in block:
+                row_text = [cell.strip() for cell in cells if cell.strip()]
+                if row_text:
+                    lines.append(" | ".join(row_text))
+            if len(lines) > 1:
+                table_text.extend(lines)
+
+        # Tables follow the paragraphs, matching the python-docx extractor's output
+        full_text.extend(table_text)
+        return "\n".join(full_text)
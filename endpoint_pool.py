@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import List, Dict, Optional
+from openai import OpenAI, AzureOpenAI, RateLimitError, APIStatusError, APIConnectionError, APITimeoutError
+
+# JSON list of endpoints, or a path to a JSON file holding one (see EndpointPool.from_config)
+LLM_ENDPOINTS = os.environ.get("PROMPTFLOW_LLM_ENDPOINTS", "")
+
+# Seconds an endpoint is rested after a 429 without a Retry-After header
+THROTTLE_COOLDOWN_SECONDS = 10.0
+# Consecutive errors before an endpoint is taken out of rotation, and for how long (doubling)
+FAILURE_THRESHOLD = 3
+FAILURE_COOLDOWN_SECONDS = 15.0
+MAX_COOLDOWN_SECONDS = 300.0
+# Smoothing of the latency average (weight of the newest sample)
+LATENCY_ALPHA = 0.2
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+class Endpoint:
+    """One OpenAI or Azure OpenAI deployment and its live health"""
+
+    def __init__(self, name: str, client, weight: float = 1.0, deployments: Optional[Dict[str, str]] = None,
+                 deployment: Optional[str] = None):
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.deployments = deployments or {}
+        self.deployment = deployment
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.remaining_requests = None
+        self.limit_requests = None
+        self.remaining_tokens = None
+        self.limit_tokens = None
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def model_for(self, model: str) -> Optional[str]:
+        """Deployment/model name to send for a requested model (None if not served here)"""
+        if model in self.deployments:
+            return self.deployments[model]
+        if self.deployments and not self.deployment:
+            return None
+        return self.deployment or model
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def score(self) -> float:
+        """Routing weight: configured weight scaled by remaining quota and inverse latency"""
+        quota = 1.0
+        if self.remaining_requests is not None and self.limit_requests:
+            quota = min(quota, self.remaining_requests / self.limit_requests)
+        if self.remaining_tokens is not None and self.limit_tokens:
+            quota = min(quota, self.remaining_tokens / self.limit_tokens)
+        latency = self.latency or 1.0
+        return self.weight * max(quota, 0.01) / max(latency, 0.05)
+
+    def record_headers(self, headers):
+        """Track the rate limit headers OpenAI and Azure return with each response"""
+        for attribute, header in [("remaining_requests", "x-ratelimit-remaining-requests"),
+                                  ("limit_requests", "x-ratelimit-limit-requests"),
+                                  ("remaining_tokens", "x-ratelimit-remaining-tokens"),
+                                  ("limit_tokens", "x-ratelimit-limit-tokens")]:
+            value = headers.get(header) if headers else None
+            if value is not None:
+                try:
+                    setattr(self, attribute, int(value))
+                except ValueError:
+                    pass
+
+    def stats(self, now: float) -> Dict:
+        return {
+            "name": self.name,
+            "weight": self.weight,
+            "state": "available" if self.available(now) else "cooling down",
+            "cooldown_seconds": max(0.0, round(self.cooldown_until - now, 1)),
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "latency_seconds": round(self.latency, 3) if self.latency is not None else None,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "last_error": self.last_error
+        }
+
+
+class EndpointPool:
+    """
+    Routes completion calls across several OpenAI/Azure deployments.
+
+    Each call picks an endpoint at random, weighted by its configured weight,
+    its remaining rate-limit quota (from the x-ratelimit headers) and its
+    recent latency. A throttled (429) endpoint is rested for its Retry-After
+    time and erroring endpoints are taken out of rotation after repeated
+    failures; the call itself fails over to the next endpoint straight away.
+    """
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: List[Dict]) -> "EndpointPool":
+        """
+        Build a pool from endpoint settings, e.g.
+
+            [{"name": "azure-uk", "provider": "azure", "endpoint": "https://...openai.azure.com",
+              "api_key_env": "AZURE_UK_KEY", "api_version": "2024-02-01",
+              "deployments": {"gpt-4o": "gpt4o-prod"}, "weight": 2},
+             {"name": "openai", "provider": "openai", "api_key_env": "OPENAI_API_KEY"}]
+        """
+        endpoints = []
+        for index, settings in enumerate(config):
+            provider = settings.get("provider", "openai")
+            api_key = os.getenv(settings["api_key_env"]) if settings.get("api_key_env") else settings.get("api_key")
+            if provider == "azure":
+                client = AzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=settings["endpoint"],
+                    api_version=settings.get("api_version", "2024-02-01"),
+                    max_retries=0
+                )
+            elif provider == "openai":
+                client = OpenAI(api_key=api_key, base_url=settings.get("base_url"), max_retries=0)
+            else:
+                raise ValueError(f"Unknown endpoint provider: {provider}. Choose from: openai, azure")
+            name = settings.get("name", f"{provider}-{index + 1}")
+            weight = float(settings.get("weight", 1.0))
+            # A zero weight would never be picked, and a pool of them cannot be picked from at all
+            if weight <= 0:
+                raise ValueError(f"Endpoint {name} has weight {weight}; weights must be positive "
+                                 f"(remove the endpoint to take it out of rotation)")
+            endpoints.append(Endpoint(
+                name,
+                client,
+                weight=weight,
+                deployments=settings.get("deployments"),
+                deployment=settings.get("deployment")
+            ))
+        return cls(endpoints)
+
+    @classmethod
+    def from_environment(cls, default_client) -> "EndpointPool":
+        """
+        The pool configured by PROMPTFLOW_LLM_ENDPOINTS, shared by every handler
+        in the process so endpoint health is learnt once; without it, a pool of
+        just the handler's own client
+        """
+        global _shared_pool
+        if not LLM_ENDPOINTS.strip():
+            return cls([Endpoint("default", default_client)])
+        with _shared_pool_lock:
+            if _shared_pool is None:
+                if LLM_ENDPOINTS.strip().startswith("["):
+                    config = json.loads(LLM_ENDPOINTS)
+                else:
+                    with open(LLM_ENDPOINTS, 'r') as f:
+                        config = json.load(f)
+                _shared_pool = cls.from_config(config)
+            return _shared_pool
+
+    def _candidates(self, model: str) -> List[Endpoint]:
+        """Endpoints serving the model, in the order they should be tried"""
+        now = time.monotonic()
+        with self._lock:
+            serving = [e for e in self.endpoints if e.model_for(model)]
+            available = [e for e in serving if e.available(now)]
+            ordered = []
+            # Weighted random order without replacement
+            while available:
+                chosen = random.choices(available, weights=[e.score() for e in available])[0]
+                available.remove(chosen)
+                ordered.append(chosen)
+            # If everything is resting, still try the one that recovers first
+            resting = sorted((e for e in serving if not e.available(now)), key=lambda e: e.cooldown_until)
+        return ordered + resting
+
+    def _record_success(self, endpoint: Endpoint, elapsed: float, headers):
+        with self._lock:
+            endpoint.successes += 1
+            endpoint.consecutive_failures = 0
+            endpoint.latency = elapsed if endpoint.latency is None else (
+                LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * endpoint.latency)
+            endpoint.record_headers(headers)
+
+    def _record_failure(self, endpoint: Endpoint, error: Exception):
+        now = time.monotonic()
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.last_error = str(error)[:200]
+            if isinstance(error, RateLimitError):
+                endpoint.throttled += 1
+                retry_after = None
+                try:
+                    retry_after = float(error.response.headers.get("retry-after"))
+                except (AttributeError, TypeError, ValueError):
+                    pass
+                endpoint.cooldown_until = now + (retry_after or THROTTLE_COOLDOWN_SECONDS)
+                return
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= FAILURE_THRESHOLD:
+                backoff = FAILURE_COOLDOWN_SECONDS * 2 ** (endpoint.consecutive_failures - FAILURE_THRESHOLD)
+                endpoint.cooldown_until = now + min(backoff, MAX_COOLDOWN_SECONDS)
+
+    @staticmethod
+    def _should_fail_over(error: Exception) -> bool:
+        """Throttling, timeouts, connection and server errors are worth retrying elsewhere"""
+        if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+            return True
+        return isinstance(error, APIStatusError) and error.status_code >= 500
+
+    def create(self, model: str, trace: Optional[Dict] = None, deadline: Optional[float] = None, **kwargs):
+        """
+        Make a chat completion on the best available endpoint, failing over on errors
+
+        With stream=True the response is the chunk stream; failover only
+        happens before it starts, and the recorded latency is time to headers.
+        When trace is given, its "retries" count is increased by every failover
+        and by the OpenAI client's own retries. A deadline (time.monotonic())
+        caps the timeout of each attempt, so failover never runs past it.
+
+        Returns:
+            (ChatCompletion response, name of the endpoint that served it)
+        """
+        last_error = None
+        for endpoint in self._candidates(model):
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No endpoint answered before the call's deadline") from last_error
+                kwargs["timeout"] = min(kwargs.get("timeout") or remaining, remaining)
+            with self._lock:
+                endpoint.requests += 1
+            start = time.monotonic()
+            try:
+                raw = endpoint.client.chat.completions.with_raw_response.create(
+                    model=endpoint.model_for(model), **kwargs
+                )
+                response = raw.parse()
+            except Exception as e:
+                self._record_failure(endpoint, e)
+                last_error = e
+                if self._should_fail_over(e):
+                    if trace is not None:
+                        trace["retries"] = trace.get("retries", 0) + 1
+                    continue
+                raise
+            self._record_success(endpoint, time.monotonic() - start, raw.headers)
+            if trace is not None:
+                trace["retries"] = trace.get("retries", 0) + (getattr(raw, "retries_taken", 0) or 0)
+            return response, endpoint.name
+
+        if last_error:
+            raise last_error
+        raise ValueError(f"No configured endpoint serves model {model}")
+
+    def stats(self) -> List[Dict]:
+        """Per-endpoint routing and health statistics"""
+        now = time.monotonic()
+        with self._lock:
+            return [e.stats(now) for e in self.endpoints]
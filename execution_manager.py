@@ -1,16 +1,41 @@
 # Create a new file: execution_manager.py
 import json
 import os
+import time
 from datetime import datetime
 from typing import List, Dict, Optional
 import uuid
+import threading
+from search_index import ExecutionSearchIndex
+from execution_rollup import ExecutionRollup
+from metrics import PERSIST_SECONDS
+from file_lock import file_lock, write_json_atomic
+
+# Guards writes to the executions file and its journal across threads; file_lock()
+# does the same across processes, e.g. batch workers on other machines
+_executions_lock = threading.RLock()
+# The journal is folded into the executions file once it grows past this size
+EXECUTIONS_JOURNAL_MAX_BYTES = int(os.environ.get("PROMPTFLOW_EXECUTIONS_JOURNAL_MB", "64")) * 1024 * 1024
 
 class ExecutionManager:
-    """Manages workflow execution history"""
+    """
+    Manages workflow execution history
+
+    New executions are appended to a JSON-lines journal next to the
+    executions file, so recording one costs the same however long the
+    history is. The journal is folded into the executions file when an
+    execution is deleted or the journal passes EXECUTIONS_JOURNAL_MAX_BYTES.
+    """
 
-    def __init__(self, filename="executions.json"):
+    def __init__(self, filename="executions.json", index_file="search_index.db",
+                 rollup_file="execution_rollups.json", journal_file: Optional[str] = None):
         self.filename = filename
+        self.journal_file = journal_file or os.path.splitext(filename)[0] + ".jsonl"
+        self.search_index = ExecutionSearchIndex(index_file)
+        self.rollup = ExecutionRollup(rollup_file)
         self._ensure_executions_file()
+        self._sync_search_index()
+        self._ensure_rollup()
 
     def _ensure_executions_file(self):
         """Create executions file if it doesn't exist"""
@@ -18,11 +43,33 @@ class ExecutionManager:
             with open(self.filename, 'w') as f:
                 json.dump({"executions": []}, f)
 
+    def _sync_search_index(self):
+        """Index any executions recorded before the search index existed"""
+        try:
+            self.search_index.sync(self.get_executions())
+        except Exception as e:
+            print(f"Error syncing execution search index: {e}")
+
+    def _ensure_rollup(self):
+        """Build the per-workflow rollup from existing executions if it is missing or outdated"""
+        if self.rollup.needs_rebuild():
+            # Checked again under the lock so processes starting together rebuild it once
+            with self.rollup.locked():
+                if self.rollup.needs_rebuild():
+                    self.rollup.rebuild(self.get_executions())
+
     def record_execution(self, project_id: str, workflow_name: str, document_id: str, 
-                        results: Dict, template_content: str = None) -> str:
+                        results: Dict, template_content: str = None,
+                        result_details: Optional[Dict] = None, timings: Optional[Dict] = None) -> str:
         """
         Record a workflow execution
 
+        Args:
+            result_details: Optional per-marker details: model, latency, tokens,
+                            cost, retries and cache hits of each prompt
+            timings: Optional seconds spent on extraction, prompts, template
+                     load and render (see process_workflow_with_template)
+
         Returns:
             Execution ID
         """
@@ -39,14 +86,34 @@ class ExecutionManager:
                 "template_content": template_content,
                 "status": "completed"
             }
+            if result_details:
+                execution["result_details"] = result_details
+            if timings:
+                execution["timings"] = timings
 
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
+            start = time.perf_counter()
+            line = json.dumps(execution) + "\n"
+            with _executions_lock, file_lock(self.filename):
+                with open(self.journal_file, 'ab+') as f:
+                    # Finish a line cut short by a crash so this record stays readable
+                    f.seek(0, os.SEEK_END)
+                    if f.tell():
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            f.write(b"\n")
+                    f.write(line.encode('utf-8'))
+                    journal_bytes = f.tell()
+                if journal_bytes > EXECUTIONS_JOURNAL_MAX_BYTES:
+                    self._compact(self._load_executions())
 
-            data["executions"].append(execution)
+            # Totals only add up, so the rollup can be updated after releasing the file
+            self.rollup.add(execution)
+            PERSIST_SECONDS.observe(time.perf_counter() - start, store="json", operation="record_execution")
 
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=4)
+            try:
+                self.search_index.add_execution(execution)
+            except Exception as e:
+                print(f"Error indexing execution: {e}")
 
             return execution_id
 
@@ -54,15 +121,40 @@ class ExecutionManager:
             print(f"Error recording execution: {e}")
             return None
 
+    def _load_executions(self) -> List[Dict]:
+        """Executions of the file and then the journal, in the order they were recorded"""
+        # Journal first: a compaction in between moves its lines into the file, not out of sight
+        journal = []
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        journal.append(json.loads(line))
+                    except ValueError:
+                        # Blank, cut short by a crash, or still being written
+                        continue
+        except FileNotFoundError:
+            pass
+
+        with open(self.filename, 'r') as f:
+            executions = json.load(f).get("executions", [])
+        if journal:
+            # Lines already folded into the file by an interrupted compaction are skipped
+            known = {e["id"] for e in executions}
+            executions.extend(e for e in journal if e.get("id") not in known)
+        return executions
+
+    def _compact(self, executions: List[Dict]):
+        """Rewrite the executions file with these executions and empty the journal (caller holds the locks)"""
+        write_json_atomic(self.filename, {"executions": executions})
+        open(self.journal_file, 'w').close()
+
     def get_executions(self, project_id: Optional[str] = None, 
                       workflow_name: Optional[str] = None,
                       document_id: Optional[str] = None) -> List[Dict]:
         """Get executions filtered by various criteria"""
         try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-
-            executions = data.get("executions", [])
+            executions = self._load_executions()
 
             # Apply filters
             if project_id:
@@ -89,13 +181,16 @@ class ExecutionManager:
     def delete_execution(self, execution_id: str) -> bool:
         """Delete an execution record"""
         try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
+            with _executions_lock, file_lock(self.filename):
+                executions = self._load_executions()
 
-            data["executions"] = [e for e in data["executions"] if e["id"] != execution_id]
+                removed = [e for e in executions if e["id"] == execution_id]
+                self._compact([e for e in executions if e["id"] != execution_id])
 
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=4)
+            for execution in removed:
+                self.rollup.remove(execution)
+
+            self.search_index.remove_execution(execution_id)
 
             return True
 
@@ -106,4 +201,91 @@ class ExecutionManager:
     def get_recent_executions(self, limit: int = 10, project_id: Optional[str] = None) -> List[Dict]:
         """Get recent executions"""
         executions = self.get_executions(project_id=project_id)
-        return executions[:limit]
\ No newline at end of file
+        return executions[:limit]
+
+    def get_latest_runs(self, project_id: Optional[str] = None) -> Dict[tuple, str]:
+        """(document ID, workflow name) -> time of its most recent execution"""
+        latest = {}
+        for execution in self.get_executions(project_id=project_id):
+            pair = (execution.get("document_id"), execution.get("workflow_name"))
+            if execution.get("executed_at", "") > latest.get(pair, ""):
+                latest[pair] = execution["executed_at"]
+        return latest
+
+    def get_project_summary(self, project_id: Optional[str]) -> Optional[Dict]:
+        """Latency percentiles, tokens and cost per workflow, from the rollup (see ExecutionRollup)"""
+        return self.rollup.project_summary(project_id)
+
+    def search_executions(self, query: str, project_id: Optional[str] = None,
+                          workflow_name: Optional[str] = None, marker: Optional[str] = None,
+                          date_from: Optional[str] = None, date_to: Optional[str] = None,
+                          limit: int = 50) -> List[Dict]:
+        """
+        Search execution outputs (per-marker answers and rendered content)
+
+        Returns:
+            Execution records, best match first, each with a "matches" list of
+            {"marker", "snippet"} entries showing where the query hit. Falls
+            back to a substring scan when the full-text index is unavailable.
+        """
+        if not self.search_index.available:
+            return self._scan_executions(query, project_id, workflow_name, marker, date_from, date_to, limit)
+
+        hits = self.search_index.search(
+            query,
+            project_id=project_id,
+            workflow_name=workflow_name,
+            marker=marker,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit
+        )
+        if not hits:
+            return []
+
+        executions = {e["id"]: e for e in self.get_executions(project_id=project_id)}
+        results = []
+        for hit in hits:
+            execution = executions.get(hit["execution_id"])
+            if execution:
+                results.append({**execution, "matches": hit["matches"], "score": hit["score"]})
+        return results
+
+    def _scan_executions(self, query: str, project_id: Optional[str], workflow_name: Optional[str],
+                         marker: Optional[str], date_from: Optional[str], date_to: Optional[str],
+                         limit: int) -> List[Dict]:
+        """search_executions() without the index: newest first, scored by the number of markers hit"""
+        query_lower = query.strip().lower()
+        if not query_lower:
+            return []
+        if date_to and len(date_to) == 10:
+            # A bare date should include the whole day
+            date_to += "T23:59:59.999999"
+
+        results = []
+        for execution in self.get_executions(project_id=None if project_id == "*" else project_id,
+                                             workflow_name=workflow_name):
+            executed_at = execution.get("executed_at", "")
+            if (date_from and executed_at < date_from) or (date_to and executed_at > date_to):
+                continue
+            fields = dict(execution.get("results") or {})
+            if execution.get("template_content"):
+                fields[self.search_index.CONTENT_MARKER] = execution["template_content"]
+
+            matches = []
+            for field_marker, value in fields.items():
+                if marker and field_marker != marker:
+                    continue
+                text = str(value)
+                position = text.lower().find(query_lower)
+                if position >= 0:
+                    end = position + len(query_lower)
+                    snippet = (("…" if position > 60 else "") + text[max(0, position - 60):position]
+                               + "**" + text[position:end] + "**" + text[end:end + 60]
+                               + ("…" if end + 60 < len(text) else ""))
+                    matches.append({"marker": field_marker, "snippet": snippet})
+            if matches:
+                results.append({**execution, "matches": matches, "score": float(len(matches))})
+
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:limit]
@@ -0,0 +1,181 @@
+import contextlib
+import json
+import os
+import bisect
+import threading
+from typing import List, Dict, Optional
+from metrics import bucket_quantile, LLM_BUCKETS
+from file_lock import file_lock, write_json_atomic
+
+# Bucket bounds (seconds) of the execution duration histograms
+EXECUTION_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# Guards read-modify-write cycles on the rollup file across threads; file_lock()
+# covers other processes
+_rollup_lock = threading.RLock()
+
+
+def _bucket(bounds, value: float) -> int:
+    return bisect.bisect_left(bounds, value)
+
+
+class ExecutionRollup:
+    """
+    Running per-workflow totals of every project's executions: counts,
+    tokens, cost and latency histograms (so p50/p95 can be estimated).
+
+    Each recorded or deleted execution adjusts the totals, so the Results tab
+    never rescans the executions file; the rollup is only rebuilt from it when
+    the file is missing or its bucket bounds have changed.
+
+    Updates take the rollup's own lock, never while the executions file is
+    locked (nested POSIX locks across threaded processes can be reported as
+    deadlocks), so writers rewrite the two files one after the other.
+    """
+
+    def __init__(self, filename="execution_rollups.json"):
+        self.filename = filename
+
+    def _empty(self) -> Dict:
+        return {"prompt_buckets": list(LLM_BUCKETS), "execution_buckets": list(EXECUTION_BUCKETS), "projects": {}}
+
+    def needs_rebuild(self) -> bool:
+        """True if the rollup is missing or was built with other bucket bounds"""
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+            return (data.get("prompt_buckets") != list(LLM_BUCKETS)
+                    or data.get("execution_buckets") != list(EXECUTION_BUCKETS))
+        except (OSError, ValueError):
+            return True
+
+    def _new_entry(self) -> Dict:
+        return {
+            "executions": 0,
+            "timed_executions": 0,
+            "costed_executions": 0,
+            "execution_seconds_sum": 0.0,
+            "execution_counts": [0] * (len(EXECUTION_BUCKETS) + 1),
+            "prompt_calls": 0,
+            "prompt_seconds_sum": 0.0,
+            "prompt_counts": [0] * (len(LLM_BUCKETS) + 1),
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost": 0.0,
+            "retries": 0,
+            "cache_hits": 0
+        }
+
+    def _apply(self, data: Dict, execution: Dict, sign: int):
+        """Add (sign=1) or remove (sign=-1) one execution's contribution"""
+        project = data["projects"].setdefault(execution.get("project_id") or "", {})
+        entry = project.setdefault(execution.get("workflow_name", ""), self._new_entry())
+        entry["executions"] += sign
+
+        timings = execution.get("timings") or {}
+        if timings.get("total_seconds") is not None:
+            entry["timed_executions"] += sign
+            entry["execution_seconds_sum"] += sign * timings["total_seconds"]
+            entry["execution_counts"][_bucket(EXECUTION_BUCKETS, timings["total_seconds"])] += sign
+
+        details = (execution.get("result_details") or {}).values()
+        if any(detail.get("cost") is not None for detail in details):
+            entry["costed_executions"] += sign
+        for detail in details:
+            if detail.get("latency_seconds") is not None:
+                entry["prompt_calls"] += sign
+                entry["prompt_seconds_sum"] += sign * detail["latency_seconds"]
+                entry["prompt_counts"][_bucket(LLM_BUCKETS, detail["latency_seconds"])] += sign
+            entry["input_tokens"] += sign * (detail.get("input_tokens") or 0)
+            entry["output_tokens"] += sign * (detail.get("output_tokens") or 0)
+            entry["cost"] += sign * (detail.get("cost") or 0.0)
+            entry["retries"] += sign * (detail.get("retries") or 0)
+            entry["cache_hits"] += sign * any((detail.get("cache_hits") or {}).values())
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the rollup's thread and file locks, e.g. to check and rebuild it in one go"""
+        with _rollup_lock, file_lock(self.filename):
+            yield
+
+    def _update(self, execution: Dict, sign: int):
+        try:
+            with self.locked():
+                if os.path.exists(self.filename):
+                    with open(self.filename, 'r') as f:
+                        data = json.load(f)
+                else:
+                    data = self._empty()
+
+                self._apply(data, execution, sign)
+
+                write_json_atomic(self.filename, data)
+        except Exception as e:
+            print(f"Error updating execution rollup: {e}")
+
+    def add(self, execution: Dict):
+        self._update(execution, 1)
+
+    def remove(self, execution: Dict):
+        self._update(execution, -1)
+
+    def rebuild(self, executions: List[Dict]):
+        """Recompute the rollup from every execution (after a migration or bucket change)"""
+        try:
+            data = self._empty()
+            for execution in executions:
+                self._apply(data, execution, 1)
+            with self.locked():
+                write_json_atomic(self.filename, data)
+        except Exception as e:
+            print(f"Error rebuilding execution rollup: {e}")
+
+    @staticmethod
+    def _describe(entry: Dict) -> Dict:
+        return {
+            "executions": entry["executions"],
+            "prompt_calls": entry["prompt_calls"],
+            "prompt_p50_seconds": bucket_quantile(LLM_BUCKETS, entry["prompt_counts"], 0.5),
+            "prompt_p95_seconds": bucket_quantile(LLM_BUCKETS, entry["prompt_counts"], 0.95),
+            "execution_p50_seconds": bucket_quantile(EXECUTION_BUCKETS, entry["execution_counts"], 0.5),
+            "execution_p95_seconds": bucket_quantile(EXECUTION_BUCKETS, entry["execution_counts"], 0.95),
+            "mean_execution_seconds": entry["execution_seconds_sum"] / entry["timed_executions"]
+            if entry["timed_executions"] else None,
+            "input_tokens": entry["input_tokens"],
+            "output_tokens": entry["output_tokens"],
+            "cost": entry["cost"],
+            # Executions recorded before costs were kept don't count
+            "cost_per_execution": entry["cost"] / entry["costed_executions"] if entry["costed_executions"] else 0.0,
+            "retries": entry["retries"],
+            "cache_hits": entry["cache_hits"]
+        }
+
+    def project_summary(self, project_id: Optional[str]) -> Optional[Dict]:
+        """
+        Latency percentiles, tokens and cost of a project's executions
+
+        Returns:
+            Dict with "total" and "workflows" (workflow name -> the same
+            figures), or None if the project has no executions recorded
+        """
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        workflows = {name: entry for name, entry in data["projects"].get(project_id or "", {}).items()
+                     if entry["executions"] > 0}
+        if not workflows:
+            return None
+
+        total = self._new_entry()
+        for entry in workflows.values():
+            for key, value in entry.items():
+                total[key] = [a + b for a, b in zip(total[key], value)] if isinstance(value, list) \
+                    else total[key] + value
+
+        return {
+            "total": self._describe(total),
+            "workflows": {name: self._describe(entry) for name, entry in sorted(workflows.items())}
+        }
@@ -0,0 +1,46 @@
+import contextlib
+import json
+import os
+import threading
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: callers' thread locks still serialise one process
+    fcntl = None
+
+# Paths each thread already holds, so nested file_lock() calls don't unlock early
+_held = threading.local()
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on path across processes, including worker
+    processes on other machines sharing the file over NFS (POSIX record
+    locks are used for that reason).
+
+    The lock is taken on a "<path>.lock" file next to it. POSIX locks belong
+    to the process, so take a threading lock first; nested calls from the
+    same thread are allowed.
+    """
+    held = _held.__dict__.setdefault("paths", set())
+    if fcntl is None or path in held:
+        yield
+        return
+    with open(path + ".lock", 'a') as handle:
+        fcntl.lockf(handle, fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            fcntl.lockf(handle, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, data: Dict):
+    """Write JSON through a temporary file so readers in other processes never see half a file"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(temp_path, path)
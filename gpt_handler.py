@@ -1,10 +1,27 @@
 
 import os
+import time
+from urllib.parse import quote
 from openai import OpenAI
+from call_hedging import call_hedger, LLM_TIMEOUT_SECONDS
+from endpoint_pool import EndpointPool
+from llm_cassette import LLMCassette
+from llm_scheduler import llm_scheduler, INTERACTIVE
+from metrics import (LLM_REQUEST_SECONDS, LLM_FIRST_TOKEN_SECONDS, LLM_REQUESTS, LLM_TOKENS,
+                     LLM_OUTPUT_TOKENS_PER_SECOND)
+from model_router import ModelRouter
+from token_counter import count_tokens
+
+# Names the workflow prompt a request is for (ignored by OpenAI; used by the
+# local stand-in server and for matching recorded calls)
+PROMPT_NAME_HEADER = "X-PromptFlow-Prompt"
 
 class GPTHandler:
     def __init__(self):
         self.model = "gpt-4o"
+        self.max_tokens = 1000
+        self.temperature = 0.4
+        self.timeout = LLM_TIMEOUT_SECONDS
         
         # Configure based on environment
         use_azure = os.getenv('USE_AZURE_OPENAI', 'false').lower() == 'true'
@@ -16,28 +33,236 @@ class GPTHandler:
                 api_version=os.getenv('AZURE_OPENAI_API_VERSION', '2024-02-01'),
                 azure_deployed_model=os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-4'),
                 azure_ad_token=os.getenv('AZURE_AD_TOKEN'),  # For Azure AD authentication
-                default_headers={'Ocp-Apim-Subscription-Key': os.getenv('AZURE_OPENAI_API_KEY')}
+                default_headers={'Ocp-Apim-Subscription-Key': os.getenv('AZURE_OPENAI_API_KEY')},
+                max_retries=0
             )
         else:
-            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            # Retries are left to the endpoint pool and the call hedger, so a
+            # call's timeout bounds the whole attempt
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+        # Several deployments can be pooled with PROMPTFLOW_LLM_ENDPOINTS
+        self.endpoints = EndpointPool.from_environment(self.client)
+        self.router = ModelRouter(self.model, self.max_tokens)
+        # Record or replay every call with PROMPTFLOW_LLM_CASSETTE_MODE
+        self.cassette = LLMCassette.from_environment()
+
+    @staticmethod
+    def _messages(document_text, prompt, system_prompt):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{prompt}\n\nDocument:\n{document_text}"}
+        ]
 
-    def process_document(self, document_text, prompt, system_prompt=""):
+    @staticmethod
+    def _headers(prompt_name):
+        # Percent-encoded: header values must be ASCII without surrounding spaces
+        return {PROMPT_NAME_HEADER: quote(prompt_name, safe=" ").strip()} if prompt_name else None
+
+    @staticmethod
+    def _account(result, prompt_name, input_tokens):
         """
-        Process a document with a given prompt using GPT-4
+        Fill in "input_tokens" and "output_tokens" (as reported, else counted)
+        and add the finished call to the LLM metrics
         """
+        model = result["model"]
+        usage = result.get("usage") or {}
+        output_tokens = usage.get("completion_tokens") or count_tokens(result["content"])
+        input_tokens = usage.get("prompt_tokens") or input_tokens
+        result["input_tokens"] = input_tokens
+        result["output_tokens"] = output_tokens
+        result.setdefault("retries", 0)
+        LLM_REQUESTS.inc(model=model, outcome="ok")
+        LLM_REQUEST_SECONDS.observe(result["latency_seconds"], model=model, prompt=prompt_name or "ad hoc")
+        LLM_TOKENS.inc(input_tokens, model=model, direction="input")
+        LLM_TOKENS.inc(output_tokens, model=model, direction="output")
+        if result["latency_seconds"] > 0:
+            LLM_OUTPUT_TOKENS_PER_SECOND.observe(output_tokens / result["latency_seconds"], model=model)
+        if result.get("time_to_first_token") is not None:
+            LLM_FIRST_TOKEN_SECONDS.observe(result["time_to_first_token"], model=model)
+        return result
+
+    def complete(self, document_text, prompt, system_prompt="", priority=INTERACTIVE,
+                 model=None, max_tokens=None, prompt_name=None):
+        """
+        Run one prompt against a document and describe the answer
+
+        Calls are admitted by the shared LLM scheduler: "interactive" calls
+        (prompt testing) jump ahead of "batch" calls, which only use the
+        remaining concurrency and quota headroom. Each call times out after
+        self.timeout seconds, failovers and any hedged duplicate included, and
+        may be hedged when it is slower than usual.
+        With a cassette configured, calls are recorded to it or answered from it.
+
+        Returns:
+            Dict with "content", "model", "endpoint", "finish_reason", "usage"
+            (as reported by the API, with "cached_tokens" of prompt caching),
+            "input_tokens" and "output_tokens" (reported or counted), "retries"
+            (failovers and client retries) and "latency_seconds"; on failure
+            "content" holds the error message and "error" is set
+        """
+        model = model or self.model
+        max_tokens = max_tokens or self.max_tokens
         try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"{prompt}\n\nDocument:\n{document_text}"}
-            ]
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.4,
-                max_tokens=1000
-            )
+            messages = self._messages(document_text, prompt, system_prompt)
+            tokens = count_tokens(system_prompt) + count_tokens(messages[1]["content"]) + max_tokens
+
+            def create(deadline):
+                # Each attempt (the call and a hedged duplicate) counts its own retries
+                trace = {"retries": 0}
+                response, endpoint = self.endpoints.create(
+                    model=model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=max_tokens,
+                    timeout=self.timeout,
+                    extra_headers=self._headers(prompt_name),
+                    trace=trace,
+                    deadline=deadline
+                )
+                return response, endpoint, trace
+
+            key = LLMCassette.request_key(model, messages, max_tokens, self.temperature)
+            with llm_scheduler.slot(priority, tokens):
+                if self.cassette and self.cassette.replaying:
+                    return self._account(self.cassette.play(key), prompt_name, tokens - max_tokens)
+                start = time.monotonic()
+                # A hedged duplicate takes a scheduler slot of its own, so its tokens are charged too
+                response, endpoint, trace = call_hedger.run(
+                    f"{model}:{prompt[:200]}", create, timeout=self.timeout,
+                    hedge_slot=lambda: llm_scheduler.slot(priority, tokens)
+                )
+                latency = time.monotonic() - start
 
-            return response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            result = {
+                "content": response.choices[0].message.content,
+                "model": model,
+                "endpoint": endpoint,
+                "finish_reason": response.choices[0].finish_reason,
+                "usage": {
+                    "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                    "completion_tokens": getattr(usage, "completion_tokens", None),
+                    "cached_tokens": getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+                },
+                "retries": trace["retries"],
+                "latency_seconds": latency
+            }
+            if self.cassette and self.cassette.recording:
+                self.cassette.record(key, result, prompt_name=prompt_name)
+            return self._account(result, prompt_name, tokens - max_tokens)
         except Exception as e:
-            return f"Error processing document: {str(e)}"
+            LLM_REQUESTS.inc(model=model, outcome="error")
+            return {"content": f"Error processing document: {str(e)}", "model": model, "error": str(e)}
+
+    def stream(self, document_text, prompt, system_prompt="", priority=INTERACTIVE,
+               model=None, max_tokens=None, on_token=None, prompt_name=None):
+        """
+        Run one prompt with a streamed completion
+
+        Args:
+            on_token: Called with the answer so far each time new tokens arrive
+            prompt_name: Workflow prompt the call is for, sent in PROMPT_NAME_HEADER
+
+        Returns:
+            Same dict as complete(), plus "time_to_first_token" in seconds
+        """
+        model = model or self.model
+        max_tokens = max_tokens or self.max_tokens
+        try:
+            messages = self._messages(document_text, prompt, system_prompt)
+            tokens = count_tokens(system_prompt) + count_tokens(messages[1]["content"]) + max_tokens
+
+            trace = {"retries": 0}
+
+            key = LLMCassette.request_key(model, messages, max_tokens, self.temperature)
+            with llm_scheduler.slot(priority, tokens):
+                if self.cassette and self.cassette.replaying:
+                    return self._account(self.cassette.play(key, on_token), prompt_name, tokens - max_tokens)
+                start = time.monotonic()
+                chunks, endpoint = self.endpoints.create(
+                    model=model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=max_tokens,
+                    timeout=self.timeout,
+                    extra_headers=self._headers(prompt_name),
+                    stream=True,
+                    trace=trace,
+                    deadline=start + self.timeout
+                )
+                parts = []
+                arrivals = []
+                first_token = None
+                finish_reason = None
+                for chunk in chunks:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        if first_token is None:
+                            first_token = time.monotonic() - start
+                        parts.append(choice.delta.content)
+                        arrivals.append(time.monotonic() - start)
+                        if on_token:
+                            on_token("".join(parts))
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+                latency = time.monotonic() - start
+
+            result = {
+                "content": "".join(parts),
+                "model": model,
+                "endpoint": endpoint,
+                "finish_reason": finish_reason,
+                "usage": {"prompt_tokens": None, "completion_tokens": None, "cached_tokens": None},
+                "retries": trace["retries"],
+                "latency_seconds": latency,
+                "time_to_first_token": first_token
+            }
+            if self.cassette and self.cassette.recording:
+                self.cassette.record(key, result, chunks=[list(c) for c in zip(arrivals, parts)],
+                                     prompt_name=prompt_name)
+            return self._account(result, prompt_name, tokens - max_tokens)
+        except Exception as e:
+            LLM_REQUESTS.inc(model=model, outcome="error")
+            return {"content": f"Error processing document: {str(e)}", "model": model, "error": str(e)}
+
+    def process_prompt(self, document_text, prompt_data, system_prompt="", priority=INTERACTIVE,
+                       on_token=None):
+        """
+        Run a workflow prompt on the model its profile (or the router) picks,
+        escalating a doubtful small-model answer to the default model
+
+        Args:
+            on_token: When given, the answer is streamed and this is called with
+                the text so far (an escalated answer starts again from empty)
+
+        Returns:
+            complete()/stream() result, plus "escalated_from" and "first_attempt"
+            (the discarded answer's model, latency and tokens) when the answer
+            was escalated
+        """
+        def run(model, max_tokens):
+            if on_token:
+                return self.stream(document_text, prompt_data['prompt'], system_prompt, priority,
+                                   model=model, max_tokens=max_tokens, on_token=on_token,
+                                   prompt_name=prompt_data.get('name'))
+            return self.complete(document_text, prompt_data['prompt'], system_prompt, priority,
+                                 model=model, max_tokens=max_tokens, prompt_name=prompt_data.get('name'))
+
+        choice = self.router.choose(prompt_data)
+        result = run(choice["model"], choice["max_tokens"])
+        if choice["escalate_to"] and self.router.needs_escalation(result):
+            escalated = run(choice["escalate_to"], prompt_data.get('max_tokens') or self.max_tokens)
+            escalated["escalated_from"] = choice["model"]
+            escalated["first_attempt"] = {key: result.get(key) for key in
+                                          ("model", "latency_seconds", "input_tokens", "output_tokens", "retries")}
+            return escalated
+        return result
+
+    def process_document(self, document_text, prompt, system_prompt="", priority=INTERACTIVE):
+        """
+        Process a document with a given prompt using GPT-4
+        """
+        return self.complete(document_text, prompt, system_prompt, priority)["content"]
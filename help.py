@@ -42,6 +42,7 @@ def show_help():
         - In the Documents tab, click "➕ Upload New Document"
         - Select Word (.docx) or PDF files
         - Give each document a meaningful name and description
+        - To add many documents at once, use "📦 Bulk Import" with a ZIP archive or a server folder
 
         ### 4. Create Workflows
         - In the Workflows tab, click "➕ Create New Workflow"
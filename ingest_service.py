@@ -0,0 +1,329 @@
+import argparse
+import io
+import logging
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
+from document_processor import DocumentProcessor
+from llm_scheduler import BATCH
+from metrics import start_metrics_server, METRICS_PORT
+
+
+class LocalUploadedFile(io.BytesIO):
+    """Adapts a file on disk (or bytes received elsewhere) to the Streamlit UploadedFile interface the managers expect"""
+
+    def __init__(self, path: Optional[str] = None, name: Optional[str] = None, content: Optional[bytes] = None):
+        if content is None:
+            with open(path, 'rb') as f:
+                content = f.read()
+        super().__init__(content)
+        self.name = name or os.path.basename(path)
+        self.size = len(self.getbuffer())
+        self.type = mimetypes.guess_type(self.name)[0] or "application/octet-stream"
+
+
+class HotFolderWatcher:
+    """
+    Long-running ingest service that watches each project's configured hot
+    folder and uploads new documents as they arrive.
+
+    Files are only picked up once their size and modification time have been
+    stable for settle_seconds, so partially copied files are never ingested.
+    Ingested files are moved to a "processed" subfolder, failures to "failed"
+    alongside a .error.txt explaining why. A file that cannot be moved is
+    remembered and the move retried on later polls, so it is never uploaded
+    twice. When a folder has run_workflows enabled, every project workflow is
+    queued for each new document.
+    """
+
+    PROCESSED_DIR = "processed"
+    FAILED_DIR = "failed"
+
+    def __init__(self, project_manager, source_manager, workflow_manager=None, template_manager=None,
+                 prompt_manager=None, execution_manager=None, gpt_handler=None,
+                 poll_interval: float = 2.0, settle_seconds: float = 5.0, max_workers: int = 4,
+                 workflow_workers: int = 2, project_ids: Optional[List[str]] = None):
+        self.project_manager = project_manager
+        self.source_manager = source_manager
+        self.workflow_manager = workflow_manager
+        self.template_manager = template_manager
+        self.prompt_manager = prompt_manager
+        self.execution_manager = execution_manager
+        self.gpt_handler = gpt_handler
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.max_workers = max_workers
+        self.project_ids = project_ids
+        self.logger = logging.getLogger(__name__)
+
+        self._ingest_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._workflow_pool = ThreadPoolExecutor(max_workers=workflow_workers, thread_name_prefix="workflow")
+        self._pending = {}  # path -> ((size, mtime), first time that signature was seen)
+        self._in_flight = set()
+        self._unmoved = {}  # path -> ((size, mtime), subfolder, error) of handled files still in the hot folder
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _folders(self) -> List[Dict]:
+        """Reload project configuration so folders added in the UI are picked up"""
+        self.project_manager.projects = self.project_manager.load_projects()
+        folders = self.project_manager.get_hot_folders()
+        if self.project_ids:
+            folders = [f for f in folders if f['project_id'] in self.project_ids]
+        return folders
+
+    def _candidates(self, folder: str) -> List[str]:
+        """List files in a hot folder that look like documents"""
+        if not os.path.isdir(folder):
+            return []
+        candidates = []
+        for entry in os.scandir(folder):
+            if not entry.is_file() or entry.name.startswith(('.', '~$')):
+                continue
+            if entry.name.split('.')[-1].lower() not in DocumentProcessor.SUPPORTED_FORMATS:
+                continue
+            candidates.append(entry.path)
+        return candidates
+
+    def scan_once(self) -> int:
+        """
+        Check every hot folder once and queue files that have settled
+
+        Returns:
+            Number of files queued for ingest
+        """
+        queued = 0
+        now = time.monotonic()
+        seen = set()
+
+        for config in self._folders():
+            for path in self._candidates(config['path']):
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Removed between listing and stat
+                signature = (stat.st_size, stat.st_mtime)
+
+                with self._lock:
+                    if path in self._in_flight:
+                        continue
+                    unmoved = self._unmoved.get(path)
+                    if unmoved is not None and unmoved[0] == signature:
+                        # Already handled - only the move is left to do
+                        del self._unmoved[path]
+                        retry_move = unmoved
+                    else:
+                        # A different file under the same name is ingested afresh
+                        self._unmoved.pop(path, None)
+                        retry_move = None
+                if retry_move is not None:
+                    self._file_away(path, signature, retry_move[1], retry_move[2])
+                    continue
+
+                with self._lock:
+                    previous = self._pending.get(path)
+                    if previous is None or previous[0] != signature:
+                        # New or still being written - restart the settle clock
+                        self._pending[path] = (signature, now)
+                        continue
+                    if now - previous[1] < self.settle_seconds or stat.st_size == 0:
+                        continue
+                    if len(self._in_flight) >= self.max_workers * 2:
+                        continue  # Keep the queue bounded; the file is retried next poll
+                    del self._pending[path]
+                    self._in_flight.add(path)
+
+                self._ingest_pool.submit(self._ingest, path, config, signature)
+                queued += 1
+
+        # Forget files that disappeared before settling
+        with self._lock:
+            for path in list(self._pending):
+                if path not in seen:
+                    del self._pending[path]
+            for path in list(self._unmoved):
+                if path not in seen:
+                    del self._unmoved[path]
+
+        return queued
+
+    def _move(self, path: str, subfolder: str) -> str:
+        """Move a handled file out of the hot folder, keeping names unique"""
+        target_dir = os.path.join(os.path.dirname(path), subfolder)
+        os.makedirs(target_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        target = os.path.join(target_dir, f"{stamp}_{os.path.basename(path)}")
+        os.replace(path, target)
+        return target
+
+    def _file_away(self, path: str, signature: Tuple[int, float], subfolder: str, error: Optional[str] = None) -> bool:
+        """
+        Move a handled file to its subfolder, writing error next to it if given
+
+        If the move fails the file is remembered under its signature, so
+        scan_once() retries the move instead of ingesting the file again.
+        """
+        try:
+            target = self._move(path, subfolder)
+        except OSError as e:
+            self.logger.error(f"Could not move {path} to {subfolder} folder: {e}")
+            with self._lock:
+                self._unmoved[path] = (signature, subfolder, error)
+            return False
+        if error is not None:
+            try:
+                with open(target + ".error.txt", 'w', encoding='utf-8') as f:
+                    f.write(error)
+            except OSError as e:
+                self.logger.error(f"Could not write error file for {target}: {e}")
+        return True
+
+    def _ingest(self, path: str, config: Dict, signature: Tuple[int, float]):
+        """Worker: upload one settled file and optionally queue the project's workflows"""
+        project_id = config['project_id']
+        try:
+            try:
+                name = os.path.splitext(os.path.basename(path))[0]
+                document = self.source_manager.upload_document(
+                    LocalUploadedFile(path),
+                    name,
+                    f"Ingested from {config['path']}",
+                    project_id=project_id
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to ingest {path}: {e}")
+                self._file_away(path, signature, self.FAILED_DIR, str(e))
+                return
+
+            # The document is in the project now, so the file never goes to failed/
+            self.logger.info(f"Ingested {path} into project {project_id} as {document['id']}")
+            self._file_away(path, signature, self.PROCESSED_DIR)
+
+            if config.get('run_workflows'):
+                self._workflow_pool.submit(self._run_workflows, document, project_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+
+    def _ensure_workflow_managers(self):
+        """Create the managers workflow runs need the first time a folder asks for them"""
+        with self._lock:
+            if self.workflow_manager is None:
+                from workflow_manager import WorkflowManager
+                self.workflow_manager = WorkflowManager()
+            if self.template_manager is None:
+                from template_manager import TemplateManager
+                self.template_manager = TemplateManager()
+            if self.prompt_manager is None:
+                from prompt_manager import PromptManager
+                self.prompt_manager = PromptManager()
+            if self.execution_manager is None:
+                from execution_manager import ExecutionManager
+                self.execution_manager = ExecutionManager()
+            if self.gpt_handler is None:
+                from gpt_handler import GPTHandler
+                self.gpt_handler = GPTHandler()
+
+    def _run_workflows(self, document: Dict, project_id: str):
+        """Worker: run every workflow of the project against a newly ingested document"""
+        try:
+            self._ensure_workflow_managers()
+        except Exception as e:
+            self.logger.error(f"Could not set up workflow runs for {document['name']}: {e}")
+            return
+
+        for workflow in self.workflow_manager.get_workflows(project_id):
+            if not workflow.get('template_id'):
+                self.logger.warning(f"Workflow {workflow['name']} has no template; skipped")
+                continue
+            try:
+                result = self.workflow_manager.process_workflow_with_template(
+                    workflow['name'],
+                    document['id'],
+                    self.template_manager,
+                    self.source_manager,
+                    self.gpt_handler,
+                    self.prompt_manager,
+                    project_id=project_id,
+                    priority=BATCH,
+                    # Documents already run side by side in the workflow pool
+                    prompt_concurrency=1
+                )
+                if "error" in result:
+                    self.logger.error(f"{workflow['name']} on {document['name']}: {result['error']}")
+                    continue
+                self.execution_manager.record_execution(
+                    project_id=project_id,
+                    workflow_name=workflow['name'],
+                    document_id=document['id'],
+                    results=result['results'],
+                    template_content=result['content'],
+                    result_details=result.get('result_details'),
+                    timings=result.get('timings')
+                )
+                self.logger.info(f"Ran {workflow['name']} on {document['name']}")
+            except Exception as e:
+                self.logger.error(f"{workflow['name']} on {document['name']}: {e}")
+
+    def run(self):
+        """Poll until stop() is called"""
+        self.logger.info("Hot folder watcher started")
+        while not self._stop.is_set():
+            try:
+                self.scan_once()
+            except Exception as e:
+                self.logger.error(f"Error scanning hot folders: {e}")
+            self._stop.wait(self.poll_interval)
+        self._ingest_pool.shutdown(wait=True)
+        self._workflow_pool.shutdown(wait=True)
+        self.logger.info("Hot folder watcher stopped")
+
+    def stop(self):
+        """Ask run() to finish after in-flight work completes"""
+        self._stop.set()
+
+
+def main():
+    """Run the hot folder watcher as a standalone service"""
+    from project_manager import ProjectManager
+    from source_manager import SourceDocumentManager
+
+    parser = argparse.ArgumentParser(description="Watch project hot folders and ingest new documents")
+    parser.add_argument("--project", action="append", dest="project_ids",
+                        help="Only watch this project's folder (repeatable)")
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Seconds a file must stay unchanged before it is ingested")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent ingest workers")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Port serving /metrics (0 to disable; use another port than the app's)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    metrics_url = start_metrics_server(args.metrics_port)
+    if metrics_url:
+        logging.info(f"Metrics at {metrics_url}")
+
+    # Workflow managers are created on first use, so run_workflows can be
+    # switched on for a folder while the service is running
+    watcher = HotFolderWatcher(
+        ProjectManager(),
+        SourceDocumentManager(),
+        poll_interval=args.poll,
+        settle_seconds=args.settle,
+        max_workers=args.workers,
+        project_ids=args.project_ids
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
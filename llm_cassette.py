@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+# "record" writes every completion call to the cassette, "replay" answers calls
+# from it instead of the API; anything else leaves calls alone
+CASSETTE_MODE = os.environ.get("PROMPTFLOW_LLM_CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.environ.get("PROMPTFLOW_LLM_CASSETTE", "llm_cassette.jsonl")
+# "original" replays with the recorded timings, "zero" answers immediately
+CASSETTE_LATENCY = os.environ.get("PROMPTFLOW_LLM_CASSETTE_LATENCY", "original").lower()
+
+RECORD = "record"
+REPLAY = "replay"
+CASSETTE_MODES = (RECORD, REPLAY)
+
+_shared_cassettes = {}
+_shared_cassettes_lock = threading.Lock()
+
+
+class CassetteMiss(LookupError):
+    """A replayed call that was never recorded"""
+
+
+class LLMCassette:
+    """
+    Records completion calls to a JSON-lines file and replays them.
+
+    Calls are matched on model, messages, max_tokens and temperature. A request
+    made several times is answered with its recordings in order (the last one
+    repeats), so a replayed batch gets the same answers as the recorded one.
+    Each recording keeps its latency, time to first token and, for streamed
+    calls, when each chunk arrived.
+    """
+
+    def __init__(self, path: str, mode: str, latency: str = CASSETTE_LATENCY):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}. Choose from: {', '.join(CASSETTE_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._played = defaultdict(int)
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == REPLAY:
+            self._load()
+
+    @classmethod
+    def from_environment(cls) -> Optional["LLMCassette"]:
+        """The cassette set by PROMPTFLOW_LLM_CASSETTE_MODE, shared per file; None when off"""
+        if CASSETTE_MODE not in CASSETTE_MODES:
+            return None
+        with _shared_cassettes_lock:
+            if CASSETTE_PATH not in _shared_cassettes:
+                _shared_cassettes[CASSETTE_PATH] = cls(CASSETTE_PATH, CASSETTE_MODE)
+            return _shared_cassettes[CASSETTE_PATH]
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @staticmethod
+    def request_key(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        request = json.dumps({"model": model, "messages": messages, "max_tokens": max_tokens,
+                              "temperature": temperature}, sort_keys=True)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette {self.path} not found; record one first")
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+
+    def record(self, key: str, result: Dict, chunks: Optional[List] = None, prompt_name: Optional[str] = None):
+        """
+        Append a successful call to the cassette
+
+        Args:
+            key: request_key() of the call
+            result: GPTHandler.complete()/stream() result
+            chunks: For streamed calls, [seconds since the request, text] per chunk
+            prompt_name: Workflow prompt the call was for (kept for reading the file)
+        """
+        entry = {
+            "key": key,
+            "prompt_name": prompt_name,
+            "model": result.get("model"),
+            "content": result.get("content"),
+            "finish_reason": result.get("finish_reason"),
+            "usage": result.get("usage"),
+            "latency_seconds": result.get("latency_seconds"),
+            "time_to_first_token": result.get("time_to_first_token"),
+            "chunks": chunks,
+            "recorded_at": time.time()
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._stats["recorded"] += 1
+
+    def play(self, key: str, on_token: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Answer a call from the cassette, at the recorded pace unless latency is "zero"
+
+        Args:
+            on_token: Called with the answer so far as recorded chunks are "received"
+
+        Returns:
+            Result in the shape of GPTHandler.complete(), with endpoint "cassette"
+        """
+        with self._lock:
+            recordings = self._entries.get(key)
+            if not recordings:
+                self._stats["misses"] += 1
+                raise CassetteMiss(f"No recorded response for this request in {self.path}")
+            index = self._played[key]
+            self._played[key] += 1
+            self._stats["replayed"] += 1
+        entry = recordings[min(index, len(recordings) - 1)]
+
+        realtime = self.latency != "zero"
+        start = time.monotonic()
+        content = entry.get("content") or ""
+        chunks = entry.get("chunks") or [[entry.get("latency_seconds") or 0.0, content]]
+        text = ""
+        for offset, chunk in chunks:
+            if realtime:
+                time.sleep(max(0.0, start + offset - time.monotonic()))
+            text += chunk
+            if on_token:
+                on_token(text)
+        if realtime and entry.get("latency_seconds"):
+            time.sleep(max(0.0, start + entry["latency_seconds"] - time.monotonic()))
+
+        return {
+            "content": content,
+            "model": entry.get("model"),
+            "endpoint": "cassette",
+            "finish_reason": entry.get("finish_reason"),
+            "usage": entry.get("usage") or {"prompt_tokens": None, "completion_tokens": None},
+            "latency_seconds": time.monotonic() - start,
+            "time_to_first_token": entry.get("time_to_first_token") if realtime else 0.0
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, "mode": self.mode, "path": self.path}
@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# Completion calls in flight at once, across every session and batch in this process
+LLM_MAX_CONCURRENCY = int(os.environ.get("PROMPTFLOW_LLM_MAX_CONCURRENCY", "8"))
+# Slots batch work may never take, so interactive calls start immediately
+LLM_INTERACTIVE_RESERVE = int(os.environ.get("PROMPTFLOW_LLM_INTERACTIVE_RESERVE", "2"))
+# API quota (0 for unlimited) and the share of it batch work may use
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("PROMPTFLOW_LLM_RPM", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("PROMPTFLOW_LLM_TPM", "0"))
+LLM_BATCH_QUOTA_SHARE = float(os.environ.get("PROMPTFLOW_LLM_BATCH_QUOTA_SHARE", "0.8"))
+
+QUOTA_WINDOW_SECONDS = 60
+
+
+class LLMScheduler:
+    """
+    Admission control for completion calls with two priority classes.
+
+    Interactive calls (prompt testing, the workflow runner) always go ahead of
+    waiting batch calls and may use every slot and the whole quota. Batch calls
+    only run in the headroom left over: never more than max_concurrency minus
+    the interactive reserve, and only a share of the per-minute quota.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 interactive_reserve: int = LLM_INTERACTIVE_RESERVE,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+                 batch_quota_share: float = LLM_BATCH_QUOTA_SHARE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_slots = max(1, self.max_concurrency - interactive_reserve)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.batch_quota_share = batch_quota_share
+
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority rank, sequence)
+        self._sequence = itertools.count()
+        self._in_flight = {INTERACTIVE: 0, BATCH: 0}
+        self._window = deque()  # (timestamp, tokens) of calls started in the last minute
+        self._stats = {p: {"calls": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for p in PRIORITIES}
+
+    def _expire_window(self, now: float):
+        while self._window and now - self._window[0][0] >= QUOTA_WINDOW_SECONDS:
+            self._window.popleft()
+
+    def _quota_wait(self, priority: str, tokens: int, now: float) -> float:
+        """Seconds until the quota allows this call (0 if it can start now)"""
+        share = 1.0 if priority == INTERACTIVE else self.batch_quota_share
+        used_requests = len(self._window)
+        used_tokens = sum(t for _, t in self._window)
+        over_requests = self.requests_per_minute and used_requests + 1 > self.requests_per_minute * share
+        over_tokens = self.tokens_per_minute and used_tokens + tokens > self.tokens_per_minute * share
+        if not (over_requests or over_tokens) or not self._window:
+            return 0.0
+        return max(0.01, QUOTA_WINDOW_SECONDS - (now - self._window[0][0]))
+
+    def _slot_free(self, priority: str) -> bool:
+        in_flight = sum(self._in_flight.values())
+        if priority == INTERACTIVE:
+            return in_flight < self.max_concurrency
+        return in_flight < self.max_concurrency and self._in_flight[BATCH] < self.batch_slots
+
+    def acquire(self, priority: str = INTERACTIVE, tokens: int = 0):
+        """Block until a call of this priority may start"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}. Choose from: {', '.join(PRIORITIES)}")
+        ticket = (PRIORITIES.index(priority), next(self._sequence))
+        queued_at = time.monotonic()
+
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._expire_window(now)
+                    timeout = None
+                    if self._waiting[0] == ticket and self._slot_free(priority):
+                        timeout = self._quota_wait(priority, tokens, now)
+                        if timeout == 0:
+                            break
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                # The next waiter may be allowed to run now
+                self._condition.notify_all()
+
+            self._in_flight[priority] += 1
+            self._window.append((now, tokens))
+            waited = now - queued_at
+            stats = self._stats[priority]
+            stats["calls"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+    def release(self, priority: str = INTERACTIVE):
+        with self._condition:
+            self._in_flight[priority] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, tokens: int = 0):
+        """Context manager around one completion call"""
+        self.acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict:
+        """Calls, waits and current load per priority class"""
+        with self._condition:
+            waiting = {p: sum(1 for rank, _ in self._waiting if PRIORITIES[rank] == p) for p in PRIORITIES}
+            return {
+                p: {
+                    **self._stats[p],
+                    "in_flight": self._in_flight[p],
+                    "waiting": waiting[p],
+                    "avg_wait_seconds": self._stats[p]["wait_seconds"] / self._stats[p]["calls"]
+                    if self._stats[p]["calls"] else 0.0
+                }
+                for p in PRIORITIES
+            }
+
+
+# One scheduler per process, shared by every GPTHandler (i.e. every Streamlit session)
+llm_scheduler = LLMScheduler()
@@ -1,6 +1,8 @@
 import streamlit as st
 import json
 import os
+import queue
+import threading
 from prompt_manager import PromptManager
 from document_processor import DocumentProcessor
 from gpt_handler import GPTHandler
@@ -9,6 +11,18 @@ from template_manager import TemplateManager
 from source_manager import SourceDocumentManager
 from project_manager import ProjectManager
 from execution_manager import ExecutionManager
+from bulk_ingest import BulkIngestor
+from batch_estimator import BatchEstimator, BATCH_CONCURRENCY, SCHEDULING_POLICIES
+from batch_scheduler import BatchScheduler
+from batch_profiler import BatchProfiler, BATCH_PROFILING, PHASES
+from batch_runs import BatchRunManager
+from model_router import MODEL_CHOICES
+from call_hedging import call_hedger
+from metrics import (registry as metrics_registry, start_metrics_server, LLM_REQUEST_SECONDS, LLM_REQUESTS,
+                     LLM_TOKENS, LLM_FIRST_TOKEN_SECONDS, BATCH_PAIRS, BATCH_QUEUE_DEPTH, EXTRACTION_SECONDS,
+                     PERSIST_SECONDS, RATE_WINDOW_SECONDS)
+from api_server import start_api_server
+from worker_pool import TaskQueue, submit_batch, TASK_QUEUE_PATH
 from help import show_help
 
 # Configure the Streamlit page with wide layout and collapsed sidebar
@@ -57,8 +71,8 @@ def initialize_session_state():
         # Document-related state
         if 'current_document' not in st.session_state:
             st.session_state.current_document = None
-        if 'current_document_text' not in st.session_state:
-            st.session_state.current_document_text = None
+        if 'current_document_handle' not in st.session_state:
+            st.session_state.current_document_handle = None
         if 'selected_source_document_id' not in st.session_state:
             st.session_state.selected_source_document_id = None
         if 'selected_template_id' not in st.session_state:
@@ -79,6 +93,14 @@ def initialize_session_state():
             st.session_state.project_manager = ProjectManager()
         if 'execution_manager' not in st.session_state:
             st.session_state.execution_manager = ExecutionManager()
+        if 'batch_run_manager' not in st.session_state:
+            st.session_state.batch_run_manager = BatchRunManager()
+        if 'metrics_url' not in st.session_state:
+            # One endpoint per process; later sessions just get its URL
+            st.session_state.metrics_url = start_metrics_server()
+        if 'api_url' not in st.session_state:
+            # Off unless PROMPTFLOW_API_PORT is set; shares this process's LLM scheduler
+            st.session_state.api_url = start_api_server()
 
         # Project-related state
         if 'current_project_id' not in st.session_state:
@@ -106,6 +128,16 @@ def initialize_session_state():
             st.session_state.workflow_results = {}
         if 'test_results' not in st.session_state:
             st.session_state.test_results = {}
+        if 'show_metrics' not in st.session_state:
+            st.session_state.show_metrics = False
+
+        # Batch settings (widget keys, so they are seeded here rather than passed as value=)
+        if 'batch_concurrency' not in st.session_state:
+            st.session_state.batch_concurrency = BATCH_CONCURRENCY
+        if 'batch_deadline_minutes' not in st.session_state:
+            st.session_state.batch_deadline_minutes = 0
+        if 'batch_profile' not in st.session_state:
+            st.session_state.batch_profile = BATCH_PROFILING
     except Exception as e:
         st.error(f"Error initializing session state: {str(e)}")
         # Reset session state if there's an error
@@ -162,7 +194,13 @@ def show_project_selection():
 
     # Display existing projects
     st.markdown("---")
-    st.markdown("### 📂 Your Projects")
+    col_title, col_metrics = st.columns([4, 1])
+    with col_title:
+        st.markdown("### 📂 Your Projects")
+    with col_metrics:
+        if st.button("📈 Metrics", key="open_metrics", use_container_width=True):
+            st.session_state.show_metrics = True
+            st.rerun()
 
     projects = st.session_state.project_manager.get_projects()
 
@@ -277,6 +315,9 @@ def show_project_workspace():
             </p>
             """.format(doc_count=doc_count, workflow_count=workflow_count), unsafe_allow_html=True)
 
+            show_batch_estimate(project['id'], workflows)
+            show_batch_profiles(project['id'])
+
             if st.button("⚡ Run Workflows and Generate Results", 
                         type="primary", 
                         use_container_width=True,
@@ -310,6 +351,164 @@ def show_project_workspace():
         st.session_state.workflow_template = None
         st.rerun()
 
+def show_batch_estimate(project_id, workflows):
+    """Batch settings, with the projected calls, tokens, cost and time of a run before starting it"""
+    with st.expander("📊 Batch settings & pre-flight estimate", expanded=False):
+        documents = st.session_state.source_manager.get_documents(project_id)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            concurrency = st.number_input(
+                "Concurrent documents",
+                min_value=1,
+                max_value=32,
+                key="batch_concurrency"
+            )
+            policy = st.selectbox(
+                "Order",
+                list(SCHEDULING_POLICIES),
+                format_func=lambda p: SCHEDULING_POLICIES[p],
+                key="batch_policy"
+            )
+        with col2:
+            deadline_minutes = st.number_input(
+                "Deadline (minutes, 0 for none)",
+                min_value=0,
+                key="batch_deadline_minutes",
+                help="Work that is not expected to finish in time is skipped and reported"
+            )
+            priority_ids = st.multiselect(
+                "Run these documents first",
+                [doc['id'] for doc in documents],
+                format_func=lambda doc_id: next(d['name'] for d in documents if d['id'] == doc_id),
+                key="batch_priority_docs"
+            )
+        st.checkbox(
+            "Profile this run",
+            key="batch_profile",
+            help="Record where the time goes (extract, plan, LLM, render, persist), "
+                 "the hottest functions and peak memory. Adds some overhead."
+        )
+        if TASK_QUEUE_PATH:
+            live_workers = sum(w['alive'] for w in TaskQueue(TASK_QUEUE_PATH).workers())
+            if 'batch_use_workers' not in st.session_state:
+                st.session_state.batch_use_workers = live_workers > 0
+            st.checkbox(
+                f"Run on the worker pool ({live_workers} worker(s) connected)",
+                key="batch_use_workers",
+                help="Queue the pairs for `promptflow.py worker` processes, which may run on other "
+                     "machines. Deadlines and profiling only apply to runs in this process."
+            )
+
+        gpt_handler = st.session_state.gpt_handler
+        system_prompt = st.session_state.prompt_manager.get_system_prompt()
+        # Counting every prompt's tokens is slow on big projects, so only redo it when an input changed
+        cache_key = json.dumps([
+            project_id,
+            [(doc['id'], doc.get('token_count'), doc.get('text_length')) for doc in documents],
+            workflows,
+            system_prompt,
+            concurrency,
+            policy,
+            priority_ids,
+            gpt_handler.model,
+            gpt_handler.max_tokens
+        ], sort_keys=True, default=str)
+        cached = st.session_state.get('batch_estimate')
+        if cached and cached[0] == cache_key:
+            estimate = cached[1]
+        else:
+            estimator = BatchEstimator(model=gpt_handler.model, max_output_tokens=gpt_handler.max_tokens,
+                                       router=gpt_handler.router)
+            estimate = estimator.estimate(
+                documents,
+                workflows,
+                system_prompt,
+                concurrency=concurrency,
+                policy=policy,
+                priorities={doc_id: 1 for doc_id in priority_ids}
+            )
+            st.session_state.batch_estimate = (cache_key, estimate)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("GPT calls", f"{estimate['calls']:,}")
+            st.metric("Input tokens", f"{estimate['input_tokens']:,}")
+        with col2:
+            st.metric("Output tokens", f"~{estimate['output_tokens']:,}")
+            st.metric("Estimated cost", f"${estimate['cost']:.2f}",
+                      help=f"Up to ${estimate['max_cost']:.2f} if every answer uses max_tokens")
+        with col3:
+            minutes, seconds = divmod(int(estimate['wall_seconds']), 60)
+            st.metric("Estimated time", f"{minutes}m {seconds:02d}s")
+            st.caption(f"{estimate['model']} · {estimate['concurrency']} at a time")
+
+        if deadline_minutes and estimate['wall_seconds'] > deadline_minutes * 60:
+            st.info("ℹ️ The whole batch is not expected to finish before the deadline; "
+                    "the remaining work will be skipped and reported.")
+
+        if estimate['overflows']:
+            st.warning(f"⚠️ {len(estimate['overflows'])} prompt(s) exceed the model's context window:")
+            for overflow in estimate['overflows']:
+                st.write(f"- {overflow['document']} / {overflow['workflow']} / {overflow['prompt']}: "
+                         f"{overflow['input_tokens']:,} tokens (limit {overflow['limit']:,})")
+
+        endpoint_stats = gpt_handler.endpoints.stats()
+        if len(endpoint_stats) > 1:
+            st.markdown("**LLM endpoints**")
+            st.table(endpoint_stats)
+
+        hedge_stats = call_hedger.stats()
+        if hedge_stats['enabled'] or hedge_stats['timeouts']:
+            st.caption(f"Calls: {hedge_stats['calls']:,} · Timeouts: {hedge_stats['timeouts']:,} · "
+                       f"Hedges issued: {hedge_stats['hedges_issued']:,} · won: {hedge_stats['hedges_won']:,}")
+
+def show_batch_profiles(project_id):
+    """Phase breakdown, hot functions and peak memory of profiled batch runs"""
+    runs = st.session_state.batch_run_manager.get_runs(project_id, profiled_only=True)
+    if not runs:
+        return
+
+    with st.expander("🔬 Batch profiles", expanded=False):
+        run = st.selectbox(
+            "Run",
+            runs,
+            format_func=lambda r: f"{r['finished_at'][:19].replace('T', ' ')} · {r['results']} results",
+            key="batch_profile_run"
+        )
+        profile = run['profile']
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Wall time", f"{profile['wall_seconds']:.1f}s")
+        with col2:
+            st.metric("Peak memory", f"{profile['peak_memory_bytes'] / (1024 * 1024):.1f} MB")
+        with col3:
+            st.metric("Samples", f"{profile['samples']:,}")
+
+        st.markdown("**Where the time went**")
+        st.caption("Seconds summed over all workers, so phases can add up to more than the wall time")
+        st.table([
+            {"Phase": name, "Seconds": round(profile['phases'].get(name, {}).get('seconds', 0.0), 2),
+             "Calls": profile['phases'].get(name, {}).get('calls', 0)}
+            for name in PHASES
+        ])
+
+        if profile['hot_functions']:
+            st.markdown("**Hottest functions** (% of samples)")
+            st.table([
+                {"Function": f['function'], "Location": f"{f['file']}:{f['line']}",
+                 "Self %": f['self_pct'], "Total %": f['total_pct']}
+                for f in profile['hot_functions'][:15]
+            ])
+
+        stacks_path = profile.get('stacks_path')
+        if stacks_path and os.path.exists(stacks_path):
+            with open(stacks_path, 'r', encoding='utf-8') as f:
+                st.download_button("📥 Download stacks (flame graph format)", f.read(),
+                                   file_name=os.path.basename(stacks_path), mime="text/plain",
+                                   key="batch_profile_download")
+
 def batch_process_workflows(project_id):
     """Process all workflows against all documents in a project"""
     spinner = create_loading_spinner("Processing all workflows...")
@@ -317,90 +516,96 @@ def batch_process_workflows(project_id):
     try:
         documents = st.session_state.source_manager.get_documents(project_id)
         workflows = st.session_state.workflow_manager.get_workflows(project_id)
-        templates = st.session_state.template_manager.get_templates()
 
         if not documents or not workflows:
             spinner.empty()
             st.error("No documents or workflows to process")
             return
 
-        results_generated = 0
-        errors = []
+        scheduler = BatchScheduler(
+            st.session_state.workflow_manager,
+            st.session_state.template_manager,
+            st.session_state.source_manager,
+            st.session_state.gpt_handler,
+            st.session_state.prompt_manager,
+            st.session_state.execution_manager
+        )
+        deadline_minutes = st.session_state.get('batch_deadline_minutes', 0)
+        settings = {
+            "policy": st.session_state.get('batch_policy', 'fifo'),
+            "concurrency": st.session_state.get('batch_concurrency', BATCH_CONCURRENCY),
+            "deadline_minutes": deadline_minutes
+        }
+        profiler = BatchProfiler() if st.session_state.get('batch_profile', BATCH_PROFILING) else None
+        priorities = {doc_id: 1 for doc_id in st.session_state.get('batch_priority_docs', [])}
+
+        use_workers = bool(TASK_QUEUE_PATH and st.session_state.get('batch_use_workers'))
+        if use_workers and not any(w['alive'] for w in TaskQueue(TASK_QUEUE_PATH).workers()):
+            spinner.empty()
+            st.error("No worker is connected to the task queue. Start `python promptflow.py worker` "
+                     "or untick \"Run on the worker pool\".")
+            return
 
         # Create a progress bar
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        total_operations = len(documents) * len(workflows)
-        current_operation = 0
-
-        for doc in documents:
-            for workflow in workflows:
-                current_operation += 1
-                progress = current_operation / total_operations
-                progress_bar.progress(progress)
-                status_text.text(f"Processing: {doc['name']} with {workflow['name']} ({current_operation}/{total_operations})")
-
-                # Check if workflow has a template
-                if not workflow.get('template_id'):
-                    # Try to find a matching template
-                    matching_template = None
-                    for template in templates:
-                        markers = st.session_state.template_manager.get_template_markers(template['id'])
-                        # Check if template markers match workflow prompts
-                        workflow_markers = [f"{p['name'].upper().replace(' ', '_')}_OUTPUT" 
-                                          for p in workflow.get('prompts', [])]
-                        if any(marker in workflow_markers for marker in markers):
-                            matching_template = template['id']
-                            break
-
-                    if matching_template:
-                        workflow['template_id'] = matching_template
-                        st.session_state.workflow_manager.update_workflow_template_id(
-                            workflow['name'], matching_template, project_id
-                        )
-
-                if workflow.get('template_id'):
-                    try:
-                        # Process the workflow
-                        result = st.session_state.workflow_manager.process_workflow_with_template(
-                            workflow['name'],
-                            doc['id'],
-                            st.session_state.template_manager,
-                            st.session_state.source_manager,
-                            st.session_state.gpt_handler,
-                            st.session_state.prompt_manager,
-                            project_id=project_id
-                        )
+        if use_workers:
+            queue = TaskQueue(TASK_QUEUE_PATH)
+            batch_id, skipped = submit_batch(queue, scheduler, project_id, documents, workflows,
+                                             policy=settings["policy"], priorities=priorities)
+            settings["queue"] = TASK_QUEUE_PATH
+            profiler = None
+            status_text.text(f"Queued for the worker pool as {batch_id}")
+            events = queue.follow(batch_id, skipped)
+        else:
+            events = scheduler.run(
+                project_id,
+                documents,
+                workflows,
+                policy=settings["policy"],
+                concurrency=settings["concurrency"],
+                deadline_seconds=deadline_minutes * 60 if deadline_minutes else None,
+                priorities=priorities,
+                profiler=profiler
+            )
 
-                        if "error" not in result:
-                            # Record execution
-                            st.session_state.execution_manager.record_execution(
-                                project_id=project_id,
-                                workflow_name=workflow['name'],
-                                document_id=doc['id'],
-                                results=result['results'],
-                                template_content=result['content']
-                            )
-                            results_generated += 1
-                        else:
-                            errors.append(f"{workflow['name']} on {doc['name']}: {result['error']}")
-                    except Exception as e:
-                        errors.append(f"{workflow['name']} on {doc['name']}: {str(e)}")
-                else:
-                    errors.append(f"{workflow['name']}: No template assigned")
+        summary = None
+        total = 0
+        handled = 0
+        for event in events:
+            if event["event"] == "planned":
+                total = event["total"]
+            elif event["event"] == "started":
+                status_text.text(f"Processing: {event['document']} with {event['workflow']}")
+            elif event["event"] in ("completed", "failed") or (event["event"] == "skipped" and event["document"]):
+                handled += 1
+                progress_bar.progress(min(handled / total, 1.0) if total else 1.0)
+            elif event["event"] == "done":
+                summary = event
 
         spinner.empty()
         progress_bar.empty()
         status_text.empty()
 
+        st.session_state.batch_run_manager.record_run(
+            BatchRunManager.new_run_id(), project_id, summary, settings, profiler
+        )
+        results_generated = summary["results"]
+
         # Show results summary
         if results_generated > 0:
             st.success(f"✅ Successfully generated {results_generated} results!")
 
-        if errors:
+        if summary["skipped"]:
+            with st.expander(f"⏭️ Skipped ({len(summary['skipped'])})", expanded=True):
+                for entry in summary["skipped"]:
+                    target = f"{entry['workflow']} on {entry['document']}" if entry['document'] else entry['workflow']
+                    st.warning(f"{target}: {entry['reason']}")
+
+        if summary["errors"]:
             with st.expander("⚠️ Errors encountered", expanded=True):
-                for error in errors:
+                for error in summary["errors"]:
                     st.error(error)
 
         # Refresh to show new results
@@ -457,6 +662,78 @@ def show_project_documents_tab(project_id):
                         spinner.empty()
                         st.error(f"❌ Error uploading document: {str(e)}")
 
+    # Bulk import section
+    with st.expander("📦 Bulk Import (ZIP or Folder)", expanded=False):
+        import_source = st.radio(
+            "Import from",
+            ["ZIP archive", "Server folder"],
+            horizontal=True,
+            key="bulk_import_source"
+        )
+
+        if import_source == "ZIP archive":
+            zip_file = st.file_uploader("Choose a ZIP of Word or PDF documents", type=['zip'], key="bulk_zip")
+            folder_path = None
+        else:
+            zip_file = None
+            folder_path = st.text_input("Folder path on the server", key="bulk_folder")
+
+        if st.button("📥 Import Documents", type="primary", key="bulk_import",
+                     disabled=not (zip_file or folder_path)):
+            ingestor = BulkIngestor(st.session_state.source_manager)
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            failures = []
+
+            try:
+                if zip_file:
+                    events = ingestor.ingest_zip(zip_file, project_id=project_id)
+                else:
+                    events = ingestor.ingest_directory(folder_path, project_id=project_id)
+
+                for event in events:
+                    if event["event"] in ("extracted", "failed"):
+                        progress_bar.progress(event["completed"] / event["total"])
+                        status_text.text(f"Extracted {event['completed']}/{event['total']}: {event['filename']}")
+                    if event["event"] == "failed":
+                        failures.append(f"{event['filename']}: {event['error']}")
+                    elif event["event"] == "skipped":
+                        failures.append(f"{event['filename']}: {event['reason']}")
+                    elif event["event"] == "done":
+                        progress_bar.empty()
+                        status_text.empty()
+                        if event["documents"]:
+                            st.success(f"✅ Imported {len(event['documents'])} documents")
+
+                if failures:
+                    with st.expander(f"⚠️ {len(failures)} files not imported", expanded=True):
+                        for failure in failures:
+                            st.error(failure)
+            except Exception as e:
+                progress_bar.empty()
+                status_text.empty()
+                st.error(f"❌ Error importing documents: {str(e)}")
+
+    # Hot folder configuration for the ingest service
+    with st.expander("📂 Hot Folder", expanded=False):
+        project = st.session_state.project_manager.get_project(project_id)
+        hot_folder = project.get('metadata', {}).get('hot_folder') or {}
+        folder_path = st.text_input(
+            "Folder to watch on the server",
+            value=hot_folder.get('path', ''),
+            key="hot_folder_path"
+        )
+        run_workflows = st.checkbox(
+            "Run this project's workflows on each new document",
+            value=hot_folder.get('run_workflows', False),
+            key="hot_folder_run_workflows"
+        )
+        st.caption("Documents dropped into this folder are ingested by the ingest service "
+                   "(`python ingest_service.py`).")
+        if st.button("💾 Save Hot Folder", key="save_hot_folder"):
+            st.session_state.project_manager.set_hot_folder(project_id, folder_path.strip() or None, run_workflows)
+            st.success("Hot folder saved" if folder_path.strip() else "Hot folder cleared")
+
     # Document library
     st.markdown("### 📚 Documents in this Project")
 
@@ -491,11 +768,15 @@ def show_project_documents_tab(project_id):
                                 <p style="color: #999; font-size: 0.8em;">
                                     Uploaded: {doc['uploaded_at'][:10]} | 
                                     Size: {doc['file_size'] // 1024}KB |
-                                    Length: {doc['text_length']} chars
+                                    Length: {doc['text_length']} chars{f" | {doc['token_count']:,} tokens" if doc.get('token_count') is not None else ""}{f" | Tokens saved: {doc['normalisation']['token_reduction_pct']}%" if doc.get('normalisation') else ""}
                                 </p>
                             </div>
                             """, unsafe_allow_html=True)
 
+                            # Show where the search query matched inside the document
+                            if doc.get('snippet'):
+                                st.markdown(f"> {doc['snippet']}")
+
                             col_a, col_b, col_c = st.columns(3)
                             with col_a:
                                 if st.button("👁️ Preview", key=f"preview_{doc['id']}"):
@@ -504,7 +785,7 @@ def show_project_documents_tab(project_id):
                                 if st.button("✅ Select", key=f"select_{doc['id']}", type="primary"):
                                     st.session_state.selected_source_document_id = doc['id']
                                     st.session_state.current_document = doc['name']
-                                    st.session_state.current_document_text = st.session_state.source_manager.get_document_text(
+                                    st.session_state.current_document_handle = st.session_state.source_manager.get_document_handle(
                                         doc['id'],
                                         project_id=project_id
                                     )
@@ -519,13 +800,15 @@ def show_project_documents_tab(project_id):
 
         # Preview section
         if hasattr(st.session_state, 'preview_doc_id'):
-            doc_text = st.session_state.source_manager.get_document_text(
+            # Only the first 2000 bytes are read from disk for the preview
+            doc_text = st.session_state.source_manager.get_document_text_range(
                 st.session_state.preview_doc_id,
-                project_id=project_id
+                project_id=project_id,
+                length=2000
             )
             if doc_text:
                 st.markdown("### Document Preview")
-                st.text_area("", doc_text[:2000] + "...", height=300, disabled=True)
+                st.text_area("", doc_text + "...", height=300, disabled=True)
     else:
         st.info("📭 No documents in this project yet. Upload your first document above!")
 
@@ -675,6 +958,69 @@ def show_project_workflows_tab_content(project_id):
         else:
             st.info("No workflows in this project yet. Create a new one or import from library!")
 
+def run_workflow_streaming(workflow, document_id, template_id, project_id):
+    """
+    Run a workflow with its prompts in parallel, showing the template filling
+    in as each answer streams back
+
+    Returns:
+        process_workflow_with_template() result
+    """
+    template_content = st.session_state.template_manager.read_template_content(template_id) or ""
+    markers = [f"{p['name'].upper().replace(' ', '_')}_OUTPUT" for p in workflow['prompts']]
+    preview = st.empty()
+    updates = queue.Queue()
+    outcome = {}
+
+    # Session state is only reachable from the script thread, so hand the
+    # worker its managers; it passes partial answers back through the queue
+    managers = (st.session_state.workflow_manager, st.session_state.template_manager,
+                st.session_state.source_manager, st.session_state.gpt_handler,
+                st.session_state.prompt_manager)
+
+    def work():
+        workflow_manager, template_manager, source_manager, gpt_handler, prompt_manager = managers
+        try:
+            outcome["result"] = workflow_manager.process_workflow_with_template(
+                workflow['name'],
+                document_id,
+                template_manager,
+                source_manager,
+                gpt_handler,
+                prompt_manager,
+                project_id=project_id,
+                on_update=lambda marker, text: updates.put((marker, text))
+            )
+        except Exception as e:
+            outcome["result"] = {"error": str(e)}
+        finally:
+            updates.put(None)
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+
+    answers = {}
+    finished = False
+    while not finished:
+        # Wait for the next update, then take everything else already queued
+        pending = [updates.get()]
+        while not updates.empty():
+            pending.append(updates.get())
+        for update in pending:
+            if update is None:
+                finished = True
+            else:
+                answers[update[0]] = update[1]
+
+        draft = template_content
+        for marker in markers:
+            draft = draft.replace(f"{{{marker}}}", answers.get(marker, "⏳"))
+        preview.markdown(draft)
+
+    worker.join()
+    preview.empty()
+    return outcome["result"]
+
 def show_workflow_runner(workflow_name, project_id):
     """Inline workflow runner within the workflows tab"""
     workflow = st.session_state.workflow_manager.get_workflow(workflow_name, project_id=project_id)
@@ -740,7 +1086,6 @@ def show_workflow_runner(workflow_name, project_id):
     # Run button
     if st.session_state.get('workflow_source_doc') and st.session_state.get('workflow_template'):
         if st.button("⚡ Execute Workflow", type="primary", use_container_width=True):
-            spinner = create_loading_spinner("Processing workflow...")
             try:
                 # Update workflow template if changed
                 if workflow.get('template_id') != st.session_state.workflow_template:
@@ -750,18 +1095,9 @@ def show_workflow_runner(workflow_name, project_id):
                         project_id=project_id
                     )
 
-                # Process workflow
-                result = st.session_state.workflow_manager.process_workflow_with_template(
-                    workflow_name,
-                    st.session_state.workflow_source_doc,
-                    st.session_state.template_manager,
-                    st.session_state.source_manager,
-                    st.session_state.gpt_handler,
-                    st.session_state.prompt_manager,
-                    project_id=project_id
-                )
-
-                spinner.empty()
+                # Process workflow, streaming answers into the template preview
+                result = run_workflow_streaming(workflow, st.session_state.workflow_source_doc,
+                                                st.session_state.workflow_template, project_id)
 
                 if "error" in result:
                     st.error(result["error"])
@@ -773,7 +1109,9 @@ def show_workflow_runner(workflow_name, project_id):
                     workflow_name=workflow['name'],
                     document_id=st.session_state.workflow_source_doc,
                     results=result['results'],
-                    template_content=result['content']
+                    template_content=result['content'],
+                    result_details=result.get('result_details'),
+                    timings=result.get('timings')
                 )
 
                 st.success("✅ Workflow completed successfully!")
@@ -792,7 +1130,6 @@ def show_workflow_runner(workflow_name, project_id):
                     )
 
             except Exception as e:
-                spinner.empty()
                 st.error(f"Error processing workflow: {str(e)}")
     else:
         st.info("👆 Please select both a document and a template to run the workflow")
@@ -819,12 +1156,41 @@ def show_project_results_tab(project_id):
         unique_docs = len(set(e['document_id'] for e in executions))
         st.metric("Documents Processed", unique_docs)
 
+    show_project_performance(project_id)
+
     st.markdown("---")
 
-    # Display recent executions
-    st.markdown("### Recent Executions")
+    # Search across per-marker answers and generated documents
+    search_query = st.text_input("🔍 Search results", key="search_results",
+                                 placeholder="e.g. break clause six months notice")
+    if search_query:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            workflow_names = sorted(set(e['workflow_name'] for e in executions))
+            workflow_filter = st.selectbox("Workflow", ["All"] + workflow_names, key="search_results_workflow")
+        with col2:
+            marker_names = sorted(set(m for e in executions for m in (e.get('results') or {})))
+            marker_filter = st.selectbox("Marker", ["All"] + marker_names, key="search_results_marker")
+        with col3:
+            date_from = st.date_input("From", value=None, key="search_results_from")
+        with col4:
+            date_to = st.date_input("To", value=None, key="search_results_to")
+
+        displayed_executions = st.session_state.execution_manager.search_executions(
+            search_query,
+            project_id=project_id,
+            workflow_name=None if workflow_filter == "All" else workflow_filter,
+            marker=None if marker_filter == "All" else marker_filter,
+            date_from=date_from.isoformat() if date_from else None,
+            date_to=date_to.isoformat() if date_to else None
+        )
+        st.markdown(f"### Matching Executions ({len(displayed_executions)})")
+    else:
+        # Display recent executions
+        displayed_executions = executions[:20]  # Show last 20
+        st.markdown("### Recent Executions")
 
-    for execution in executions[:20]:  # Show last 20
+    for execution in displayed_executions:
         # Get document info
         doc = st.session_state.source_manager.get_document(
             execution['document_id'],
@@ -839,6 +1205,20 @@ def show_project_results_tab(project_id):
             st.markdown(f"**Execution ID:** {execution['id']}")
             st.markdown(f"**Status:** {execution['status']}")
 
+            models = {
+                marker: detail['model'] + (f" (escalated from {detail['escalated_from']})"
+                                           if detail.get('escalated_from') else "")
+                for marker, detail in (execution.get('result_details') or {}).items() if detail.get('model')
+            }
+            if models:
+                st.caption("Models: " + " · ".join(f"{marker}: {model}" for marker, model in models.items()))
+
+            show_execution_breakdown(execution)
+
+            for match in execution.get('matches', []):
+                label = "Generated document" if match['marker'] == "__CONTENT__" else match['marker']
+                st.markdown(f"🔎 **{label}:** {match['snippet']}")
+
             if execution.get('template_content'):
                 st.markdown("### Generated Document")
                 st.markdown(execution['template_content'])
@@ -857,6 +1237,75 @@ def show_project_results_tab(project_id):
                     if st.session_state.execution_manager.delete_execution(execution['id']):
                         st.rerun()
 
+def _seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+def show_project_performance(project_id):
+    """Latency percentiles and cost per workflow, from the execution rollup"""
+    summary = st.session_state.execution_manager.get_project_summary(project_id)
+    if not summary or not summary['total']['prompt_calls']:
+        return
+
+    total = summary['total']
+    with st.expander("⏱️ Performance and cost", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Prompt latency p50", _seconds(total['prompt_p50_seconds']),
+                      help=f"p95: {_seconds(total['prompt_p95_seconds'])}")
+        with col2:
+            st.metric("Execution time p50", _seconds(total['execution_p50_seconds']),
+                      help=f"p95: {_seconds(total['execution_p95_seconds'])}")
+        with col3:
+            st.metric("Total cost", f"${total['cost']:.2f}",
+                      help=f"{total['input_tokens']:,} input and {total['output_tokens']:,} output tokens")
+        with col4:
+            st.metric("Retries", f"{total['retries']:,}",
+                      help=f"{total['cache_hits']:,} prompts served with a cache hit")
+
+        st.caption("Percentiles are estimated from latency buckets")
+        st.table([
+            {"Workflow": name,
+             "Executions": stats['executions'],
+             "Prompt p50": _seconds(stats['prompt_p50_seconds']),
+             "Prompt p95": _seconds(stats['prompt_p95_seconds']),
+             "Execution p50": _seconds(stats['execution_p50_seconds']),
+             "Execution p95": _seconds(stats['execution_p95_seconds']),
+             "Cost": f"${stats['cost']:.3f}",
+             "Cost/execution": f"${stats['cost_per_execution']:.4f}"}
+            for name, stats in summary['workflows'].items()
+        ])
+
+def show_execution_breakdown(execution):
+    """Timing, token and cost breakdown of one execution, when it was recorded"""
+    timings = execution.get('timings')
+    details = {marker: detail for marker, detail in (execution.get('result_details') or {}).items()
+               if detail.get('latency_seconds') is not None}
+    if not timings and not details:
+        return
+
+    if timings:
+        cache = {True: " (cached)", False: " (read from disk)"}.get(timings.get('text_cache_hit'), "")
+        st.caption(
+            f"⏱️ Total {_seconds(timings.get('total_seconds'))} · "
+            f"Document text {_seconds(timings.get('extract_seconds'))}{cache} · "
+            f"Prompts {_seconds(timings.get('llm_seconds'))} · "
+            f"Template load {_seconds(timings.get('template_load_seconds'))} · "
+            f"Render {_seconds(timings.get('render_seconds'))}"
+        )
+    if details:
+        st.table([
+            {"Marker": marker,
+             "Model": detail.get('model'),
+             "Latency": _seconds(detail.get('latency_seconds')),
+             "Input tokens": detail.get('input_tokens'),
+             "Output tokens": detail.get('output_tokens'),
+             "Cost": f"${detail.get('cost') or 0.0:.4f}",
+             "Retries": detail.get('retries', 0),
+             "Cache hit": ", ".join(k.replace('_', ' ') for k, hit in (detail.get('cache_hits') or {}).items()
+                                    if hit) or "-"}
+            for marker, detail in details.items()
+        ])
+
 def show_project_templates_tab(project_id):
     """Display template management within a project context"""
     st.header("📋 Project Templates")
@@ -977,6 +1426,19 @@ def show_workflow_editor(workflow_name, project_id):
         new_prompt_name = st.text_input("Prompt Name", key="new_prompt_name")
         new_prompt_description = st.text_area("Description", key="new_prompt_description")
         new_prompt_text = st.text_area("Prompt", key="new_prompt_text", height=100)
+        profile_col1, profile_col2 = st.columns(2)
+        with profile_col1:
+            new_prompt_model = st.selectbox(
+                "Model",
+                ["Default"] + MODEL_CHOICES,
+                key="new_prompt_model",
+                help="'auto' sends short extraction prompts to a small model and escalates doubtful answers"
+            )
+        with profile_col2:
+            new_prompt_max_tokens = st.number_input(
+                "Max answer tokens (0 for default)", min_value=0, max_value=16000, value=0,
+                key="new_prompt_max_tokens"
+            )
 
         if st.button("Add to Workflow", type="primary", key="add_new_prompt"):
             if new_prompt_name and new_prompt_text:
@@ -986,6 +1448,10 @@ def show_workflow_editor(workflow_name, project_id):
                     "prompt": new_prompt_text,
                     "type": "custom"
                 }
+                if new_prompt_model != "Default":
+                    prompt_data["model"] = new_prompt_model
+                if new_prompt_max_tokens:
+                    prompt_data["max_tokens"] = int(new_prompt_max_tokens)
                 if st.session_state.workflow_manager.add_prompt_to_workflow(
                     workflow_name, 
                     prompt_data,
@@ -1005,6 +1471,9 @@ def show_workflow_editor(workflow_name, project_id):
             with st.expander(f"{prompt_data['name']}", expanded=False):
                 st.markdown("#### Current Prompt")
                 st.markdown(f"```\n{prompt_data['prompt']}\n```")
+                if prompt_data.get('model') or prompt_data.get('max_tokens'):
+                    st.caption(f"Model: {prompt_data.get('model', 'default')} · "
+                               f"Max tokens: {prompt_data.get('max_tokens', 'default')}")
     else:
         st.info("No prompts added to this workflow yet")
 
@@ -1037,7 +1506,7 @@ def show_workflow_testing(workflow_name, project_id):
         st.rerun()
 
     # Check if we have a document to test with
-    if not st.session_state.current_document_text:
+    if not st.session_state.current_document_handle:
         st.warning("Please select a document first to test prompts")
         return
 
@@ -1064,34 +1533,37 @@ def show_workflow_testing(workflow_name, project_id):
 
             with col1:
                 if st.button("🔄 Test Original", key=f"test_original_{idx}"):
-                    spinner = create_loading_spinner("Testing original prompt...")
+                    answer = st.empty()
+                    answer.caption("Testing original prompt...")
                     try:
-                        result = st.session_state.gpt_handler.process_document(
-                            st.session_state.current_document_text,
-                            prompt_data['prompt'],
-                            st.session_state.prompt_manager.get_system_prompt()
+                        # Same model profile and prompt name as a workflow run
+                        result = st.session_state.gpt_handler.process_prompt(
+                            st.session_state.current_document_handle.text(),
+                            prompt_data,
+                            st.session_state.prompt_manager.get_system_prompt(),
+                            on_token=answer.markdown
                         )
-                        spinner.empty()
-                        st.session_state.test_results[f"original_{prompt_data['name']}"] = result
+                        st.session_state.test_results[f"original_{prompt_data['name']}"] = result["content"]
                         st.rerun()
                     except Exception as e:
-                        spinner.empty()
+                        answer.empty()
                         st.error(f"Error testing prompt: {str(e)}")
 
             with col2:
                 if st.button("🔄 Test Changes", key=f"test_changes_{idx}"):
-                    spinner = create_loading_spinner("Testing changes...")
+                    answer = st.empty()
+                    answer.caption("Testing changes...")
                     try:
-                        result = st.session_state.gpt_handler.process_document(
-                            st.session_state.current_document_text,
-                            edited_prompt,
-                            st.session_state.prompt_manager.get_system_prompt()
+                        result = st.session_state.gpt_handler.process_prompt(
+                            st.session_state.current_document_handle.text(),
+                            {**prompt_data, 'prompt': edited_prompt},
+                            st.session_state.prompt_manager.get_system_prompt(),
+                            on_token=answer.markdown
                         )
-                        spinner.empty()
-                        st.session_state.test_results[f"edited_{prompt_data['name']}"] = result
+                        st.session_state.test_results[f"edited_{prompt_data['name']}"] = result["content"]
                         st.rerun()
                     except Exception as e:
-                        spinner.empty()
+                        answer.empty()
                         st.error(f"Error testing changes: {str(e)}")
 
             # Display test results
@@ -1126,6 +1598,10 @@ def show_workflow_testing(workflow_name, project_id):
                                 'prompt': edited_prompt,
                                 'type': prompt_data.get('type', 'custom')
                             }
+                            # Keep the prompt's model profile
+                            for profile_key in ('model', 'max_tokens'):
+                                if profile_key in prompt_data:
+                                    updated_prompt[profile_key] = prompt_data[profile_key]
                             if st.session_state.workflow_manager.update_workflow_prompt(
                                 workflow_name, 
                                 idx, 
@@ -1147,13 +1623,101 @@ def show_workflow_testing(workflow_name, project_id):
                                 del st.session_state.test_results[edited_key]
                             st.rerun()
 
+def _histogram_rows(histogram, label_names):
+    """One row per series of a histogram: its labels, count, mean, p50 and p95"""
+    rows = []
+    for labels, state in sorted(histogram.series(), key=lambda s: [s[0][n] for n in label_names]):
+        if not state['count']:
+            continue
+        row = {name.capitalize(): labels[name] for name in label_names}
+        row.update({
+            "Count": state['count'],
+            "Mean (s)": round(state['sum'] / state['count'], 3),
+            "p50 (s)": round(histogram.quantile(0.5, **labels), 3),
+            "p95 (s)": round(histogram.quantile(0.95, **labels), 3)
+        })
+        rows.append(row)
+    return rows
+
+def show_metrics_page():
+    """Live throughput, latency and queue metrics of this process"""
+    st.markdown("## 📈 Metrics")
+    if st.button("← Back", key="close_metrics"):
+        st.session_state.show_metrics = False
+        st.rerun()
+
+    if st.session_state.metrics_url:
+        st.caption(f"Prometheus endpoint: {st.session_state.metrics_url}")
+    else:
+        st.caption("Prometheus endpoint disabled (PROMPTFLOW_METRICS_PORT=0 or port in use)")
+    if st.session_state.api_url:
+        st.caption(f"HTTP API: {st.session_state.api_url}")
+
+    metrics_registry.collect()
+    window = f"last {RATE_WINDOW_SECONDS // 60} min"
+    lookups = metrics_registry.get("promptflow_text_cache_requests_total")
+    hits = lookups.total(result="hit") if lookups else 0
+    misses = lookups.total(result="miss") if lookups else 0
+    llm_waiting = metrics_registry.get("promptflow_llm_queue_depth")
+    pairs_per_minute = 60 * (BATCH_PAIRS.rate_per_second(outcome="completed") +
+                             BATCH_PAIRS.rate_per_second(outcome="failed"))
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        p95 = LLM_REQUEST_SECONDS.quantile(0.95)
+        st.metric("LLM calls", f"{LLM_REQUESTS.total(outcome='ok'):,.0f}",
+                  help=f"{LLM_REQUESTS.total(outcome='error'):,.0f} failed")
+        st.caption(f"p95 latency: {p95:.2f}s" if p95 is not None else "No calls yet")
+    with col2:
+        st.metric("Output tokens/s", f"{LLM_TOKENS.rate_per_second(direction='output'):.1f}", help=window)
+    with col3:
+        st.metric("Batch pairs/min", f"{pairs_per_minute:.1f}", help=window)
+    with col4:
+        st.metric("Text cache hit rate", f"{hits / (hits + misses):.0%}" if hits + misses else "-")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Batch pairs queued", f"{sum(v for _, v in BATCH_QUEUE_DEPTH.series()):.0f}")
+    with col2:
+        st.metric("LLM calls waiting", f"{sum(v for _, v in llm_waiting.series()) if llm_waiting else 0:.0f}")
+
+    st.markdown("**LLM latency by model and prompt**")
+    rows = _histogram_rows(LLM_REQUEST_SECONDS, ("model", "prompt"))
+    if rows:
+        st.table(rows)
+    else:
+        st.info("No LLM calls yet")
+    rows = _histogram_rows(LLM_FIRST_TOKEN_SECONDS, ("model",))
+    if rows:
+        st.markdown("**Time to first token**")
+        st.table(rows)
+
+    st.markdown("**Extraction time by format**")
+    rows = _histogram_rows(EXTRACTION_SECONDS, ("format",))
+    if rows:
+        st.table(rows)
+    else:
+        st.info("No documents extracted yet")
+
+    st.markdown("**Persistence latency**")
+    rows = _histogram_rows(PERSIST_SECONDS, ("store", "operation"))
+    if rows:
+        st.table(rows)
+    else:
+        st.info("Nothing written yet")
+
+    with st.expander("Prometheus text", expanded=False):
+        st.code(metrics_registry.exposition(), language="text")
+
 def main():
     """Main application entry point"""
     try:
         initialize_session_state()
 
         # Show different UI based on whether a project is selected
-        if st.session_state.current_project_id:
+        if st.session_state.show_metrics:
+            show_metrics_page()
+        elif st.session_state.current_project_id:
             show_project_workspace()
         else:
             show_project_selection()
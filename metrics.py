@@ -0,0 +1,380 @@
+import bisect
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, List, Dict, Optional, Tuple
+
+# Local port serving /metrics in the Prometheus text format (0 to disable)
+METRICS_PORT = int(os.environ.get("PROMPTFLOW_METRICS_PORT", "9464"))
+METRICS_HOST = os.environ.get("PROMPTFLOW_METRICS_HOST", "127.0.0.1")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+TOKEN_RATE_BUCKETS = (5, 10, 20, 40, 80, 160, 320)
+# Counters with a rate window remember this much recent history
+RATE_WINDOW_SECONDS = 300
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def bucket_quantile(bounds: Tuple[float, ...], counts: List[int], q: float) -> Optional[float]:
+    """
+    Estimate a quantile from histogram bucket counts (one per bound plus the
+    overflow bucket), interpolating within a bucket as Prometheus'
+    histogram_quantile does
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if index == len(bounds):
+                return bounds[-1]
+            lower = bounds[index - 1] if index else 0.0
+            return lower + (bounds[index] - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-1]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """A named metric with a fixed set of label names"""
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: tuple, extra: Optional[Dict] = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def series(self) -> List[Tuple[Dict, object]]:
+        """(labels, value) of every label combination seen so far"""
+        with self._lock:
+            return [(dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Monotonic total; with rate_window it can also report a recent rate"""
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 rate_window: Optional[float] = None):
+        super().__init__(name, documentation, labels)
+        self.rate_window = rate_window
+        self._recent = deque()  # (timestamp, label values, amount) within rate_window
+        self._created = time.monotonic()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            if self.rate_window:
+                now = time.monotonic()
+                self._recent.append((now, key, amount))
+                while self._recent and now - self._recent[0][0] > self.rate_window:
+                    self._recent.popleft()
+
+    def set_total(self, value: float, **labels):
+        """For collectors mirroring a total kept elsewhere"""
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def rate_per_second(self, **match) -> float:
+        """Increase per second over the rate window, summed over the series whose labels include match"""
+        if not self.rate_window:
+            raise ValueError(f"{self.name} has no rate window")
+        wanted = [(self.labels.index(name), str(value)) for name, value in match.items()]
+        now = time.monotonic()
+        with self._lock:
+            total = sum(amount for at, key, amount in self._recent
+                        if now - at <= self.rate_window and all(key[i] == v for i, v in wanted))
+        # A process younger than the window has only been counting for its uptime
+        return total / max(1.0, min(self.rate_window, now - self._created))
+
+    def total(self, **match) -> float:
+        return sum(value for labels, value in self.series()
+                   if all(labels.get(k) == str(v) for k, v in match.items()))
+
+    def exposition(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def exposition(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum"""
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def series(self) -> List[Tuple[Dict, Dict]]:
+        with self._lock:
+            return [(dict(zip(self.labels, key)), {"counts": list(state["counts"]), "sum": state["sum"],
+                                                   "count": state["count"]})
+                    for key, state in self._values.items()]
+
+    def quantile(self, q: float, **match) -> Optional[float]:
+        """
+        Estimate a quantile from the buckets (as Prometheus' histogram_quantile
+        does), over every series whose labels include match
+        """
+        counts = [0] * (len(self.buckets) + 1)
+        for labels, state in self.series():
+            if all(labels.get(k) == str(v) for k, v in match.items()):
+                counts = [a + b for a, b in zip(counts, state["counts"])]
+        return bucket_quantile(self.buckets, counts, q)
+
+    def exposition(self) -> List[str]:
+        lines = []
+        with self._lock:
+            values = [(key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items()]
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(key, {'le': _format_value(bound)})} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The process's metrics. Collectors registered with add_collector() run
+    before each export, to copy in stats kept by other components (the LLM
+    scheduler, the text cache, the hedger).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                rate_window: Optional[float] = None) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels, rate_window)
+
+    def gauge(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets)
+
+    def add_collector(self, collector: Callable[[], None]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+    def get(self, name: str) -> Optional[_Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def exposition(self) -> str:
+        """All metrics in the Prometheus text format"""
+        self.collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.exposition())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+LLM_REQUEST_SECONDS = registry.histogram(
+    "promptflow_llm_request_seconds", "Completion call latency", ("model", "prompt"), LLM_BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "promptflow_llm_time_to_first_token_seconds", "Time to the first streamed token", ("model",), LLM_BUCKETS)
+LLM_REQUESTS = registry.counter(
+    "promptflow_llm_requests_total", "Completion calls by outcome (ok or error)", ("model", "outcome"))
+LLM_TOKENS = registry.counter(
+    "promptflow_llm_tokens_total", "Tokens sent (input) and generated (output)", ("model", "direction"),
+    rate_window=RATE_WINDOW_SECONDS)
+LLM_OUTPUT_TOKENS_PER_SECOND = registry.histogram(
+    "promptflow_llm_output_tokens_per_second", "Generation speed of each call", ("model",), TOKEN_RATE_BUCKETS)
+BATCH_PAIRS = registry.counter(
+    "promptflow_batch_pairs_total", "Document/workflow pairs handled by batches (completed, failed, skipped)",
+    ("outcome",), rate_window=RATE_WINDOW_SECONDS)
+BATCH_QUEUE_DEPTH = registry.gauge(
+    "promptflow_batch_queue_depth", "Batch pairs planned but not yet started")
+TASK_QUEUE_DEPTH = registry.gauge(
+    "promptflow_task_queue_depth", "Tasks waiting in the shared worker queue (as last seen by this process)")
+WORKER_TASKS = registry.gauge(
+    "promptflow_worker_tasks_in_flight", "Queued tasks this worker process is running")
+EXTRACTION_SECONDS = registry.histogram(
+    "promptflow_extraction_seconds", "Text extraction time per document", ("format",))
+PERSIST_SECONDS = registry.histogram(
+    "promptflow_persist_seconds", "Time to write metadata (json) and search index (sqlite) records",
+    ("store", "operation"))
+
+
+def _collect_components():
+    """Copy in the stats other components keep for themselves"""
+    from call_hedging import call_hedger
+    from document_text import text_cache
+    from llm_scheduler import llm_scheduler
+
+    in_flight = registry.gauge("promptflow_llm_in_flight", "Completion calls running", ("priority",))
+    waiting = registry.gauge("promptflow_llm_queue_depth", "Completion calls waiting for a slot", ("priority",))
+    waited = registry.counter("promptflow_llm_queue_wait_seconds_total", "Time calls spent waiting for a slot",
+                              ("priority",))
+    for priority, stats in llm_scheduler.stats().items():
+        in_flight.set(stats["in_flight"], priority=priority)
+        waiting.set(stats["waiting"], priority=priority)
+        waited.set_total(stats["wait_seconds"], priority=priority)
+
+    cache = text_cache.stats()
+    requests = registry.counter("promptflow_text_cache_requests_total", "Document text cache lookups",
+                                ("result",))
+    requests.set_total(cache["hits"], result="hit")
+    requests.set_total(cache["misses"], result="miss")
+    registry.gauge("promptflow_text_cache_bytes", "Bytes of document text cached").set(cache["bytes"])
+    lookups = cache["hits"] + cache["misses"]
+    registry.gauge("promptflow_text_cache_hit_ratio", "Share of text lookups served from the cache").set(
+        cache["hits"] / lookups if lookups else 0.0)
+
+    hedges = call_hedger.stats()
+    hedge_counter = registry.counter("promptflow_llm_hedger_total", "Hedger calls, errors, timeouts and hedges",
+                                     ("event",))
+    for event in ("calls", "errors", "timeouts", "hedges_issued", "hedges_won"):
+        hedge_counter.set_total(hedges[event], event=event)
+
+    import endpoint_pool
+    if endpoint_pool._shared_pool is not None:
+        endpoint_requests = registry.counter("promptflow_endpoint_requests_total", "Calls per endpoint by outcome",
+                                             ("endpoint", "outcome"))
+        endpoint_latency = registry.gauge("promptflow_endpoint_latency_seconds", "Smoothed endpoint latency",
+                                          ("endpoint",))
+        for stats in endpoint_pool._shared_pool.stats():
+            for outcome in ("successes", "failures", "throttled"):
+                endpoint_requests.set_total(stats[outcome], endpoint=stats["name"], outcome=outcome)
+            if stats["latency_seconds"] is not None:
+                endpoint_latency.set(stats["latency_seconds"], endpoint=stats["name"])
+
+
+registry.add_collector(_collect_components)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[str]:
+    """
+    Serve /metrics from a background thread, once per process
+
+    Returns:
+        URL of the endpoint, or None if disabled or the port is taken
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics endpoint on {host}:{port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return f"http://{_server.server_address[0]}:{_server.server_address[1]}/metrics"
@@ -0,0 +1,77 @@
+import os
+import re
+from typing import Dict
+from token_counter import count_tokens
+
+# "off" uses the default model unless a prompt names one; "auto" routes short
+# extraction prompts to the small model
+MODEL_ROUTING = os.environ.get("PROMPTFLOW_MODEL_ROUTING", "off").lower()
+SMALL_MODEL = os.environ.get("PROMPTFLOW_SMALL_MODEL", "gpt-4o-mini")
+SMALL_MODEL_MAX_TOKENS = 300
+# Prompts up to this many tokens are candidates for the small model
+SHORT_PROMPT_TOKENS = 80
+
+AUTO = "auto"
+MODEL_CHOICES = ["gpt-4o", "gpt-4o-mini", AUTO]
+
+# Wording of a prompt asking for one well-defined fact
+EXTRACTION_PATTERN = re.compile(
+    r"\b(what is|what are|when is|who is|who are|state|extract|identify|list|name of|date|"
+    r"amount|rent|term|address|parties|how much|how long)\b",
+    re.IGNORECASE
+)
+# Answers suggesting the small model was not up to it
+LOW_CONFIDENCE_PATTERN = re.compile(
+    r"\b(i cannot|i can't|i am unable|i'm unable|unable to (determine|find|identify)|not sure|"
+    r"unclear|cannot be determined|i don't know|insufficient information)\b",
+    re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Picks the model and max_tokens for each workflow prompt.
+
+    A prompt may carry its own "model" and "max_tokens". When the model is
+    "auto" (or PROMPTFLOW_MODEL_ROUTING=auto and the prompt names none),
+    short, well-specified extraction prompts go to the small model and are
+    escalated to the default model if the answer is empty, truncated or hedged.
+    """
+
+    def __init__(self, default_model: str, default_max_tokens: int, routing: str = MODEL_ROUTING,
+                 small_model: str = SMALL_MODEL):
+        self.default_model = default_model
+        self.default_max_tokens = default_max_tokens
+        self.routing = routing
+        self.small_model = small_model
+
+    def is_simple_extraction(self, prompt: str) -> bool:
+        return count_tokens(prompt) <= SHORT_PROMPT_TOKENS and bool(EXTRACTION_PATTERN.search(prompt))
+
+    def choose(self, prompt_data: Dict) -> Dict:
+        """
+        Decide how to run a prompt
+
+        Returns:
+            Dict with "model", "max_tokens" and "escalate_to" (None when the
+            answer should be used as is)
+        """
+        model = prompt_data.get('model') or (AUTO if self.routing == AUTO else None)
+        max_tokens = prompt_data.get('max_tokens')
+
+        if model == AUTO:
+            if self.is_simple_extraction(prompt_data['prompt']):
+                return {"model": self.small_model, "max_tokens": max_tokens or SMALL_MODEL_MAX_TOKENS,
+                        "escalate_to": self.default_model}
+            model = None
+
+        return {"model": model or self.default_model, "max_tokens": max_tokens or self.default_max_tokens,
+                "escalate_to": None}
+
+    @staticmethod
+    def needs_escalation(result: Dict) -> bool:
+        """True if a small-model answer is empty, cut off, failed or low-confidence"""
+        content = (result.get("content") or "").strip()
+        if result.get("error") or not content or result.get("finish_reason") == "length":
+            return True
+        return bool(LOW_CONFIDENCE_PATTERN.search(content[:300]))
@@ -75,6 +75,27 @@ class ProjectManager:
                 return project
         return None
 
+    def set_hot_folder(self, project_id: str, folder_path: Optional[str], run_workflows: bool = False) -> Optional[Dict]:
+        """Configure the folder the ingest service watches for a project (None clears it)"""
+        project = self.get_project(project_id)
+        if not project:
+            return None
+
+        metadata = dict(project.get('metadata', {}))
+        if folder_path:
+            metadata['hot_folder'] = {'path': folder_path, 'run_workflows': run_workflows}
+        else:
+            metadata.pop('hot_folder', None)
+        return self.update_project(project_id, {'metadata': metadata})
+
+    def get_hot_folders(self) -> List[Dict]:
+        """Get the hot folder configuration of every project that has one"""
+        return [
+            {'project_id': p['id'], **p['metadata']['hot_folder']}
+            for p in self.projects
+            if p.get('metadata', {}).get('hot_folder')
+        ]
+
     def delete_project(self, project_id: str) -> bool:
         """Delete a project (we'll add document handling later)"""
         self.projects = [p for p in self.projects if p['id'] != project_id]
@@ -0,0 +1,276 @@
+"""
+Run PromptFlow from the command line, without the Streamlit UI.
+
+    python promptflow.py run --project <id or name> [--workflow NAME ...] [--document ID ...]
+        [--concurrency N] [--policy fifo] [--deadline SECONDS] [--incremental] [--shard K/N]
+        [--queue [PATH] [--detach]]
+    python promptflow.py worker [--queue PATH] [--concurrency N] [--exit-when-idle]
+    python promptflow.py queue [--queue PATH] [--batch ID] [--cancel]
+
+Progress is written to stdout as one JSON object per line (the BatchScheduler
+events, each with a "time"). The exit code is 0 when every pair succeeded,
+1 when any failed and 2 for bad arguments, so runs can be scheduled with cron
+and split across machines with --shard, or queued with --queue for worker
+processes on any machine sharing the queue and data files.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import signal
+import sys
+import time
+from typing import List, Dict, Optional, Set, Tuple
+
+from batch_estimator import SCHEDULING_POLICIES, BATCH_CONCURRENCY
+from metrics import start_metrics_server
+from worker_pool import TASK_QUEUE_PATH
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+
+# Where events go; everything else the managers print is sent to stderr
+_events = sys.stdout
+
+
+def emit(event: Dict):
+    """Write one progress event as a JSON line"""
+    print(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **event}, default=str),
+          file=_events, flush=True)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a shard given as K/N into (K, N), with 1 <= K <= N"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard must look like K/N, e.g. 1/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard K/N needs 1 <= K <= N")
+    return index, count
+
+
+def in_shard(document_id: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """Stable split of documents across machines (the same on every host)"""
+    if not shard:
+        return True
+    index, count = shard
+    return int(hashlib.sha256(document_id.encode('utf-8')).hexdigest(), 16) % count == index - 1
+
+
+def up_to_date_pairs(execution_manager, project_id: str, documents: List[Dict],
+                     workflows: List[Dict]) -> Set[Tuple[str, str]]:
+    """
+    Pairs with an execution newer than both the document and the workflow.
+    Prompt edits do not change a workflow's dates, so rerun without
+    --incremental after changing prompts.
+    """
+    latest = execution_manager.get_latest_runs(project_id)
+    current = set()
+    for document in documents:
+        for workflow in workflows:
+            executed_at = latest.get((document['id'], workflow['name']))
+            if executed_at and executed_at >= document.get('uploaded_at', '') \
+                    and executed_at >= workflow.get('created_at', ''):
+                current.add((document['id'], workflow['name']))
+    return current
+
+
+def run(args) -> int:
+    # Imported here so --help works without the OpenAI client configured
+    from batch_runs import BatchRunManager
+    from batch_scheduler import BatchScheduler
+    from execution_manager import ExecutionManager
+    from gpt_handler import GPTHandler
+    from project_manager import ProjectManager
+    from prompt_manager import PromptManager
+    from source_manager import SourceDocumentManager
+    from template_manager import TemplateManager
+    from workflow_manager import WorkflowManager
+
+    projects = ProjectManager()
+    project = projects.get_project(args.project) or next(
+        (p for p in projects.get_projects() if p['name'] == args.project), None)
+    if not project:
+        emit({"event": "error", "error": f"Project not found: {args.project}"})
+        return EXIT_USAGE
+    project_id = project['id']
+
+    source_manager = SourceDocumentManager()
+    workflow_manager = WorkflowManager()
+    execution_manager = ExecutionManager()
+
+    workflows = workflow_manager.get_workflows(project_id)
+    if args.workflows:
+        unknown = set(args.workflows) - {w['name'] for w in workflows}
+        if unknown:
+            emit({"event": "error", "error": f"Workflows not in project: {', '.join(sorted(unknown))}"})
+            return EXIT_USAGE
+        workflows = [w for w in workflows if w['name'] in args.workflows]
+
+    documents = source_manager.get_documents(project_id)
+    if args.documents:
+        unknown = set(args.documents) - {d['id'] for d in documents}
+        if unknown:
+            emit({"event": "error", "error": f"Documents not in project: {', '.join(sorted(unknown))}"})
+            return EXIT_USAGE
+        documents = [d for d in documents if d['id'] in args.documents]
+    documents = [d for d in documents if in_shard(d['id'], args.shard)]
+
+    if not documents or not workflows:
+        emit({"event": "done", "results": 0, "errors": [], "skipped": [], "elapsed_seconds": 0.0,
+              "message": "No documents or workflows to process"})
+        return EXIT_OK
+
+    exclude = up_to_date_pairs(execution_manager, project_id, documents, workflows) if args.incremental else None
+
+    try:
+        gpt_handler = GPTHandler()
+    except Exception as e:
+        emit({"event": "error", "error": f"Could not set up the OpenAI client: {e}"})
+        return EXIT_USAGE
+
+    scheduler = BatchScheduler(workflow_manager, TemplateManager(), source_manager, gpt_handler,
+                               PromptManager(), execution_manager)
+    if args.queue:
+        from worker_pool import TaskQueue, submit_batch
+        queue = TaskQueue(args.queue)
+        batch_id, skipped = submit_batch(queue, scheduler, project_id, documents, workflows,
+                                         policy=args.policy, exclude=exclude)
+        emit({"event": "queued", "batch_id": batch_id, "queue": args.queue,
+              "total": queue.batch_status(batch_id).get("queued", 0)})
+        if args.detach:
+            return EXIT_OK
+        events = queue.follow(batch_id, skipped)
+    else:
+        events = scheduler.run(project_id, documents, workflows, policy=args.policy,
+                               concurrency=args.concurrency, deadline_seconds=args.deadline, exclude=exclude)
+
+    summary = None
+    try:
+        for event in events:
+            emit(event)
+            if event["event"] == "done":
+                summary = event
+    except KeyboardInterrupt:
+        # Queued tasks keep running on the workers
+        emit({"event": "error", "error": "Interrupted"})
+        return EXIT_FAILURES
+
+    settings = {"policy": args.policy, "concurrency": args.concurrency, "deadline_seconds": args.deadline,
+                "incremental": args.incremental, "shard": "/".join(map(str, args.shard)) if args.shard else None,
+                "queue": args.queue or None, "source": "cli"}
+    BatchRunManager().record_run(BatchRunManager.new_run_id(), project_id, summary, settings)
+    return EXIT_FAILURES if summary["errors"] else EXIT_OK
+
+
+def worker(args) -> int:
+    from execution_manager import ExecutionManager
+    from gpt_handler import GPTHandler
+    from prompt_manager import PromptManager
+    from source_manager import SourceDocumentManager
+    from template_manager import TemplateManager
+    from workflow_manager import WorkflowManager
+    from worker_pool import TaskQueue, BatchWorker
+
+    try:
+        gpt_handler = GPTHandler()
+    except Exception as e:
+        emit({"event": "error", "error": f"Could not set up the OpenAI client: {e}"})
+        return EXIT_USAGE
+
+    pool = BatchWorker(TaskQueue(args.queue), WorkflowManager(), TemplateManager(), SourceDocumentManager(),
+                       gpt_handler, PromptManager(), ExecutionManager(), concurrency=args.concurrency,
+                       worker_id=args.worker_id)
+    # Finish the tasks in flight on SIGTERM instead of leaving them to time out
+    signal.signal(signal.SIGTERM, lambda signum, frame: pool.stop())
+    emit({"event": "worker_started", "worker_id": pool.worker_id, "queue": args.queue,
+          "concurrency": pool.concurrency})
+    try:
+        pool.run(exit_when_idle=args.exit_when_idle)
+    except KeyboardInterrupt:
+        pool.stop()
+    emit({"event": "worker_stopped", "worker_id": pool.worker_id, **pool.stats})
+    return EXIT_FAILURES if pool.stats["failed"] else EXIT_OK
+
+
+def queue_status(args) -> int:
+    from worker_pool import TaskQueue
+
+    queue = TaskQueue(args.queue)
+    if args.batch:
+        if args.cancel:
+            emit({"event": "cancelled", "batch_id": args.batch, "tasks": queue.cancel(args.batch)})
+        emit({"event": "batch", "batch_id": args.batch, "tasks": queue.batch_status(args.batch)})
+    elif args.cancel:
+        emit({"event": "error", "error": "--cancel needs --batch"})
+        return EXIT_USAGE
+    emit({"event": "queue", "queue": args.queue, "queued": queue.depth(), "workers": queue.workers()})
+    return EXIT_OK
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run a project's workflows on its documents")
+    run_parser.add_argument("--project", required=True, help="Project ID or name")
+    run_parser.add_argument("--workflow", action="append", dest="workflows",
+                            help="Only run this workflow (repeatable; default all)")
+    run_parser.add_argument("--document", action="append", dest="documents",
+                            help="Only process this document ID (repeatable; default all)")
+    run_parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                            help="Pairs processed at the same time")
+    run_parser.add_argument("--policy", choices=SCHEDULING_POLICIES, default="fifo",
+                            help="Order pairs are run in")
+    run_parser.add_argument("--deadline", type=float, help="Skip work not expected to finish within this many seconds")
+    run_parser.add_argument("--incremental", action="store_true",
+                            help="Skip pairs already run since the document and workflow were added")
+    run_parser.add_argument("--shard", type=parse_shard,
+                            help="Only process this machine's share of the documents, e.g. 2/4")
+    run_parser.add_argument("--queue", nargs="?", const=TASK_QUEUE_PATH or "task_queue.db",
+                            help="Queue the pairs for worker processes instead of running them here, "
+                                 "in this task queue (default PROMPTFLOW_TASK_QUEUE)")
+    run_parser.add_argument("--detach", action="store_true",
+                            help="With --queue, exit once queued instead of following the batch")
+    run_parser.add_argument("--metrics-port", type=int, default=0,
+                            help="Serve /metrics on this port during the run (default off)")
+    run_parser.set_defaults(handler=run)
+
+    worker_parser = commands.add_parser("worker", help="Run queued batch tasks until stopped")
+    worker_parser.add_argument("--queue", default=TASK_QUEUE_PATH or "task_queue.db",
+                               help="Task queue database (PROMPTFLOW_TASK_QUEUE)")
+    worker_parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                               help="Tasks run at the same time")
+    worker_parser.add_argument("--worker-id", help="Name shown in queue status (default host-pid)")
+    worker_parser.add_argument("--exit-when-idle", action="store_true",
+                               help="Stop once no task is queued or leased instead of waiting for more")
+    worker_parser.add_argument("--metrics-port", type=int, default=0,
+                               help="Serve /metrics on this port (default off)")
+    worker_parser.set_defaults(handler=worker)
+
+    queue_parser = commands.add_parser("queue", help="Show the task queue, its workers or a batch")
+    queue_parser.add_argument("--queue", default=TASK_QUEUE_PATH or "task_queue.db",
+                              help="Task queue database (PROMPTFLOW_TASK_QUEUE)")
+    queue_parser.add_argument("--batch", help="Batch ID to report on")
+    queue_parser.add_argument("--cancel", action="store_true", help="Drop the batch's tasks not started yet")
+    queue_parser.set_defaults(handler=queue_status)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if args.detach and not args.queue:
+            parser.error("--detach needs --queue")
+        if args.queue and args.deadline:
+            parser.error("--deadline is not supported with --queue")
+    if getattr(args, "metrics_port", 0):
+        start_metrics_server(args.metrics_port)
+
+    global _events
+    _events = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import contextlib
+import os
+import re
+import sqlite3
+import time
+from typing import List, Dict, Optional, Iterable, Iterator, Callable
+from metrics import PERSIST_SECONDS
+
+GLOBAL_SCOPE = ""  # Stored in place of project_id=None so scoping stays an equality test
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Double-quoted parts are kept as phrases, every other word must appear,
+    and the last bare word is treated as a prefix so results update while typing.
+    """
+    terms = []
+    for phrase in re.findall(r'"([^"]+)"', query):
+        words = re.findall(r"\w+", phrase)
+        if words:
+            terms.append('"' + " ".join(words) + '"')
+
+    remainder = re.sub(r'"[^"]*"', " ", query)
+    words = re.findall(r"\w+", remainder)
+    for i, word in enumerate(words):
+        if i == len(words) - 1:
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'"{word}"')
+
+    return " ".join(terms)
+
+
+class _FullTextIndex:
+    """Shared SQLite FTS5 plumbing for the document and execution indexes"""
+
+    SCHEMA = ""
+
+    def __init__(self, db_path="search_index.db"):
+        self.db_path = db_path
+        self.available = True
+        self._ensure_schema()
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection for one unit of work: committed if it succeeds, rolled back if not, always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _ensure_schema(self):
+        """Create the FTS table if it doesn't exist"""
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(self.SCHEMA)
+        except sqlite3.Error as e:
+            # SQLite builds without FTS5 fall back to scanning the JSON metadata
+            print(f"Full-text search unavailable: {e}")
+            self.available = False
+
+
+class DocumentSearchIndex(_FullTextIndex):
+    """
+    Full-text index over extracted document text, backed by SQLite FTS5.
+    Kept in step with source_documents.json by SourceDocumentManager on
+    upload, delete and move, so searches never rescan the text files.
+    """
+
+    SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            doc_id UNINDEXED,
+            project_id UNINDEXED,
+            name,
+            description,
+            content,
+            tokenize = 'porter unicode61'
+        )
+    """
+
+    def add_document(self, document: Dict, text: str):
+        """Index (or re-index) a single document"""
+        self.add_documents([(document, text)])
+
+    def add_documents(self, documents: Iterable[tuple], replace: bool = True):
+        """
+        Index (or re-index) many (metadata, text) pairs in one transaction.
+        Pass replace=False for documents known not to be indexed yet, which
+        skips the per-document delete (a scan of the whole table).
+        """
+        if not self.available:
+            return
+        start = time.perf_counter()
+        with self._connect() as conn:
+            for document, text in documents:
+                if replace:
+                    conn.execute("DELETE FROM documents_fts WHERE doc_id = ?", (document["id"],))
+                conn.execute(
+                    "INSERT INTO documents_fts (doc_id, project_id, name, description, content) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        document["id"],
+                        document.get("project_id") or GLOBAL_SCOPE,
+                        document.get("name", ""),
+                        document.get("description", ""),
+                        text or "",
+                    )
+                )
+        PERSIST_SECONDS.observe(time.perf_counter() - start, store="sqlite", operation="index_documents")
+
+    def remove_document(self, document_id: str):
+        """Drop a document from the index"""
+        if not self.available:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents_fts WHERE doc_id = ?", (document_id,))
+
+    def move_document(self, document_id: str, project_id: Optional[str]):
+        """Re-scope a document to another project without re-indexing its text"""
+        if not self.available:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE documents_fts SET project_id = ? WHERE doc_id = ?",
+                (project_id or GLOBAL_SCOPE, document_id)
+            )
+
+    def indexed_ids(self) -> set:
+        """Return the IDs of every indexed document"""
+        if not self.available:
+            return set()
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT doc_id FROM documents_fts")}
+
+    def sync(self, documents: Iterable[Dict], read_text: Callable[[Dict], Optional[str]]):
+        """
+        Bring the index in line with the document metadata.
+        Only documents missing from the index have their text read.
+        """
+        if not self.available:
+            return
+        documents = list(documents)
+        indexed = self.indexed_ids()
+        known = {d["id"] for d in documents}
+
+        for stale_id in indexed - known:
+            self.remove_document(stale_id)
+
+        missing = ((doc, read_text(doc)) for doc in documents if doc["id"] not in indexed)
+        self.add_documents(((doc, text) for doc, text in missing if text is not None), replace=False)
+
+    def search(self, query: str, project_id: Optional[str] = None, limit: int = 50,
+               highlight: tuple = ("**", "**"), snippet_tokens: int = 16) -> List[Dict]:
+        """
+        Ranked full-text search
+
+        Args:
+            query: Free text as typed by the user
+            project_id: Project scope (None means global documents, "*" means all)
+            limit: Maximum number of hits
+            highlight: Opening and closing markers wrapped around matched terms
+            snippet_tokens: Approximate snippet length in tokens
+
+        Returns:
+            List of {"doc_id", "score", "snippet"} dicts, best match first
+        """
+        if not self.available:
+            return []
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        sql = (
+            "SELECT doc_id, bm25(documents_fts, 0.0, 0.0, 10.0, 5.0, 1.0) AS score, "
+            "snippet(documents_fts, 4, ?, ?, '…', ?) "
+            "FROM documents_fts WHERE documents_fts MATCH ?"
+        )
+        params = [highlight[0], highlight[1], snippet_tokens, match]
+        if project_id != "*":
+            sql += " AND project_id = ?"
+            params.append(project_id or GLOBAL_SCOPE)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching documents: {e}")
+            return []
+
+        # bm25() is lower-is-better; flip the sign so callers can sort descending
+        return [{"doc_id": r[0], "score": -r[1], "snippet": r[2]} for r in rows]
+
+
+class ExecutionSearchIndex(_FullTextIndex):
+    """
+    Full-text index over generated execution outputs.
+    Each per-marker answer and the rendered template content is stored as its
+    own row, so queries can be narrowed to a single marker. Maintained by
+    ExecutionManager on record and delete.
+    """
+
+    CONTENT_MARKER = "__CONTENT__"  # Marker value used for the rendered template
+
+    SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS executions_fts USING fts5(
+            execution_id UNINDEXED,
+            project_id UNINDEXED,
+            workflow_name UNINDEXED,
+            executed_at UNINDEXED,
+            marker UNINDEXED,
+            content,
+            tokenize = 'porter unicode61'
+        )
+    """
+
+    def add_execution(self, execution: Dict):
+        """Index every marker answer and the rendered content of a newly recorded execution"""
+        # Nothing to replace, and the delete would scan the whole table (execution_id is not indexed)
+        self.add_executions([execution], replace=False)
+
+    def _rows(self, execution: Dict) -> List[tuple]:
+        base = (
+            execution["id"],
+            execution.get("project_id") or GLOBAL_SCOPE,
+            execution.get("workflow_name", ""),
+            execution.get("executed_at", ""),
+        )
+        rows = [base + (marker, str(value)) for marker, value in (execution.get("results") or {}).items()]
+        if execution.get("template_content"):
+            rows.append(base + (self.CONTENT_MARKER, execution["template_content"]))
+        return rows
+
+    def add_executions(self, executions: Iterable[Dict], replace: bool = True):
+        """
+        Index (or re-index) many executions in one transaction; replace=False
+        skips the per-execution delete for executions not indexed yet
+        """
+        if not self.available:
+            return
+        start = time.perf_counter()
+        with self._connect() as conn:
+            for execution in executions:
+                if replace:
+                    conn.execute("DELETE FROM executions_fts WHERE execution_id = ?", (execution["id"],))
+                conn.executemany(
+                    "INSERT INTO executions_fts "
+                    "(execution_id, project_id, workflow_name, executed_at, marker, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    self._rows(execution)
+                )
+        PERSIST_SECONDS.observe(time.perf_counter() - start, store="sqlite", operation="index_executions")
+
+    def remove_execution(self, execution_id: str):
+        """Drop an execution from the index"""
+        if not self.available:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM executions_fts WHERE execution_id = ?", (execution_id,))
+
+    def indexed_ids(self) -> set:
+        """Return the IDs of every indexed execution"""
+        if not self.available:
+            return set()
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT DISTINCT execution_id FROM executions_fts")}
+
+    def sync(self, executions: Iterable[Dict]):
+        """Bring the index in line with the execution history"""
+        if not self.available:
+            return
+        executions = list(executions)
+        indexed = self.indexed_ids()
+        known = {e["id"] for e in executions}
+
+        for stale_id in indexed - known:
+            self.remove_execution(stale_id)
+
+        self.add_executions((e for e in executions if e["id"] not in indexed), replace=False)
+
+    def search(self, query: str, project_id: Optional[str] = None, workflow_name: Optional[str] = None,
+               marker: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+               limit: int = 50, highlight: tuple = ("**", "**"), snippet_tokens: int = 16) -> List[Dict]:
+        """
+        Ranked full-text search over execution outputs
+
+        Args:
+            query: Free text as typed by the user
+            project_id: Restrict to one project ("*" or None searches every project)
+            workflow_name: Restrict to one workflow
+            marker: Restrict to one marker, e.g. "BREAK_OUTPUT"
+            date_from: Inclusive ISO date or datetime lower bound on executed_at
+            date_to: Inclusive ISO date or datetime upper bound on executed_at
+            limit: Maximum number of executions returned
+
+        Returns:
+            List of {"execution_id", "score", "matches": [{"marker", "snippet"}]}
+            dicts, best match first
+        """
+        if not self.available:
+            return []
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        sql = (
+            "SELECT execution_id, marker, bm25(executions_fts) AS score, "
+            "snippet(executions_fts, 5, ?, ?, '…', ?) "
+            "FROM executions_fts WHERE executions_fts MATCH ?"
+        )
+        params = [highlight[0], highlight[1], snippet_tokens, match]
+        if project_id and project_id != "*":
+            sql += " AND project_id = ?"
+            params.append(project_id)
+        if workflow_name:
+            sql += " AND workflow_name = ?"
+            params.append(workflow_name)
+        if marker:
+            sql += " AND marker = ?"
+            params.append(marker)
+        if date_from:
+            sql += " AND executed_at >= ?"
+            params.append(date_from)
+        if date_to:
+            # A bare date should include the whole day
+            sql += " AND executed_at <= ?"
+            params.append(date_to + "T23:59:59.999999" if len(date_to) == 10 else date_to)
+        sql += " ORDER BY score"
+
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching executions: {e}")
+            return []
+
+        # Group marker hits under their execution, keeping best-first order
+        grouped = {}
+        for execution_id, row_marker, score, snippet in rows:
+            entry = grouped.get(execution_id)
+            if entry is None:
+                if len(grouped) >= limit:
+                    continue
+                entry = grouped[execution_id] = {"execution_id": execution_id, "score": -score, "matches": []}
+            entry["matches"].append({"marker": row_marker, "snippet": snippet})
+
+        return list(grouped.values())
@@ -1,9 +1,24 @@
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Tuple
 import io
+import random
+import threading
+import time
 from document_processor import DocumentProcessor
+from search_index import DocumentSearchIndex
+from document_structure import build_structure, save_structure, load_structure, find_range
+from document_text import text_cache, read_text_range, DocumentTextHandle
+from text_normaliser import TextNormaliser
+from token_counter import tokenizer_name, count_tokens
+from metrics import PERSIST_SECONDS
+from file_lock import file_lock, write_json_atomic
+
+# Guards read-modify-write cycles on the metadata file when documents are
+# stored from worker threads (hot-folder ingest, batch jobs); file_lock() does
+# the same for other processes (the ingest service, the API server)
+_metadata_lock = threading.RLock()
 
 class SourceDocumentManager:
     """
@@ -12,13 +27,18 @@ class SourceDocumentManager:
     Now supports project-based document organization.
     """
 
-    def __init__(self, source_dir="source_documents", metadata_file="source_documents.json"):
+    def __init__(self, source_dir="source_documents", metadata_file="source_documents.json",
+                 index_file="search_index.db"):
         self.source_dir = source_dir
         self.metadata_file = metadata_file
         self.doc_processor = DocumentProcessor()
+        self.normaliser = TextNormaliser()
+        self.search_index = DocumentSearchIndex(index_file)
         self._ensure_directories()
         self._ensure_metadata_file()
         self._migrate_existing_documents()
+        self._backfill_token_counts()
+        self._sync_search_index()
 
     def _ensure_directories(self):
         """Create necessary directories if they don't exist"""
@@ -35,20 +55,59 @@ class SourceDocumentManager:
     def _migrate_existing_documents(self):
         """Migrate existing documents to include project_id field"""
         try:
-            with open(self.metadata_file, 'r') as f:
-                data = json.load(f)
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
+
+                modified = False
+                for doc in data.get("documents", []):
+                    if "project_id" not in doc:
+                        doc["project_id"] = None  # None means global/legacy document
+                        modified = True
+
+                if modified:
+                    write_json_atomic(self.metadata_file, data)
+        except Exception as e:
+            print(f"Error migrating documents: {e}")
 
-            modified = False
-            for doc in data.get("documents", []):
-                if "project_id" not in doc:
-                    doc["project_id"] = None  # None means global/legacy document
+    def _backfill_token_counts(self):
+        """Count tokens for documents uploaded before token counts were stored"""
+        try:
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
+
+                tokenizer = tokenizer_name()
+                modified = False
+                for doc in data.get("documents", []):
+                    if doc.get("tokenizer") == tokenizer:
+                        continue
+                    text = self._read_text_file(doc)
+                    if text is None:
+                        continue
+                    doc["token_count"] = count_tokens(text)
+                    doc["tokenizer"] = tokenizer
                     modified = True
 
-            if modified:
-                with open(self.metadata_file, 'w') as f:
-                    json.dump(data, f, indent=4)
+                if modified:
+                    write_json_atomic(self.metadata_file, data)
         except Exception as e:
-            print(f"Error migrating documents: {e}")
+            print(f"Error counting document tokens: {e}")
+
+    def _sync_search_index(self):
+        """Index any documents uploaded before the search index existed"""
+        try:
+            self.search_index.sync(self.get_documents("*"), self._read_text_file)
+        except Exception as e:
+            print(f"Error syncing search index: {e}")
+
+    def _read_text_file(self, document: Dict) -> Optional[str]:
+        """Read a document's extracted text straight from its metadata entry"""
+        try:
+            with open(document["text_path"], 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return None
 
     def _get_project_directory(self, project_id: Optional[str]) -> str:
         """Get the directory path for a project's documents"""
@@ -59,6 +118,83 @@ class SourceDocumentManager:
         else:
             return os.path.join(self.source_dir, "global")
 
+    def _new_document_id(self) -> str:
+        """Generate unique ID with microseconds and a random suffix"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{timestamp}_{int(time.time() * 1000000) % 1000000}_{random.randint(1000, 9999)}"
+
+    def _store_document(self, write_original: Callable[[str], None], extracted_text: Optional[str], name: str,
+                        description: str, project_id: Optional[str], original_filename: str,
+                        file_size: int, file_type: str, unique_id: Optional[str] = None,
+                        extract: Optional[Callable[[str], str]] = None) -> Tuple[Dict, str]:
+        """
+        Write a document's original file and extracted text to disk. The raw
+        extraction is kept next to the normalised text that prompts use.
+
+        Args:
+            write_original: Callable that writes the original file to the given path
+            extracted_text: The document's text, or None to extract it with extract
+            extract: Callable returning the text of the stored original file,
+                     given its path; the original is removed again if it fails
+
+        Returns:
+            (metadata entry for the document, not yet saved to the metadata file;
+            the normalised text that was stored)
+        """
+        unique_id = unique_id or self._new_document_id()
+        file_extension = os.path.splitext(original_filename)[1]
+        stored_filename = f"{unique_id}_{name.replace(' ', '_')}{file_extension}"
+
+        # Get appropriate directory based on project
+        project_dir = self._get_project_directory(project_id)
+        file_path = os.path.join(project_dir, stored_filename)
+
+        # Save the original file
+        write_original(file_path)
+        if extracted_text is None:
+            try:
+                extracted_text = extract(file_path)
+            except Exception:
+                os.remove(file_path)
+                raise
+
+        # Save the raw extraction, then the normalised text that is indexed and sent to GPT
+        text_filename = f"{unique_id}_{name.replace(' ', '_')}.txt"
+        text_path = os.path.join(project_dir, text_filename)
+        raw_text_path = os.path.splitext(text_path)[0] + ".raw.txt"
+        with open(raw_text_path, 'w', encoding='utf-8') as f:
+            f.write(extracted_text)
+
+        normalised = self.normaliser.normalise_with_stats(extracted_text)
+        text = normalised["text"]
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        # Save page/paragraph/table/clause offsets alongside the text
+        structure_path = self._structure_path_for(text_path)
+        save_structure(build_structure(text, self._numbering_for(file_path)), structure_path)
+
+        return {
+            "id": unique_id,
+            "project_id": project_id,  # New field
+            "name": name,
+            "description": description,
+            "original_filename": original_filename,
+            "stored_filename": stored_filename,
+            "file_path": file_path,
+            "text_path": text_path,
+            "raw_text_path": raw_text_path,
+            "structure_path": structure_path,
+            "uploaded_at": datetime.now().isoformat(),
+            "file_size": file_size,
+            "file_type": file_type,
+            "text_length": len(text),
+            "token_count": normalised["stats"]["tokens"],
+            "tokenizer": tokenizer_name(),
+            "normalisation": normalised["stats"],
+            "preview": text[:500] + "..." if len(text) > 500 else text
+        }, text
+
     def upload_document(self, uploaded_file, name: str, description: str = "", project_id: Optional[str] = None) -> Dict:
         """
         Upload a new source document and extract its text
@@ -73,58 +209,43 @@ class SourceDocumentManager:
             Dict containing document metadata and extracted text
         """
         try:
-            # Extract text first to ensure document is valid
+            if not uploaded_file.size:
+                raise ValueError("Uploaded file is empty")
             uploaded_file.seek(0)  # Reset file pointer
-            extracted_text = self.doc_processor.extract_text(uploaded_file)
-            uploaded_file.seek(0)  # Reset again for saving
-
-            # Generate unique filename with microseconds and counter for uniqueness
-            import time
-            import random
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = f"{timestamp}_{int(time.time() * 1000000) % 1000000}_{random.randint(1000, 9999)}"
-            file_extension = os.path.splitext(uploaded_file.name)[1]
-            stored_filename = f"{unique_id}_{name.replace(' ', '_')}{file_extension}"
-
-            # Get appropriate directory based on project
-            project_dir = self._get_project_directory(project_id)
-            file_path = os.path.join(project_dir, stored_filename)
-
-            # Save the original file
-            with open(file_path, 'wb') as f:
-                f.write(uploaded_file.getbuffer())
-
-            # Save extracted text
-            text_filename = f"{unique_id}_{name.replace(' ', '_')}.txt"
-            text_path = os.path.join(project_dir, text_filename)
-            with open(text_path, 'w', encoding='utf-8') as f:
-                f.write(extracted_text)
-
-            # Create metadata entry
-            document_metadata = {
-                "id": unique_id,
-                "project_id": project_id,  # New field
-                "name": name,
-                "description": description,
-                "original_filename": uploaded_file.name,
-                "stored_filename": stored_filename,
-                "file_path": file_path,
-                "text_path": text_path,
-                "uploaded_at": datetime.now().isoformat(),
-                "file_size": uploaded_file.size,
-                "file_type": uploaded_file.type,
-                "text_length": len(extracted_text),
-                "preview": extracted_text[:500] + "..." if len(extracted_text) > 500 else extracted_text
-            }
+
+            def write_original(path):
+                with open(path, 'wb') as f:
+                    f.write(uploaded_file.getbuffer())
+
+            # Text is extracted from the stored original, so PDFs are parsed from
+            # disk page by page; an invalid document is removed again
+            document_metadata, stored_text = self._store_document(
+                write_original,
+                None,
+                name,
+                description,
+                project_id,
+                original_filename=uploaded_file.name,
+                file_size=uploaded_file.size,
+                file_type=uploaded_file.type,
+                extract=lambda path: self.doc_processor.extract_text_from_file(path, uploaded_file.name)
+            )
 
             # Update metadata file
-            with open(self.metadata_file, 'r') as f:
-                data = json.load(f)
+            start = time.perf_counter()
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
 
-            data["documents"].append(document_metadata)
+                data["documents"].append(document_metadata)
 
-            with open(self.metadata_file, 'w') as f:
-                json.dump(data, f, indent=4)
+                write_json_atomic(self.metadata_file, data)
+            PERSIST_SECONDS.observe(time.perf_counter() - start, store="json", operation="add_document")
+
+            try:
+                self.search_index.add_document(document_metadata, stored_text)
+            except Exception as e:
+                print(f"Error indexing document: {e}")
 
             return document_metadata
 
@@ -132,6 +253,70 @@ class SourceDocumentManager:
             print(f"Error uploading document: {e}")
             raise
 
+    def add_documents(self, entries: List[Dict], project_id: Optional[str] = None) -> List[Dict]:
+        """
+        Store a batch of already-extracted documents in one metadata write
+
+        Args:
+            entries: Dicts with "name", "extracted_text", "original_filename",
+                     "file_size", "file_type", "write_original" and optional "description"
+            project_id: Project to add every document to
+
+        Returns:
+            List of metadata entries for the stored documents
+        """
+        stored = []
+        stored_texts = []
+        used_ids = set()
+        try:
+            for entry in entries:
+                unique_id = self._new_document_id()
+                while unique_id in used_ids:
+                    unique_id = self._new_document_id()
+                used_ids.add(unique_id)
+
+                document_metadata, stored_text = self._store_document(
+                    entry["write_original"],
+                    entry["extracted_text"],
+                    entry["name"],
+                    entry.get("description", ""),
+                    project_id,
+                    original_filename=entry["original_filename"],
+                    file_size=entry["file_size"],
+                    file_type=entry["file_type"],
+                    unique_id=unique_id
+                )
+                stored.append(document_metadata)
+                stored_texts.append(stored_text)
+
+            start = time.perf_counter()
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
+
+                data["documents"].extend(stored)
+
+                write_json_atomic(self.metadata_file, data)
+            PERSIST_SECONDS.observe(time.perf_counter() - start, store="json", operation="add_documents")
+
+        except Exception as e:
+            # Don't leave files behind that the metadata doesn't know about
+            for doc in stored:
+                for path_key in ["file_path", "text_path", "raw_text_path", "structure_path"]:
+                    if os.path.exists(doc[path_key]):
+                        os.remove(doc[path_key])
+            print(f"Error adding documents: {e}")
+            raise
+
+        try:
+            self.search_index.add_documents(
+                zip(stored, stored_texts)
+            )
+        except Exception as e:
+            print(f"Error indexing documents: {e}")
+
+        return stored
+
     def get_documents(self, project_id: Optional[str] = None) -> List[Dict]:
         """
         Get all available source documents, optionally filtered by project
@@ -175,49 +360,144 @@ class SourceDocumentManager:
 
         return doc
 
-    def get_document_text(self, document_id: str, project_id: Optional[str] = None) -> Optional[str]:
-        """Get the extracted text of a document"""
+    def get_document_text(self, document_id: str, project_id: Optional[str] = None,
+                          cache_info: Optional[Dict] = None) -> Optional[str]:
+        """
+        Get the extracted text of a document (served from the shared text cache)
+
+        Args:
+            cache_info: When given, its "hit" key is set to whether the text was cached
+        """
         document = self.get_document(document_id, project_id)
         if not document:
             return None
 
         try:
-            with open(document["text_path"], 'r', encoding='utf-8') as f:
-                return f.read()
+            text, hit = text_cache.lookup(document["text_path"])
+            if cache_info is not None:
+                cache_info["hit"] = hit
+            return text
+        except Exception as e:
+            print(f"Error reading document text: {e}")
+            return None
+
+    def get_document_text_range(self, document_id: str, project_id: Optional[str] = None,
+                                offset: int = 0, length: Optional[int] = None) -> Optional[str]:
+        """
+        Read part of a document's extracted text without loading all of it
+
+        Args:
+            document_id: ID of the document
+            project_id: Optional project ID to verify ownership
+            offset: Byte offset into the text file
+            length: Number of bytes to read (None reads to the end)
+
+        Returns:
+            The decoded text range, or None if the document is not found
+        """
+        document = self.get_document(document_id, project_id)
+        if not document:
+            return None
+
+        try:
+            return read_text_range(document["text_path"], offset, length)
         except Exception as e:
             print(f"Error reading document text: {e}")
             return None
 
+    def get_document_handle(self, document_id: str, project_id: Optional[str] = None) -> Optional[DocumentTextHandle]:
+        """Get a lightweight handle to a document's text, suitable for keeping in session state"""
+        document = self.get_document(document_id, project_id)
+        if not document:
+            return None
+        return DocumentTextHandle(document["id"], document["name"], document["text_path"],
+                                  resolve=lambda doc_id: (self.get_document(doc_id) or {}).get("text_path"))
+
+    @staticmethod
+    def _structure_path_for(text_path: str) -> str:
+        return os.path.splitext(text_path)[0] + ".structure.json"
+
+    def _numbering_for(self, file_path: Optional[str]) -> List[Dict]:
+        """Read Word list numbering from a stored original file, if it has any"""
+        if not file_path or not file_path.lower().endswith(".docx") or not os.path.exists(file_path):
+            return []
+        with open(file_path, 'rb') as f:
+            return self.doc_processor.extract_numbering(file_path, f.read())
+
+    def get_document_structure(self, document_id: str, project_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Get a document's structural index (page, paragraph, table, heading and
+        clause byte offsets into its text file). Documents uploaded before the
+        index existed have it built and saved on first access.
+        """
+        document = self.get_document(document_id, project_id)
+        if not document:
+            return None
+
+        structure_path = document.get("structure_path") or self._structure_path_for(document["text_path"])
+        structure = load_structure(structure_path)
+        if structure is None:
+            text = self._read_text_file(document)
+            if text is None:
+                return None
+            structure = build_structure(text, self._numbering_for(document.get("file_path")))
+            try:
+                save_structure(structure, structure_path)
+            except OSError as e:
+                print(f"Error saving document structure: {e}")
+        return structure
+
+    def get_document_section(self, document_id: str, project_id: Optional[str] = None,
+                             clause: Optional[str] = None, page: Optional[int] = None,
+                             table: Optional[int] = None) -> Optional[str]:
+        """
+        Read one clause (e.g. "3.2"), page or table of a document without
+        loading the rest of its text
+        """
+        structure = self.get_document_structure(document_id, project_id)
+        if not structure:
+            return None
+        byte_range = find_range(structure, clause=clause, page=page, table=table)
+        if not byte_range:
+            return None
+
+        return self.get_document_text_range(document_id, project_id, byte_range[0],
+                                            byte_range[1] - byte_range[0])
+
     def delete_document(self, document_id: str, project_id: Optional[str] = None) -> bool:
         """Delete a document and its files"""
         try:
             # Load metadata
-            with open(self.metadata_file, 'r') as f:
-                data = json.load(f)
-
-            # Find document
-            document = None
-            for d in data["documents"]:
-                if d["id"] == document_id:
-                    # Verify project ownership if specified
-                    if project_id is not None and d.get("project_id") != project_id:
-                        return False  # Can't delete - wrong project
-                    document = d
-                    break
-
-            if not document:
-                return False
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
+
+                # Find document
+                document = None
+                for d in data["documents"]:
+                    if d["id"] == document_id:
+                        # Verify project ownership if specified
+                        if project_id is not None and d.get("project_id") != project_id:
+                            return False  # Can't delete - wrong project
+                        document = d
+                        break
+
+                if not document:
+                    return False
+
+                # Delete files (documents from before structure indexing may have a lazily built one)
+                text_cache.invalidate(document["text_path"])
+                document.setdefault("structure_path", self._structure_path_for(document["text_path"]))
+                for path_key in ["file_path", "text_path", "raw_text_path", "structure_path"]:
+                    if path_key in document and os.path.exists(document[path_key]):
+                        os.remove(document[path_key])
 
-            # Delete files
-            for path_key in ["file_path", "text_path"]:
-                if path_key in document and os.path.exists(document[path_key]):
-                    os.remove(document[path_key])
+                # Remove from metadata
+                data["documents"] = [d for d in data["documents"] if d["id"] != document_id]
 
-            # Remove from metadata
-            data["documents"] = [d for d in data["documents"] if d["id"] != document_id]
+                write_json_atomic(self.metadata_file, data)
 
-            with open(self.metadata_file, 'w') as f:
-                json.dump(data, f, indent=4)
+                self.search_index.remove_document(document_id)
 
             return True
 
@@ -225,8 +505,26 @@ class SourceDocumentManager:
             print(f"Error deleting document: {e}")
             return False
 
-    def search_documents(self, query: str, project_id: Optional[str] = None) -> List[Dict]:
-        """Search documents by name, description, or content preview"""
+    def search_documents(self, query: str, project_id: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """
+        Search documents by name, description and full extracted text
+
+        Results are ranked best-first and each carries a "snippet" with the
+        matched terms highlighted. Falls back to a substring scan of the
+        metadata when the full-text index is unavailable.
+        """
+        if self.search_index.available:
+            hits = self.search_index.search(query, project_id=project_id, limit=limit)
+            if not hits:
+                return []
+            documents = {d["id"]: d for d in self.get_documents(project_id)}
+            results = []
+            for hit in hits:
+                doc = documents.get(hit["doc_id"])
+                if doc:
+                    results.append({**doc, "snippet": hit["snippet"], "score": hit["score"]})
+            return results
+
         query_lower = query.lower()
         documents = self.get_documents(project_id)
 
@@ -256,39 +554,43 @@ class SourceDocumentManager:
         """Move a document from one project to another"""
         try:
             # Load metadata
-            with open(self.metadata_file, 'r') as f:
-                data = json.load(f)
-
-            # Find document
-            document = None
-            for d in data["documents"]:
-                if d["id"] == document_id:
-                    document = d
-                    break
-
-            if not document:
-                return False
-
-            # Get old and new paths
-            old_project_dir = self._get_project_directory(document.get("project_id"))
-            new_project_dir = self._get_project_directory(target_project_id)
-
-            # Move files if directories are different
-            if old_project_dir != new_project_dir:
-                for path_key in ["file_path", "text_path"]:
-                    if path_key in document and os.path.exists(document[path_key]):
-                        old_path = document[path_key]
-                        filename = os.path.basename(old_path)
-                        new_path = os.path.join(new_project_dir, filename)
-                        os.rename(old_path, new_path)
-                        document[path_key] = new_path
-
-            # Update project_id
-            document["project_id"] = target_project_id
-
-            # Save metadata
-            with open(self.metadata_file, 'w') as f:
-                json.dump(data, f, indent=4)
+            with _metadata_lock, file_lock(self.metadata_file):
+                with open(self.metadata_file, 'r') as f:
+                    data = json.load(f)
+
+                # Find document
+                document = None
+                for d in data["documents"]:
+                    if d["id"] == document_id:
+                        document = d
+                        break
+
+                if not document:
+                    return False
+
+                # Get old and new paths
+                old_project_dir = self._get_project_directory(document.get("project_id"))
+                new_project_dir = self._get_project_directory(target_project_id)
+
+                # Move files if directories are different
+                if old_project_dir != new_project_dir:
+                    text_cache.invalidate(document["text_path"])
+                    document.setdefault("structure_path", self._structure_path_for(document["text_path"]))
+                    for path_key in ["file_path", "text_path", "raw_text_path", "structure_path"]:
+                        if path_key in document and os.path.exists(document[path_key]):
+                            old_path = document[path_key]
+                            filename = os.path.basename(old_path)
+                            new_path = os.path.join(new_project_dir, filename)
+                            os.rename(old_path, new_path)
+                            document[path_key] = new_path
+
+                # Update project_id
+                document["project_id"] = target_project_id
+
+                # Save metadata
+                write_json_atomic(self.metadata_file, data)
+
+                self.search_index.move_document(document_id, target_project_id)
 
             return True
 
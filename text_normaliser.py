@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Dict, Optional
+
+from document_structure import PAGE_MARKER, TABLE_MARKER
+from token_counter import count_tokens
+
+NORMALISATION_STEPS = ("whitespace", "headers_footers", "layout_noise")
+# Comma-separated steps to run, "all" or "none"
+TEXT_NORMALISATION = os.environ.get("TEXT_NORMALISATION", "all")
+
+# A line made only of rule characters, e.g. "------------" or "____ . ____"
+RULE_LINE = re.compile(r"^[\s\-_=.*·•~]{3,}$")
+# Dot leaders / fill-in blanks inside a line, e.g. "Schedule 1 ........ 12"
+LEADER_RUN = re.compile(r"([._\-])\1{3,}")
+SPACE_RUN = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+
+
+class TextNormaliser:
+    """
+    Removes layout noise from extracted text before it is stored and sent to
+    GPT: runs of tabs and spaces, blank-line padding, rule lines, dot leaders
+    and page headers/footers repeated across PDF pages. Page and table markers
+    are kept so the structure index still finds them.
+    """
+
+    def __init__(self, steps: Optional[List[str]] = None, min_repeat_pages: int = 3,
+                 edge_lines: int = 2, repeat_ratio: float = 0.5):
+        """
+        Args:
+            steps: Steps to run (see NORMALISATION_STEPS); defaults to TEXT_NORMALISATION
+            min_repeat_pages: Pages a header/footer line must appear on to be stripped
+            edge_lines: Lines at the top and bottom of each page checked for headers/footers
+            repeat_ratio: Fraction of pages a line must appear on to count as repeated
+        """
+        if steps is None:
+            setting = TEXT_NORMALISATION.strip().lower()
+            if setting == "all":
+                steps = list(NORMALISATION_STEPS)
+            elif setting in ("", "none", "off"):
+                steps = []
+            else:
+                steps = [s.strip() for s in setting.split(",") if s.strip()]
+        unknown = [s for s in steps if s not in NORMALISATION_STEPS]
+        if unknown:
+            raise ValueError(
+                f"Unknown normalisation step: {', '.join(unknown)}. "
+                f"Choose from: {', '.join(NORMALISATION_STEPS)}"
+            )
+        self.steps = steps
+        self.min_repeat_pages = min_repeat_pages
+        self.edge_lines = edge_lines
+        self.repeat_ratio = repeat_ratio
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.steps)
+
+    @staticmethod
+    def _is_marker(line: str) -> bool:
+        stripped = line.strip()
+        return bool(PAGE_MARKER.match(stripped) or TABLE_MARKER.match(stripped))
+
+    @staticmethod
+    def _edge_key(line: str) -> str:
+        """Compare header/footer lines ignoring page numbers and spacing"""
+        return re.sub(r"\d+", "#", SPACE_RUN.sub(" ", line.strip().lower()))
+
+    def _split_pages(self, lines: List[str]) -> List[List[int]]:
+        """Group line indexes by page, using the "--- Page N ---" markers"""
+        pages = []
+        for index, line in enumerate(lines):
+            if PAGE_MARKER.match(line.strip()):
+                pages.append([])
+            elif pages:
+                pages[-1].append(index)
+        return pages
+
+    def _edge_indexes(self, lines: List[str], page: List[int]) -> List[int]:
+        content = [i for i in page if lines[i].strip()]
+        return content[:self.edge_lines] + content[-self.edge_lines:]
+
+    def _strip_headers_footers(self, lines: List[str]) -> List[str]:
+        pages = self._split_pages(lines)
+        if len(pages) < self.min_repeat_pages:
+            return lines
+
+        counts = Counter()
+        for page in pages:
+            counts.update({self._edge_key(lines[i]) for i in self._edge_indexes(lines, page)})
+        threshold = max(self.min_repeat_pages, math.ceil(len(pages) * self.repeat_ratio))
+        repeated = {key for key, count in counts.items() if count >= threshold and key}
+        if not repeated:
+            return lines
+
+        drop = set()
+        for page in pages:
+            drop.update(i for i in self._edge_indexes(lines, page) if self._edge_key(lines[i]) in repeated)
+        return [line for i, line in enumerate(lines) if i not in drop]
+
+    def normalise(self, text: str) -> str:
+        """Return the normalised text"""
+        if not self.steps:
+            return text
+
+        lines = text.split("\n")
+
+        if "headers_footers" in self.steps:
+            lines = self._strip_headers_footers(lines)
+
+        if "layout_noise" in self.steps:
+            lines = ["" if RULE_LINE.match(line) and not self._is_marker(line) else LEADER_RUN.sub(r"\1\1\1", line)
+                     for line in lines]
+
+        if "whitespace" in self.steps:
+            collapsed = []
+            for line in lines:
+                line = SPACE_RUN.sub(" ", line).strip()
+                # Keep at most one blank line between blocks
+                if line or (collapsed and collapsed[-1]):
+                    collapsed.append(line)
+            lines = collapsed
+            while lines and not lines[-1]:
+                lines.pop()
+
+        return "\n".join(lines)
+
+    def normalise_with_stats(self, text: str) -> Dict:
+        """
+        Normalise text and report how much it shrank
+
+        Returns:
+            Dict with "text" and "stats" (raw/normalised characters and
+            tokens, and the token reduction in percent)
+        """
+        normalised = self.normalise(text)
+        raw_tokens = count_tokens(text)
+        tokens = count_tokens(normalised)
+        return {
+            "text": normalised,
+            "stats": {
+                "steps": list(self.steps),
+                "raw_chars": len(text),
+                "chars": len(normalised),
+                "raw_tokens": raw_tokens,
+                "tokens": tokens,
+                "token_reduction_pct": round(100 * (raw_tokens - tokens) / raw_tokens, 1) if raw_tokens else 0.0
+            }
+        }
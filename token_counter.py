@@ -0,0 +1,91 @@
+import math
+from typing import Dict
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_MODEL = "gpt-4o"
+# Encoding used when tiktoken does not know a model name (e.g. an Azure deployment)
+DEFAULT_ENCODING = "o200k_base"
+
+# Context window sizes in tokens
+MODEL_CONTEXT = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+}
+
+# USD per million tokens (input, output)
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+}
+
+# Tokens the chat format adds per message and per reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+_encodings: Dict[str, object] = {}
+
+
+def _encoding_for(model: str):
+    """The model's tiktoken encoding, or None without tiktoken or when it cannot be loaded"""
+    if model not in _encodings:
+        encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception as e:
+                # tiktoken downloads encodings on first use, which fails offline
+                print(f"Error loading the tokenizer for {model}, estimating token counts: {e}")
+        _encodings[model] = encoding
+    return _encodings[model]
+
+
+def tokenizer_name(model: str = DEFAULT_MODEL) -> str:
+    """Name of the tokenizer count_tokens uses for a model ("estimate" without one)"""
+    encoding = _encoding_for(model)
+    return encoding.name if encoding is not None else "estimate"
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Count the tokens of a text with the model's tokenizer
+
+    Falls back to an estimate of four characters per token when tiktoken is
+    not installed or its encoding cannot be loaded.
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(document_tokens: int, prompt: str, system_prompt: str = "",
+                         model: str = DEFAULT_MODEL) -> int:
+    """Input tokens of a GPTHandler.process_document call for an already counted document"""
+    return (document_tokens
+            + count_tokens(f"{prompt}\n\nDocument:\n", model)
+            + count_tokens(system_prompt, model)
+            + 2 * MESSAGE_OVERHEAD + REPLY_OVERHEAD)
+
+
+def context_window(model: str) -> int:
+    return MODEL_CONTEXT.get(model, MODEL_CONTEXT[DEFAULT_MODEL])
+
+
+def token_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Cost in USD of a number of input and output tokens"""
+    input_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING[DEFAULT_MODEL])
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
@@ -0,0 +1,474 @@
+"""
+Batch pairs as tasks in a shared SQLite queue, run by worker processes that
+may live on other machines (put the queue and the data files on shared
+storage and start `python promptflow.py worker` on each node).
+
+Workers lease a task for LEASE_SECONDS and keep extending the lease while
+they work on it. A worker that dies stops heartbeating, and its tasks go
+back to the queue once their leases expire (up to MAX_ATTEMPTS leases per
+task). Delivery is at least once: a worker stalled past its lease may
+finish a pair that another worker is also running.
+"""
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterator, Set, Tuple
+from batch_estimator import BATCH_CONCURRENCY
+from llm_scheduler import BATCH
+from metrics import BATCH_PAIRS, TASK_QUEUE_DEPTH, WORKER_TASKS
+
+# Queue database shared by the submitting process and the workers; batches
+# only go to workers when this is set
+TASK_QUEUE_PATH = os.environ.get("PROMPTFLOW_TASK_QUEUE", "")
+# Seconds a lease lasts without a heartbeat; workers renew it every third of that
+LEASE_SECONDS = float(os.environ.get("PROMPTFLOW_TASK_LEASE_SECONDS", "60"))
+# Leases a task gets before it is failed (a worker dying mid-task uses one up)
+MAX_ATTEMPTS = int(os.environ.get("PROMPTFLOW_TASK_MAX_ATTEMPTS", "3"))
+# Seconds between queue polls of idle workers and of follow()
+POLL_SECONDS = 1.0
+# Documents a worker remembers having read, to prefer their remaining tasks
+AFFINITY_DOCUMENTS = 64
+
+
+class TaskQueue:
+    """
+    SQLite queue of (document, workflow) tasks, grouped into batches.
+
+    Every state change is a short IMMEDIATE transaction, so any number of
+    processes can share the file; rollback journaling is kept because WAL
+    does not work on network file systems.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT NOT NULL,
+            project_id TEXT,
+            document_id TEXT NOT NULL,
+            document_name TEXT,
+            workflow_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            lease_expires REAL,
+            execution_id TEXT,
+            error TEXT,
+            enqueued_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, position);
+        CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch_id);
+        CREATE TABLE IF NOT EXISTS workers (
+            id TEXT PRIMARY KEY,
+            host TEXT,
+            pid INTEGER,
+            started_at REAL,
+            last_seen REAL
+        );
+    """
+
+    def __init__(self, db_path: str = TASK_QUEUE_PATH or "task_queue.db", lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with contextlib.closing(self._connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Autocommit connection; the caller closes it"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, work):
+        """Run work(conn) in an IMMEDIATE transaction and return its result"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def _reclaim(self, conn: sqlite3.Connection, now: float) -> int:
+        """Requeue tasks whose worker stopped heartbeating; fail those out of attempts"""
+        conn.execute(
+            "UPDATE tasks SET status = 'failed', error = 'Worker stopped responding', finished_at = ?, "
+            "worker_id = NULL WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts))
+        return conn.execute(
+            "UPDATE tasks SET status = 'queued', worker_id = NULL, lease_expires = NULL "
+            "WHERE status = 'leased' AND lease_expires < ?", (now,)).rowcount
+
+    @staticmethod
+    def new_batch_id() -> str:
+        return f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    def enqueue(self, batch_id: str, project_id: Optional[str], items: List[Dict]) -> int:
+        """
+        Add a planned batch (the "items" of BatchScheduler.plan, in order)
+
+        Returns:
+            Number of tasks added
+        """
+        now = time.time()
+
+        def work(conn):
+            start = conn.execute("SELECT COALESCE(MAX(position), 0) FROM tasks").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO tasks (batch_id, project_id, document_id, document_name, workflow_name, position, "
+                "enqueued_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(batch_id, project_id, item["document"]['id'], item["document"]['name'],
+                  item["workflow"]['name'], start + index + 1, now) for index, item in enumerate(items)])
+            return len(items)
+
+        return self._transaction(work)
+
+    def lease(self, worker_id: str, prefer_documents: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Take the next queued task, reclaiming expired leases first
+
+        Args:
+            prefer_documents: Document IDs this worker has already read; their
+                              tasks are taken first so the text is read once
+
+        Returns:
+            The task as a dict, or None if nothing is queued
+        """
+        now = time.time()
+        preferred = list(prefer_documents or [])[-AFFINITY_DOCUMENTS:]
+
+        def work(conn):
+            self._reclaim(conn, now)
+            row = None
+            if preferred:
+                row = conn.execute(
+                    f"SELECT * FROM tasks WHERE status = 'queued' AND document_id IN "
+                    f"({','.join('?' * len(preferred))}) ORDER BY position LIMIT 1", preferred).fetchone()
+            if row is None:
+                row = conn.execute("SELECT * FROM tasks WHERE status = 'queued' ORDER BY position LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET status = 'leased', worker_id = ?, lease_expires = ?, "
+                         "attempts = attempts + 1 WHERE id = ?", (worker_id, now + self.lease_seconds, row['id']))
+            return {**dict(row), "status": "leased", "worker_id": worker_id, "attempts": row['attempts'] + 1}
+
+        return self._transaction(work)
+
+    def heartbeat(self, worker_id: str, task_ids: List[int]) -> Set[int]:
+        """
+        Extend the leases of a worker's tasks and record that it is alive
+
+        Returns:
+            The IDs of the tasks the worker still holds
+        """
+        now = time.time()
+
+        def work(conn):
+            conn.execute("UPDATE workers SET last_seen = ? WHERE id = ?", (now, worker_id))
+            held = set()
+            for task_id in task_ids:
+                if conn.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker_id = ? "
+                                "AND status = 'leased'", (now + self.lease_seconds, task_id, worker_id)).rowcount:
+                    held.add(task_id)
+            return held
+
+        return self._transaction(work)
+
+    def complete(self, task_id: int, worker_id: str, execution_id: str) -> bool:
+        """Mark a task done; False if the worker had lost its lease"""
+        return self._finish(task_id, worker_id, "completed", execution_id=execution_id)
+
+    def fail(self, task_id: int, worker_id: str, error: str) -> bool:
+        """Mark a task failed (workflow errors are not retried); False if the worker had lost its lease"""
+        return self._finish(task_id, worker_id, "failed", error=error)
+
+    def _finish(self, task_id: int, worker_id: str, status: str, execution_id: Optional[str] = None,
+                error: Optional[str] = None) -> bool:
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE tasks SET status = ?, execution_id = ?, error = ?, finished_at = ?, lease_expires = NULL "
+            "WHERE id = ? AND worker_id = ? AND status = 'leased'",
+            (status, execution_id, error, time.time(), task_id, worker_id)).rowcount > 0)
+
+    def cancel(self, batch_id: str) -> int:
+        """Drop a batch's tasks that have not started; returns how many"""
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM tasks WHERE batch_id = ? AND status = 'queued'", (batch_id,)).rowcount)
+
+    def register_worker(self, worker_id: str):
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO workers (id, host, pid, started_at, last_seen) VALUES (?, ?, ?, ?, ?)",
+            (worker_id, socket.gethostname(), os.getpid(), now, now)))
+
+    def unregister_worker(self, worker_id: str):
+        self._transaction(lambda conn: conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,)))
+
+    def workers(self) -> List[Dict]:
+        """Registered workers, with "alive" False once they miss a lease period of heartbeats"""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM workers ORDER BY started_at").fetchall()
+        return [{**dict(row), "alive": now - row['last_seen'] < self.lease_seconds} for row in rows]
+
+    def depth(self) -> int:
+        """Tasks waiting to be leased, across all batches"""
+        with contextlib.closing(self._connect()) as conn:
+            depth = conn.execute("SELECT COUNT(*) FROM tasks WHERE status = 'queued'").fetchone()[0]
+        TASK_QUEUE_DEPTH.set(depth)
+        return depth
+
+    def unfinished(self) -> int:
+        """Tasks queued or leased, across all batches"""
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def batch_tasks(self, batch_id: str) -> List[Dict]:
+        with contextlib.closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM tasks WHERE batch_id = ? ORDER BY position", (batch_id,))]
+
+    def batch_status(self, batch_id: str) -> Dict[str, int]:
+        """Task counts of a batch by status"""
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM tasks WHERE batch_id = ? GROUP BY status",
+                                (batch_id,)).fetchall()
+        return {status: count for status, count in rows}
+
+    def _drop_queued(self, batch_id: str) -> List[Dict]:
+        """Cancel a batch's tasks that have not started, returning them"""
+        def work(conn):
+            self._reclaim(conn, time.time())
+            rows = [dict(row) for row in conn.execute(
+                "SELECT * FROM tasks WHERE batch_id = ? AND status = 'queued' ORDER BY position", (batch_id,))]
+            conn.execute("DELETE FROM tasks WHERE batch_id = ? AND status = 'queued'", (batch_id,))
+            return rows
+
+        return self._transaction(work)
+
+    def follow(self, batch_id: str, skipped: Optional[List[Dict]] = None,
+               poll_seconds: float = POLL_SECONDS, orphan_seconds: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Wait for a batch to finish, yielding BatchScheduler.run's events
+        ("planned", "skipped", "completed", "failed" and "done") as workers
+        report back, so callers can treat both the same way
+
+        Args:
+            orphan_seconds: Once no worker has been alive for this long
+                (default a lease period), the batch's remaining tasks are
+                cancelled and reported as skipped instead of waited for
+        """
+        orphan_seconds = self.lease_seconds if orphan_seconds is None else orphan_seconds
+        start = time.monotonic()
+        skipped = list(skipped or [])
+        tasks = self.batch_tasks(batch_id)
+        total = len(tasks)
+        yield {"event": "planned", "total": total}
+        for entry in skipped:
+            yield {"event": "skipped", **entry}
+
+        reported = set()
+        results = 0
+        errors = []
+        orphaned_since = None
+        while True:
+            self.depth()
+            self._transaction(lambda conn: self._reclaim(conn, time.time()))
+            tasks = self.batch_tasks(batch_id)
+            for task in tasks:
+                if task['id'] in reported or task['status'] not in ("completed", "failed"):
+                    continue
+                reported.add(task['id'])
+                names = {"document": task['document_name'], "workflow": task['workflow_name']}
+                if task['status'] == "completed":
+                    results += 1
+                    yield {"event": "completed", **names, "execution_id": task['execution_id'],
+                           "completed": len(reported), "total": total}
+                else:
+                    errors.append(f"{names['workflow']} on {names['document']}: {task['error']}")
+                    yield {"event": "failed", **names, "error": task['error'],
+                           "completed": len(reported), "total": total}
+            # Cancelled tasks are deleted, so a batch ends when nothing is left unfinished
+            if all(task['status'] in ("completed", "failed") for task in tasks):
+                break
+
+            if any(w['alive'] for w in self.workers()):
+                orphaned_since = None
+            elif orphaned_since is None:
+                orphaned_since = time.monotonic()
+            elif time.monotonic() - orphaned_since >= orphan_seconds:
+                for task in self._drop_queued(batch_id):
+                    entry = {"document": task['document_name'], "workflow": task['workflow_name'],
+                             "reason": "No worker was connected to the task queue to run it"}
+                    skipped.append(entry)
+                    BATCH_PAIRS.inc(outcome="skipped")
+                    yield {"event": "skipped", **entry}
+                orphaned_since = None
+                continue
+            time.sleep(poll_seconds)
+
+        yield {"event": "done", "results": results, "errors": errors, "skipped": skipped,
+               "elapsed_seconds": time.monotonic() - start}
+
+
+def submit_batch(queue: TaskQueue, scheduler, project_id: Optional[str], documents: List[Dict],
+                 workflows: List[Dict], policy: str = "fifo", priorities: Optional[Dict[str, int]] = None,
+                 exclude: Optional[Set[Tuple[str, str]]] = None) -> Tuple[str, List[Dict]]:
+    """
+    Plan a batch with a BatchScheduler and queue its pairs for the workers
+
+    Returns:
+        (batch ID, pairs and workflows skipped while planning) - pass both
+        to queue.follow() to watch the batch
+    """
+    plan = scheduler.plan(project_id, documents, workflows, policy, priorities, exclude)
+    batch_id = queue.new_batch_id()
+    queue.enqueue(batch_id, project_id, plan["items"])
+    BATCH_PAIRS.inc(len(plan["skipped"]), outcome="skipped")
+    return batch_id, plan["skipped"]
+
+
+class BatchWorker:
+    """
+    Runs queued tasks with concurrency threads until stopped, heartbeating
+    the leases of the tasks in flight and recording each result through
+    the ExecutionManager, like a local batch would.
+    """
+
+    def __init__(self, queue: TaskQueue, workflow_manager, template_manager, source_manager, gpt_handler,
+                 prompt_manager, execution_manager, concurrency: int = BATCH_CONCURRENCY,
+                 worker_id: Optional[str] = None):
+        self.queue = queue
+        self.workflow_manager = workflow_manager
+        self.template_manager = template_manager
+        self.source_manager = source_manager
+        self.gpt_handler = gpt_handler
+        self.prompt_manager = prompt_manager
+        self.execution_manager = execution_manager
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Documents read recently; their text is in this process's text cache
+        self._documents = deque(maxlen=AFFINITY_DOCUMENTS)
+        self._running = {}  # task ID -> task
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self.stats = {"completed": 0, "failed": 0, "lost": 0}
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self):
+        """Thread: renew the leases of running tasks until the last one has finished"""
+        while not self._finished.wait(self.queue.lease_seconds / 3):
+            with self._lock:
+                task_ids = list(self._running)
+            try:
+                self.queue.heartbeat(self.worker_id, task_ids)
+            except sqlite3.Error as e:
+                print(f"Error renewing task leases: {e}")
+
+    def _process(self, task: Dict) -> str:
+        """Run one task and report it; returns its outcome"""
+        try:
+            result = self.workflow_manager.process_workflow_with_template(
+                task['workflow_name'],
+                task['document_id'],
+                self.template_manager,
+                self.source_manager,
+                self.gpt_handler,
+                self.prompt_manager,
+                project_id=task['project_id'],
+                priority=BATCH,
+                # Tasks already run side by side; keep each task's prompts sequential
+                prompt_concurrency=1
+            )
+            self._documents.append(task['document_id'])
+            if "error" in result:
+                return "failed" if self.queue.fail(task['id'], self.worker_id, result['error']) else "lost"
+
+            execution_id = self.execution_manager.record_execution(
+                project_id=task['project_id'],
+                workflow_name=task['workflow_name'],
+                document_id=task['document_id'],
+                results=result['results'],
+                template_content=result['content'],
+                result_details=result.get('result_details'),
+                timings=result.get('timings')
+            )
+            if not execution_id:
+                return "failed" if self.queue.fail(task['id'], self.worker_id,
+                                                   "Could not record the execution") else "lost"
+            return "completed" if self.queue.complete(task['id'], self.worker_id, execution_id) else "lost"
+        except Exception as e:
+            return "failed" if self.queue.fail(task['id'], self.worker_id, str(e)) else "lost"
+        finally:
+            with self._lock:
+                self._running.pop(task['id'], None)
+                WORKER_TASKS.set(len(self._running))
+
+    def _done(self, future):
+        outcome = future.result()
+        # A lost lease means the task was requeued; whoever finishes it counts it
+        if outcome != "lost":
+            BATCH_PAIRS.inc(outcome=outcome)
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def run(self, exit_when_idle: bool = False):
+        """
+        Lease and run tasks until stop() is called
+
+        Args:
+            exit_when_idle: Return once no task is queued or leased by any worker
+        """
+        self.queue.register_worker(self.worker_id)
+        self._finished.clear()
+        heartbeat = threading.Thread(target=self._heartbeat, name="task-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="worker") as executor:
+                while not self._stop.is_set():
+                    with self._lock:
+                        free = self.concurrency - len(self._running)
+                    task = None
+                    if free > 0:
+                        try:
+                            task = self.queue.lease(self.worker_id, list(self._documents))
+                        except sqlite3.Error as e:
+                            print(f"Error leasing a task: {e}")
+                    if task:
+                        with self._lock:
+                            self._running[task['id']] = task
+                            WORKER_TASKS.set(len(self._running))
+                        executor.submit(self._process, task).add_done_callback(self._done)
+                        continue
+                    with self._lock:
+                        idle = not self._running
+                    self.queue.depth()
+                    # Wait out other workers' leases too, in case one dies and its tasks come back
+                    if exit_when_idle and idle and self.queue.unfinished() == 0:
+                        break
+                    self._stop.wait(POLL_SECONDS)
+                # Leaving the pool waits for running tasks, still heartbeating
+        finally:
+            self._stop.set()
+            self._finished.set()
+            heartbeat.join()
+            self.queue.unregister_worker(self.worker_id)
@@ -1,8 +1,16 @@
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
 import copy
+from batch_profiler import phase
+from llm_scheduler import INTERACTIVE
+from token_counter import token_cost
+
+# Prompts of one workflow run sent to GPT at the same time (they do not depend on each other)
+PROMPT_CONCURRENCY = int(os.environ.get("PROMPTFLOW_PROMPT_CONCURRENCY", "4"))
 
 class WorkflowManager:
     def __init__(self, filename="workflows.json", project_filename="project_workflows.json"):
@@ -340,62 +348,143 @@ class WorkflowManager:
 
     def process_workflow_with_template(self, workflow_name: str, source_document_id: str, 
                                      template_manager, source_manager, gpt_handler, prompt_manager,
-                                     project_id: Optional[str] = None) -> Dict:
+                                     project_id: Optional[str] = None, priority: str = INTERACTIVE,
+                                     on_update: Optional[Callable[[str, str], None]] = None,
+                                     prompt_concurrency: Optional[int] = None, phases=None) -> Dict:
         """
         Process a workflow using a source document and populate a template
 
+        Args:
+            priority: LLM scheduling class for the GPT calls, "interactive" or "batch"
+            on_update: When given, answers are streamed and this is called with
+                (marker, answer so far) as tokens arrive - from worker threads
+                if prompt_concurrency is above 1
+            prompt_concurrency: Prompts run at the same time (defaults to
+                PROMPTFLOW_PROMPT_CONCURRENCY)
+            phases: Optional PhaseTimer of a profiled batch, timing the extract,
+                llm and render steps
+
         Returns:
-            Dict containing the populated template content and metadata
+            Dict containing the populated template content and metadata:
+            "result_details" has each marker's model, latency, tokens, cost,
+            retries and cache hits; "timings" has the seconds spent reading the
+            document text, running prompts, loading the template and rendering
         """
+        started = time.perf_counter()
         workflow = self.get_workflow(workflow_name, project_id=project_id)
         if not workflow:
             return {"error": "Workflow not found"}
 
         # Get source document text (verify it belongs to the project if project_id is specified)
-        source_text = source_manager.get_document_text(source_document_id, project_id)
+        text_cache_info = {}
+        with phase(phases, "extract"):
+            extract_start = time.perf_counter()
+            source_text = source_manager.get_document_text(source_document_id, project_id,
+                                                           cache_info=text_cache_info)
+            extract_seconds = time.perf_counter() - extract_start
         if not source_text:
             return {"error": "Source document not found or access denied"}
 
-        # Process all prompts
-        results = {}
-        for prompt_data in workflow['prompts']:
+        system_prompt = prompt_manager.get_system_prompt()
+
+        def run_prompt(prompt_data):
+            # Store with the marker format expected in templates
+            marker_name = f"{prompt_data['name'].upper().replace(' ', '_')}_OUTPUT"
             try:
-                result = gpt_handler.process_document(
-                    source_text,
-                    prompt_data['prompt'],
-                    prompt_manager.get_system_prompt()
-                )
-                # Store with the marker format expected in templates
-                marker_name = f"{prompt_data['name'].upper().replace(' ', '_')}_OUTPUT"
-                results[marker_name] = result
+                on_token = (lambda text: on_update(marker_name, text)) if on_update else None
+                with phase(phases, "llm"):
+                    result = gpt_handler.process_prompt(
+                        source_text,
+                        prompt_data,
+                        system_prompt,
+                        priority=priority,
+                        on_token=on_token
+                    )
+                if on_update:
+                    on_update(marker_name, result["content"])
+                return marker_name, result["content"], self._prompt_details(result)
             except Exception as e:
-                results[f"{prompt_data['name']}_OUTPUT"] = f"Error: {str(e)}"
-
-        # Get template content
-        template_content = None
-        if workflow.get('template_id'):
-            template_content = template_manager.read_template_content(workflow['template_id'])
-        elif workflow.get('template'):
-            # Fallback to inline template
-            template_content = workflow['template']
-
-        if not template_content:
-            return {"error": "No template associated with workflow"}
+                return f"{prompt_data['name']}_OUTPUT", f"Error: {str(e)}", None
+
+        # Process all prompts, keeping results in prompt order
+        llm_start = time.perf_counter()
+        workers = max(1, min(prompt_concurrency or PROMPT_CONCURRENCY, len(workflow['prompts']) or 1))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prompt") as executor:
+                outcomes = list(executor.map(run_prompt, workflow['prompts']))
+        else:
+            outcomes = [run_prompt(prompt_data) for prompt_data in workflow['prompts']]
+        llm_seconds = time.perf_counter() - llm_start
 
-        # Replace markers in template
-        populated_content = template_content
-        for marker, value in results.items():
-            populated_content = populated_content.replace(f"{{{marker}}}", value)
+        results = {}
+        result_details = {}
+        for marker_name, content, details in outcomes:
+            results[marker_name] = content
+            if details is not None:
+                result_details[marker_name] = details
+
+        with phase(phases, "render"):
+            # Get template content
+            load_start = time.perf_counter()
+            template_content = None
+            if workflow.get('template_id'):
+                template_content = template_manager.read_template_content(workflow['template_id'])
+            elif workflow.get('template'):
+                # Fallback to inline template
+                template_content = workflow['template']
+
+            template_load_seconds = time.perf_counter() - load_start
+
+            if not template_content:
+                return {"error": "No template associated with workflow"}
+
+            # Replace markers in template
+            render_start = time.perf_counter()
+            populated_content = template_content
+            for marker, value in results.items():
+                populated_content = populated_content.replace(f"{{{marker}}}", value)
+            render_seconds = time.perf_counter() - render_start
 
         return {
             "content": populated_content,
             "format": workflow.get('output_format', 'markdown'),
             "results": results,
+            "result_details": result_details,
+            "timings": {
+                "extract_seconds": extract_seconds,
+                "text_cache_hit": text_cache_info.get("hit"),
+                "llm_seconds": llm_seconds,
+                "template_load_seconds": template_load_seconds,
+                "render_seconds": render_seconds,
+                "total_seconds": time.perf_counter() - started
+            },
             "template_id": workflow.get('template_id'),
             "source_document_id": source_document_id,
             "project_id": project_id
         }
 
+    @staticmethod
+    def _prompt_details(result: Dict) -> Dict:
+        """What an execution record keeps about one prompt's GPT call(s)"""
+        usage = result.get("usage") or {}
+        attempts = [result] + ([result["first_attempt"]] if result.get("first_attempt") else [])
+        return {
+            "model": result.get("model"),
+            "escalated_from": result.get("escalated_from"),
+            "latency_seconds": result.get("latency_seconds"),
+            "time_to_first_token": result.get("time_to_first_token"),
+            "input_tokens": result.get("input_tokens"),
+            "output_tokens": result.get("output_tokens"),
+            # Includes an escalated prompt's discarded first answer
+            "cost": sum(token_cost(a["model"], a.get("input_tokens") or 0, a.get("output_tokens") or 0)
+                        for a in attempts if a.get("model")),
+            "retries": sum(a.get("retries") or 0 for a in attempts),
+            "cache_hits": {
+                "prompt_cache": bool(usage.get("cached_tokens")),
+                "cassette": result.get("endpoint") == "cassette"
+            }
+        }
+
     def _save_data(self, data: Dict):
         """Legacy method for compatibility"""
         # This method is referenced in old code, so we keep it for compatibility